@@ -0,0 +1,144 @@
+import os
+import random
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import count
+from multiprocessing import Pool
+from typing import Iterator, Optional
+
+from backend.models.campaign_manager import CampaignResult
+from backend.models.simulation import run_headless_campaign
+from backend.utils.utilities import GameState
+
+"""
+Shards headless campaigns across a process pool and folds the results
+into a balance report as they stream back, so we never hold every
+game's raw data in memory
+"""
+
+
+@dataclass
+class ClassStats:
+    games: int = 0
+    wins: int = 0
+    rounds: int = 0
+    damage_dealt: int = 0
+
+
+@dataclass
+class LevelStats:
+    attempts: int = 0
+    wins: int = 0
+    rounds: int = 0
+
+
+class BalanceReport:
+    """
+    running totals for a batch of campaigns - add results one at a time
+    """
+
+    def __init__(self):
+        self.num_games = 0
+        self.games_by_num_players: defaultdict[int, int] = defaultdict(int)
+        self.wins_by_num_players: defaultdict[int, int] = defaultdict(int)
+        # player classes track campaign outcomes, every class tracks damage
+        self.class_stats: defaultdict[str, ClassStats] = defaultdict(ClassStats)
+        self.level_stats: defaultdict[int, LevelStats] = defaultdict(LevelStats)
+        self.level_damage: defaultdict[int, defaultdict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+
+    def add(self, result: CampaignResult) -> None:
+        self.num_games += 1
+        self.games_by_num_players[result.num_players] += 1
+        self.wins_by_num_players[result.num_players] += result.won
+        total_rounds = sum(level.rounds for level in result.level_results)
+
+        for player_class in set(result.player_classes):
+            stats = self.class_stats[player_class]
+            stats.games += 1
+            stats.wins += result.won
+            stats.rounds += total_rounds
+
+        for level in result.level_results:
+            stats = self.level_stats[level.level_num]
+            stats.attempts += 1
+            stats.wins += level.game_state == GameState.WIN
+            stats.rounds += level.rounds
+            for char_class, damage in level.damage_dealt.items():
+                self.class_stats[char_class].damage_dealt += damage
+                self.level_damage[level.level_num][char_class] += damage
+
+    def to_text(self) -> str:
+        lines = [f"Games simulated: {self.num_games}", "", "Win rate by num players:"]
+        for num_players in sorted(self.games_by_num_players):
+            games = self.games_by_num_players[num_players]
+            wins = self.wins_by_num_players[num_players]
+            lines.append(f"  {num_players}: {wins / games:.1%} ({wins}/{games})")
+
+        lines += ["", "Player classes (win rate, rounds/game, damage/game):"]
+        for char_class, stats in sorted(self.class_stats.items()):
+            if not stats.games:
+                continue
+            lines.append(
+                f"  {char_class}: {stats.wins / stats.games:.1%}, "
+                f"{stats.rounds / stats.games:.1f}, "
+                f"{stats.damage_dealt / stats.games:.1f}"
+            )
+
+        lines += ["", "Total damage dealt by class:"]
+        for char_class, stats in sorted(
+            self.class_stats.items(), key=lambda item: -item[1].damage_dealt
+        ):
+            lines.append(f"  {char_class}: {stats.damage_dealt}")
+
+        lines += ["", "Levels (attempts, win rate, rounds/attempt):"]
+        for level_num, stats in sorted(self.level_stats.items()):
+            lines.append(
+                f"  Level {level_num}: {stats.attempts}, "
+                f"{stats.wins / stats.attempts:.1%}, "
+                f"{stats.rounds / stats.attempts:.1f}"
+            )
+            damage = ", ".join(
+                f"{char_class} {total / stats.attempts:.1f}"
+                for char_class, total in sorted(
+                    self.level_damage[level_num].items(), key=lambda item: -item[1]
+                )
+            )
+            lines.append(f"    damage/attempt: {damage}")
+        return "\n".join(lines) + "\n"
+
+
+def _simulate_game(seed: int) -> CampaignResult:
+    # each game gets its own id generator and a player count drawn from its seed
+    num_players = random.Random(seed).choice([1, 2, 3])
+    return run_headless_campaign(num_players, seed=seed, id_generator=count(start=1))
+
+
+def stream_results(
+    num_games: int,
+    base_seed: int = 0,
+    num_workers: Optional[int] = None,
+    chunksize: int = 16,
+) -> Iterator[CampaignResult]:
+    """
+    yields campaign results in whatever order the workers finish them
+    num_workers defaults to every core on the box
+    """
+    seeds = range(base_seed, base_seed + num_games)
+    with Pool(processes=num_workers or os.cpu_count()) as pool:
+        yield from pool.imap_unordered(_simulate_game, seeds, chunksize=chunksize)
+
+
+def run_batch(
+    num_games: int,
+    base_seed: int = 0,
+    num_workers: Optional[int] = None,
+    progress_every: int = 0,
+) -> BalanceReport:
+    report = BalanceReport()
+    for result in stream_results(num_games, base_seed, num_workers):
+        report.add(result)
+        if progress_every and report.num_games % progress_every == 0:
+            print(f"Finished game {report.num_games}/{num_games}")
+    return report
@@ -1,5 +1,6 @@
 import random
 from backend.utils import attack_shapes as shapes
+from backend.utils.utilities import set_board_location
 import backend.models.obstacle as obstacle
 from typing import Type
 
@@ -10,6 +11,8 @@ class BoardInitializer:
         self.size = size
         self.id_generator = id_generator
         self.characters = characters
+        # reverse index of locations: entity -> (row, col) for everything on the board
+        self.entity_locations: dict = {}
         self.locations = self._initialize_locations(size, size)
         self.terrain = self._initialize_terrain(size, size)
 
@@ -24,17 +27,24 @@ class BoardInitializer:
         ]
         for element in self.starting_elements:
             self.add_starting_effect_to_terrain(element, 1000)
-        return self.locations, self.terrain
+        return self.locations, self.terrain, self.entity_locations
 
     # initializes a game map which is a list of ListWithUpdate
     def _initialize_locations(self, width: int = 5, height=5) -> list:
-        return [
+        locations = [
             [
                 obstacle.Wall(round_num=0, obj_id=next(self.id_generator))
                 for _ in range(width)
             ]
             for _ in range(height)
         ]
+        for row_num, row in enumerate(locations):
+            for col_num, wall in enumerate(row):
+                self.entity_locations[wall] = (row_num, col_num)
+        return locations
+
+    def _set_location(self, row: int, col: int, entity) -> None:
+        set_board_location(self.locations, self.entity_locations, row, col, entity)
 
     def _initialize_terrain(self, width: int = 5, height=5) -> list:
         return [[None for _ in range(width)] for _ in range(height)]
@@ -84,7 +94,7 @@ class BoardInitializer:
         for x in range(start_x, min(start_x + width, self.size)):
             for y in range(start_y, min(start_y + height, self.size)):
                 # Carving walkable room (None represents open space)
-                self.locations[x][y] = None
+                self._set_location(x, y, None)
 
     def carve_hallway(self, start_x: int, start_y: int, end_x: int, end_y: int) -> None:
         # Horizontal movement first, then vertical
@@ -93,13 +103,13 @@ class BoardInitializer:
         while x != end_x:
             if 0 <= x < self.size:
                 # Carving walkable hallway (None represents open space)
-                self.locations[x][y] = None
+                self._set_location(x, y, None)
             x += 1 if end_x > x else -1
 
         while y != end_y:
             if 0 <= y < self.size:
                 # Carving walkable hallway (None represents open space)
-                self.locations[x][y] = None
+                self._set_location(x, y, None)
             y += 1 if end_y > y else -1
 
     def reshape_board(self, num_rooms: int = 4) -> None:
@@ -135,7 +145,7 @@ class BoardInitializer:
     def set_character_starting_locations(self) -> None:
         for x in self.characters:
             row, col = self.pick_unoccupied_starting_location(is_monster=x.team_monster)
-            self.locations[row][col] = x
+            self._set_location(row, col, x)
 
     def pick_unoccupied_starting_location(
         self, is_monster: bool = True
@@ -152,17 +162,21 @@ class BoardInitializer:
         # space the player and monster starts
         monster_min_x = board_edge - 3
 
-        while True:
-            if is_monster:
-                rand_location = (
-                    random.randint(monster_min_x, board_edge),
-                    random.randint(0, board_edge),
-                )
-
-            else:
-                rand_location = (
-                    random.randint(min_x, player_max_x),
-                    random.randint(0, board_edge),
-                )
-            if not self.locations[rand_location[0]][rand_location[1]]:
-                return rand_location
+        if is_monster:
+            start_row, end_row = monster_min_x, board_edge
+        else:
+            start_row, end_row = min_x, player_max_x
+        # pick from the free squares in our starting rows - if they're all walls
+        # or taken, fall back to any free square so we never loop forever
+        free_locations = [
+            (row, col)
+            for row in range(start_row, end_row + 1)
+            for col in range(self.size)
+            if not self.locations[row][col]
+        ] or [
+            (row, col)
+            for row in range(self.size)
+            for col in range(self.size)
+            if not self.locations[row][col]
+        ]
+        return random.choice(free_locations)
@@ -655,12 +655,9 @@ def select_in_range_target(board, attacker, att_range, opponent=True):
 def check_if_legal_pull(
     puller_location, board, pull_target_old_location, new_pull_target_location
 ):
-    orig_dist = len(
-        board.get_shortest_valid_path(pull_target_old_location, puller_location)
-    )
-    new_dist = len(
-        board.get_shortest_valid_path(new_pull_target_location, puller_location)
-    )
+    # path lengths are symmetric, so measure from the puller to share one distance field
+    orig_dist = board.get_path_length(puller_location, pull_target_old_location)
+    new_dist = board.get_path_length(puller_location, new_pull_target_location)
 
     if orig_dist > new_dist:
         return True
@@ -671,12 +668,9 @@ def check_if_legal_pull(
 def check_if_legal_push(
     puller_location, board, pull_target_old_location, new_pull_target_location
 ):
-    orig_dist = len(
-        board.get_shortest_valid_path(pull_target_old_location, puller_location)
-    )
-    new_dist = len(
-        board.get_shortest_valid_path(new_pull_target_location, puller_location)
-    )
+    # path lengths are symmetric, so measure from the puller to share one distance field
+    orig_dist = board.get_path_length(puller_location, pull_target_old_location)
+    new_dist = board.get_path_length(puller_location, new_pull_target_location)
 
     if orig_dist < new_dist:
         return True
@@ -145,9 +145,7 @@ class Ai(Agent):
         attacker_location = board.find_location_of_target(char)
         for opponent in in_range_opponents:
             opponent_location = board.find_location_of_target(opponent)
-            opponent_dist = len(
-                board.get_shortest_valid_path(attacker_location, opponent_location)
-            )
+            opponent_dist = board.get_path_length(attacker_location, opponent_location)
             if opponent_dist < shortest_dist:
                 nearest_opponent = opponent
                 shortest_dist = opponent_dist
@@ -388,8 +386,12 @@ class Human(Agent):
                     board.deal_terrain_damage_current_location(char)
                 return
 
+            # if they're walking, follow the path we previewed for them
+            # jumps don't have previews, so we find the shortest path
+            preview_path = reachable_paths.get((new_row, new_col))
             path_len = len(
-                board.get_shortest_valid_path(
+                preview_path
+                or board.get_shortest_valid_path(
                     start=current_loc,
                     end=(new_row, new_col),
                     is_jump=is_jump,
@@ -408,7 +410,11 @@ class Human(Agent):
             if legal_move and additional_movement_check_result and path_len <= movement:
                 # do this instead of update location because it deals with terrain
                 squares_moved = board.move_character_toward_location(
-                    char, (new_row, new_col), remaining_movement, is_jump
+                    char,
+                    (new_row, new_col),
+                    remaining_movement,
+                    is_jump,
+                    path_to_target=preview_path,
                 )
                 remaining_movement -= squares_moved
                 prompt = orig_prompt
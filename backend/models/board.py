@@ -1,5 +1,5 @@
 from backend.models.character import Character
-from collections import deque
+from collections import defaultdict
 import heapq
 from itertools import count
 import random
@@ -11,7 +11,12 @@ from ..utils.listwithupdate import ListWithUpdate
 from backend.controllers.board_initializer import BoardInitializer
 import backend.models.pyxel_backend as pyxel_backend
 import backend.models.obstacle as obstacle
-from backend.utils.utilities import DieAndEndTurn, directions, color_map
+from backend.utils.utilities import (
+    DieAndEndTurn,
+    directions,
+    color_map,
+    set_board_location,
+)
 
 """
 This class is overloaded:
@@ -55,13 +60,25 @@ class Board:
         # self.characters: list[character.Character] = players + monsters
         # self.characters=players+monsters
 
-        self.locations, self.terrain = BoardInitializer(
+        # entity_locations is the reverse of locations (entity -> (row, col)) so we
+        # can find things without scanning the board. only change locations
+        # through set_location so the two stay in sync
+        self.locations, self.terrain, self.entity_locations = BoardInitializer(
             starting_elements, self.size, id_generator, self.characters
         ).set_up_board()
+        # bumped on every change to locations - distance fields are only valid
+        # for the version they were built from
+        self.locations_version = 0
+        self.distance_fields: dict[
+            tuple[tuple[int, int], bool], dict[tuple[int, int], int]
+        ] = {}
+        self.distance_fields_version = 0
 
         pyxel_manager.load_board(self.locations, self.terrain)
         # pyxel_manager.load_characters(self.characters)
         self.acting_character = None
+        # damage dealt by attacks, keyed by attacker class name - used for balance stats
+        self.damage_dealt: defaultdict[str, int] = defaultdict(int)
 
     def add_effect_to_terrain_for_attack(
         self,
@@ -138,7 +155,7 @@ class Board:
                         obs = obstacle_type(
                             self.round_num, obj_id=next(self.id_generator)
                         )
-                        self.locations[obstacle_row][obstacle_col] = obs
+                        self.set_location(obstacle_row, obstacle_col, obs)
                         self.pyxel_manager.add_entity(
                             obs,
                             obstacle_row,
@@ -211,60 +228,63 @@ class Board:
 
         """
         reachable_positions = set()
-        queue = deque([(start, 0)])
-        visited = {start}
-
-        # BFS to find all reachable positions
-        while queue:
-            current_pos, distance = queue.popleft()
-
-            # prevents us from considering starting point
-            if distance > 0:
-                reachable_positions.add(current_pos)
+        # we record each position's predecessor as we go, so one pass gets us both
+        # the reachable positions and the shortest path to each of them
+        previous_cell: dict[tuple[int, int], Optional[tuple[int, int]]] = {start: None}
+        distances = {start: 0}
+        # among equally short paths, prefer the one with the fewest diagonal moves
+        diagonal_moves = {start: 0}
+
+        def is_valid_step(current_pos, new_pos) -> bool:
+            new_row, new_col = new_pos
+            # only excluding walls and it's in bounds and not a wall
+            if exclude_walls_only:
+                return (
+                    0 <= new_row < self.size
+                    and 0 <= new_col < self.size
+                    and not isinstance(self.locations[new_row][new_col], obstacle.Wall)
+                )
+            # it's a legal move and, if there's a movement check, you pass it
+            return self.is_legal_move(new_row, new_col) and (
+                additional_movement_check is None
+                or additional_movement_check(current_pos, new_pos)
+            )
 
-            if distance < num_moves:
-                valid_surrounding_positions = [
-                    (new_row, new_col)
-                    for d_row, d_col in directions
-                    if (
-                        new_row := current_pos[0] + d_row,
-                        new_col := current_pos[1] + d_col,
-                    )
-                    not in visited
-                    and (
-                        # only excluding walls and it's in bounds and not a wall
-                        (
-                            exclude_walls_only
-                            and new_row < self.size
-                            and new_col < self.size
-                            and not isinstance(
-                                self.locations[new_row][new_col], obstacle.Wall
-                            )
-                        )
-                        # there's no movement check and it's a legal move
-                        or (
-                            self.is_legal_move(new_row, new_col)
-                            and additional_movement_check is None
-                        )
-                        # movement check exists, you pass the movement check, and it's a legal move
-                        or (
-                            self.is_legal_move(new_row, new_col)
-                            and additional_movement_check(
-                                current_pos, (new_row, new_col)
-                            )
-                        )
+        # BFS one distance at a time, so every position at distance - 1 has been
+        # expanded before we settle the paths for positions at distance
+        frontier = [start]
+        for distance in range(1, num_moves + 1):
+            next_frontier = []
+            for current_pos in frontier:
+                for d_row, d_col in directions:
+                    new_pos = (current_pos[0] + d_row, current_pos[1] + d_col)
+                    new_diagonal_moves = diagonal_moves[current_pos] + (
+                        d_row != 0 and d_col != 0
                     )
-                ]
-                visited.update(valid_surrounding_positions)
-                queue.extend((pos, distance + 1) for pos in valid_surrounding_positions)
-
-        # Iterate over reachable positions and find shortest valid routes
-        reachable_paths = {}
-        for end_pos in reachable_positions:
-            if path := self.get_shortest_valid_path(
-                start=start, end=end_pos, num_moves=num_moves
-            ):
-                reachable_paths[end_pos] = path
+                    if new_pos in distances:
+                        # already found this distance away - switch to this path
+                        # if it uses fewer diagonals
+                        if (
+                            distances[new_pos] == distance
+                            and new_diagonal_moves < diagonal_moves[new_pos]
+                            and is_valid_step(current_pos, new_pos)
+                        ):
+                            previous_cell[new_pos] = current_pos
+                            diagonal_moves[new_pos] = new_diagonal_moves
+                        continue
+                    if not is_valid_step(current_pos, new_pos):
+                        continue
+                    previous_cell[new_pos] = current_pos
+                    distances[new_pos] = distance
+                    diagonal_moves[new_pos] = new_diagonal_moves
+                    reachable_positions.add(new_pos)
+                    next_frontier.append(new_pos)
+            frontier = next_frontier
+
+        reachable_paths = {
+            end_pos: self.generate_path(previous_cell, end_pos)
+            for end_pos in reachable_positions
+        }
 
         return reachable_positions, reachable_paths
 
@@ -412,19 +432,69 @@ class Board:
     ) -> bool:
         attacker_location = self.find_location_of_target(attacker)
         target_location = self.find_location_of_target(target)
-        shortest_path = self.get_shortest_valid_path(
-            attacker_location, target_location, is_jump=jump, is_attack=True
+        dist_to_target = self.get_path_length(
+            attacker_location, target_location, is_attack=True
         )
-        dist_to_target = len(shortest_path)
-        # exclude cases where we can't get to the target (in which case dist will be 0 b/c empty list)
-        return attack_distance >= dist_to_target and shortest_path
+        # exclude cases where we can't get to the target (in which case dist will be 0)
+        return attack_distance >= dist_to_target and dist_to_target > 0
 
     def find_location_of_target(self, target) -> tuple[int, int]:
-        for row_num, row in enumerate(self.locations):
-            for column_num, item_in_locations in enumerate(row):
-                if target == item_in_locations:
-                    return (row_num, column_num)
-        raise ValueError(f"Target {target} not found in locations")
+        try:
+            return self.entity_locations[target]
+        except KeyError:
+            raise ValueError(f"Target {target} not found in locations")
+
+    def set_location(self, row: int, col: int, entity) -> None:
+        """
+        puts entity (or None to clear the square) at row, col
+        and keeps entity_locations in sync
+        """
+        set_board_location(self.locations, self.entity_locations, row, col, entity)
+        self.locations_version += 1
+
+    def get_path_length(
+        self, start: tuple[int, int], end: tuple[int, int], is_attack: bool = False
+    ) -> int:
+        """
+        Same as len(self.get_shortest_valid_path(start, end, is_attack=is_attack)),
+        including 0 if end can't be reached, but looked up in a distance field
+        from start that we cache until locations change.
+        Path lengths are symmetric, so pass whichever end you query most as start
+        """
+        if self.distance_fields_version != self.locations_version:
+            self.distance_fields.clear()
+            self.distance_fields_version = self.locations_version
+        key = (start, is_attack)
+        if key not in self.distance_fields:
+            self.distance_fields[key] = self.build_distance_field(start, is_attack)
+        return self.distance_fields[key].get(end, 0)
+
+    def build_distance_field(
+        self, start: tuple[int, int], is_attack: bool = False
+    ) -> dict[tuple[int, int], int]:
+        """
+        BFS from start giving the shortest path length to every square we can reach.
+        Like get_shortest_valid_path, a path can end on any square but only pass
+        through legal ones (for attacks, anything on the board that isn't a wall)
+        """
+        distances = {start: 0}
+        frontier = [start]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for row, col in frontier:
+                for d_row, d_col in directions:
+                    new_pos = (row + d_row, col + d_col)
+                    if new_pos in distances:
+                        continue
+                    # no bounds check - push/pull checks ask about squares just
+                    # off the board, and get_shortest_valid_path can end there too
+                    distances[new_pos] = distance
+                    if self.is_legal_move(*new_pos, jump_intermediate_move=is_attack):
+                        next_frontier.append(new_pos)
+            frontier = next_frontier
+        return distances
 
     def find_opponents(self, actor: Character) -> list[Character]:
         return [
@@ -458,7 +528,7 @@ class Board:
             modified_attack_strength = 0
             to_log += ", missed due to shadow\n"
         self.pyxel_manager.log.append(to_log)
-        self.deal_damage_to_target(target, modified_attack_strength)
+        self.deal_damage_to_target(target, modified_attack_strength, attacker=attacker)
 
     def is_shadow_interference(self, attacker, target):
         """returns true if the attack misses due to shadow"""
@@ -482,7 +552,7 @@ class Board:
             return
         self.remove_character(target)
         row, col = self.find_location_of_target(target)
-        self.locations[row][col] = None
+        self.set_location(row, col, None)
         self.pyxel_manager.remove_entity(target.id, show_death_animation=True)
         died_by = f" by{damage_str}" if damage_str else ""
         self.pyxel_manager.log.append(
@@ -518,18 +588,24 @@ class Board:
         target_location: tuple[int, int],
         movement: int,
         is_jump=False,
+        path_to_target: Optional[list[tuple[int, int]]] = None,
     ) -> int:
+        """
+        pass path_to_target if you already have one (e.g. from find_all_reachable_paths)
+        so the character follows it, otherwise we find the shortest path
+        """
         if movement == 0:
             return 0
 
         acting_character_loc = self.find_location_of_target(acting_character)
         # get path
-        path_to_target = self.get_shortest_valid_path(
-            start=acting_character_loc,
-            end=target_location,
-            is_jump=is_jump,
-            num_moves=movement,
-        )
+        if path_to_target is None:
+            path_to_target = self.get_shortest_valid_path(
+                start=acting_character_loc,
+                end=target_location,
+                is_jump=is_jump,
+                num_moves=movement,
+            )
         path_traveled = []
         path_length_jump = 0
 
@@ -618,8 +694,8 @@ class Board:
         is_jump: bool = False,
     ) -> None:
         # Add action queue logic here.
-        self.locations[old_location[0]][old_location[1]] = None
-        self.locations[new_location[0]][new_location[1]] = actor
+        self.set_location(*old_location, None)
+        self.set_location(*new_location, actor)
         self.pyxel_manager.move_character(actor, old_location, new_location, is_jump)
 
     def is_legal_move(self, row: int, col: int, jump_intermediate_move=False) -> bool:
@@ -636,11 +712,16 @@ class Board:
             return is_position_within_board and self.locations[row][col] is None
 
     def deal_damage_to_target(
-        self, target: Character, damage: int, damage_str: str = ""
+        self,
+        target: Character,
+        damage: int,
+        damage_str: str = "",
+        attacker: Optional[Character] = None,
     ) -> None:
         """
         Modifies the target health by subtracting damage. For a heal,
-        pass negative damage.
+        pass negative damage. If an attacker is passed, the health lost
+        is credited to their class in damage_dealt
         """
         if damage == 0:
             return
@@ -663,7 +744,12 @@ class Board:
         # add needed spacing if we have a string
         damage_str = " " + damage_str if damage_str else damage_str
         # if this is a heal (damage is -), don't allow them to heal beyond max health
+        old_health = target.health
         target.health = min(target.health - damage, target.max_health)
+        if attacker is not None and damage > 0:
+            self.damage_dealt[type(attacker).__name__] += old_health - max(
+                target.health, 0
+            )
         if target.health <= 0:
             self.pyxel_manager.log.append(
                 f"{target.name} takes <color:{color_map['damage']}>{damage}{damage_str} damage</color>"
@@ -685,7 +771,7 @@ class Board:
     ) -> int:
         attack_modifier_function, modifier_string = attacker.attack_modifier_deck.pop()
         if len(attacker.attack_modifier_deck) == 0:
-            attacker.make_attack_modifier_deck()
+            attacker.attack_modifier_deck = attacker.make_attack_modifier_deck()
         return attack_modifier_function(initial_attack_strength), modifier_string
 
     def clear_terrain_square(self, row, col):
@@ -723,7 +809,7 @@ class Board:
         )
         self.characters.append(new_char)
         row, col = self.pick_unoccupied_location()
-        self.locations[row][col] = new_char
+        self.set_location(row, col, new_char)
         self.deal_terrain_damage_current_location(new_char)
         self.pyxel_manager.add_entity(new_char, row, col)
         self.pyxel_manager.load_characters(self.characters)
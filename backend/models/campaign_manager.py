@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from itertools import count
 import pickle
+import random
+from typing import Optional
 
 from backend.models.game_loop import GameLoop
 from backend.models.pyxel_backend import PyxelManager
@@ -22,17 +24,50 @@ class CampaignState:
     player_ids: list
 
 
+@dataclass
+class LevelResult:
+    level_num: int
+    game_state: GameState
+    rounds: int
+    # health taken off enemies by attacks, keyed by attacker class name
+    damage_dealt: dict[str, int]
+
+
+@dataclass
+class CampaignResult:
+    seed: Optional[int]
+    num_players: int
+    player_classes: list[str]
+    level_results: list[LevelResult] = field(default_factory=list)
+
+    @property
+    def won(self) -> bool:
+        return len(self.level_results) == len(campaign_levels) and all(
+            level.game_state == GameState.WIN for level in self.level_results
+        )
+
+
 class Campaign:
     """
     a campaign is a series of games, each of which has level metadata
     """
 
     def __init__(
-        self, num_players_default: int, all_ai_mode: bool, server: TCPServer, port: int
+        self,
+        num_players_default: int,
+        all_ai_mode: bool,
+        server: Optional[TCPServer],
+        port: Optional[int],
+        pyxel_manager: Optional[PyxelManager] = None,
     ):
+        """
+        server and port can be None if you pass a pyxel_manager that doesn't
+        need them (e.g. a HeadlessPyxelManager for simulations)
+        server can also be an AsyncTCPServer Room - we only look at its clients
+        """
         self.current_level: Level
         self.server = server
-        self.pyxel_manager = PyxelManager(port)
+        self.pyxel_manager = pyxel_manager or PyxelManager(port)
         self.num_players = num_players_default
         self.all_ai_mode = all_ai_mode
         self.id_generator = count(start=1)
@@ -43,10 +78,13 @@ class Campaign:
         self.player_classes = []
         self.player_ids = []
         self.levels = []
+        self.level_results: list[LevelResult] = []
         self.initialized = False
 
         # see if the user wants to load an existing campaign
-        # and do so if desired
+        # and do so if desired - there's no one to ask without a server
+        if self.server is None:
+            return
         campaign_data = self.pyxel_manager.get_campaign_to_load()
         if campaign_data:
             self.load_campaign(campaign_data)
@@ -117,7 +155,16 @@ class Campaign:
             self.id_generator,
             self.player_chars,
         )
-        return game.start()
+        game_state, message = game.start()
+        self.level_results.append(
+            LevelResult(
+                level_num=campaign_levels.index(level) + 1,
+                game_state=game_state,
+                rounds=game.rounds_played,
+                damage_dealt=dict(game.board.damage_dealt),
+            )
+        )
+        return game_state, message
 
     def run_levels(self):
         for _ in self.levels:
@@ -160,9 +207,9 @@ class Campaign:
             )
 
     def select_player_character(self, player_num):
-        # don't get input for all ai mode
+        # don't get input for all ai mode, just pick a random class
         if self.all_ai_mode:
-            return self.available_chars.pop()
+            return self.available_chars.pop(random.randrange(len(self.available_chars)))
 
         # let other players know what's happening
         player_id = f"frontend_{player_num+1}"
@@ -276,21 +323,9 @@ class Campaign:
 
     def wait_for_all_players_to_join(self):
         self.pyxel_manager.add_to_personal_log("Waiting for all players to join")
-        while True:
-            clients_snapshot = list(self.server.clients.values())
-
-            if (
-                len(
-                    [
-                        1
-                        for client in clients_snapshot
-                        if client.client_type == ClientType.FRONTEND
-                    ]
-                )
-                >= self.num_players
-            ):
-                self.pyxel_manager.pause_for_all_players(
-                    self.num_players,
-                    "All players joined. Hit enter to continue.",
-                )
-                return
+        if not self.server.wait_for_frontends(self.num_players):
+            raise ConnectionError("Server stopped while waiting for players to join")
+        self.pyxel_manager.pause_for_all_players(
+            self.num_players,
+            "All players joined. Hit enter to continue.",
+        )
@@ -36,6 +36,7 @@ class GameLoop:
             level.starting_elements,
         )
         self.game_state = GameState.START
+        self.rounds_played = 0
 
     def start(self) -> GameState:
         self.game_state = GameState.RUNNING
@@ -46,7 +47,10 @@ class GameLoop:
             )
         round_number = 1
         while self.game_state == GameState.RUNNING:
-            self.run_round(round_number)
+            self.rounds_played = round_number
+            # everything between player inputs goes to the server in one go
+            with self.pyxel_manager.batch():
+                self.run_round(round_number)
             print(self.game_state)
             round_number += 1
             self.board.round_num = round_number
@@ -4,26 +4,43 @@ in updates to the different view sections.
 """
 
 import backend.models.character as character
+from contextlib import contextmanager
 from itertools import cycle
+from pyxel_ui.constants import LOG_TAIL_LINES
 from pyxel_ui.models import tasks
 import backend.models.obstacle as obstacle
 from ..utils.listwithupdate import ListWithUpdate
 from server.tcp_client import TCPClient, ClientType
-from server.task_jsonifier import TaskJsonifier
+from server.task_codec import TaskCodec
+from server.client_outbox import SUPERSEDED_BY, COALESCE_BARRIERS
 from backend.utils import attack_shapes as shapes
 
 CHAR_PRIORITY = 20
 OTHER_PRIORITY = 10
+# keeps a single post_tasks frame well under the server's max message size
+MAX_TASKS_PER_FLUSH = 100
 
 
 class PyxelManager:
-    def __init__(self, port):
+    def __init__(self, port, room=None, transport=None):
+        """
+        transport replaces the TCPClient we'd otherwise open to the server,
+        e.g. an InProcessTransport when the server runs in this process
+        """
         self.move_duration = 700
+        # how much of the log the frontend has, so we only send new lines
+        self.log_lines_sent = 0
         self.log = ListWithUpdate([], self.load_log)
         self.floor_color_map = []
         self.wall_color_map = []
-        self.tj = TaskJsonifier()
-        self.server_client = TCPClient(ClientType.BACKEND, port=port)
+        self.codec = TaskCodec()
+        # (task, client_id) pairs waiting for the current batch to end
+        self.task_outbox = []
+        self.batch_depth = 0
+        self.server_client = transport or self.connect_to_server(port, room)
+
+    def connect_to_server(self, port, room=None):
+        return TCPClient(ClientType.BACKEND, port=port, room=room)
 
     def load_board(self, locations, terrain):
         entities = []
@@ -82,8 +99,11 @@ class PyxelManager:
             )
         )
         tasks_to_send.append(tasks.AddEntitiesTask(entities=entities))
-        for task in tasks_to_send:
-            self.jsonify_and_send_task(task)
+        # a new board comes with a new, empty log view
+        self.log_lines_sent = 0
+        with self.batch():
+            for task in tasks_to_send:
+                self.jsonify_and_send_task(task)
 
     def clear_log(self):
         self.log = ListWithUpdate([], self.load_log)
@@ -161,7 +181,21 @@ class PyxelManager:
         self.jsonify_and_send_task(task)
 
     def load_log(self, log):
-        task = tasks.LoadLogTask(log)
+        """
+        If the log grew, only the new lines are sent along with the index they
+        start at. Anything else (clears, removals) sends the end of the log
+        frontends keep. A frontend that's missed lines catches up from the
+        server's snapshot when it joins or is resynced, so there's no need to
+        keep resending the log
+        """
+        if len(log) > self.log_lines_sent:
+            task = tasks.AppendLogTask(
+                start_index=self.log_lines_sent, lines=log[self.log_lines_sent :]
+            )
+        else:
+            tail_start = max(len(log) - LOG_TAIL_LINES, 0)
+            task = tasks.LoadLogTask(list(log[tail_start:]), tail_start)
+        self.log_lines_sent = len(log)
         self.jsonify_and_send_task(task)
 
     def add_to_personal_log(
@@ -192,8 +226,74 @@ class PyxelManager:
         self.wall_color_map = wall_color_map
 
     def jsonify_and_send_task(self, task, client_id="ALL_FRONTEND"):
-        json_task = self.tj.convert_task_to_json(task)
-        self.server_client.post_task(json_task, client_id)
+        if self.batch_depth:
+            self.queue_task(task, client_id)
+            return
+        encoded_task = self.codec.encode_task(task)
+        self.server_client.post_task(encoded_task, client_id)
+
+    def begin_batch(self):
+        """
+        holds tasks until the matching end_batch so they go out in one
+        post_tasks round trip. batches can nest, only the outermost sends
+        """
+        self.batch_depth += 1
+
+    def end_batch(self):
+        self.batch_depth -= 1
+        if not self.batch_depth:
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        self.begin_batch()
+        try:
+            yield
+        finally:
+            self.end_batch()
+
+    def queue_task(self, task, client_id="ALL_FRONTEND"):
+        superseded = SUPERSEDED_BY.get(type(task), ())
+        for i in range(len(self.task_outbox) - 1, -1, -1):
+            queued_task, queued_client_id = self.task_outbox[i]
+            if isinstance(queued_task, COALESCE_BARRIERS):
+                break
+            if queued_client_id != client_id:
+                continue
+            if isinstance(queued_task, superseded):
+                del self.task_outbox[i]
+            elif (
+                isinstance(task, tasks.AppendLogTask)
+                and isinstance(queued_task, tasks.AppendLogTask)
+                and queued_task.start_index + len(queued_task.lines)
+                == task.start_index
+            ):
+                # fold back to back log lines into one task
+                queued_task.lines = queued_task.lines + task.lines
+                return
+        self.task_outbox.append((task, client_id))
+
+    def flush(self):
+        """
+        sends everything in the outbox, in order
+        """
+        while self.task_outbox:
+            to_send = self.task_outbox[:MAX_TASKS_PER_FLUSH]
+            self.task_outbox = self.task_outbox[MAX_TASKS_PER_FLUSH:]
+            self.server_client.post_tasks(
+                [
+                    (self.codec.encode_task(task), client_id)
+                    for task, client_id in to_send
+                ]
+            )
+
+    def receive_user_input(self):
+        """
+        blocks until a player sends input. Anything still batched goes out
+        first so the player can see what they're responding to
+        """
+        self.flush()
+        return self.server_client.get_user_input()
 
     def get_user_input(
         self,
@@ -232,7 +332,7 @@ class PyxelManager:
 
         self.jsonify_and_send_task(task, client_id)
         # get input back
-        user_input = self.server_client.get_user_input()["input"]
+        user_input = self.receive_user_input()["input"]
         if is_mouse:
             user_input = self.process_mouse_input(user_input)
 
@@ -248,7 +348,7 @@ class PyxelManager:
                 single_keystroke=single_keystroke,
             )
             self.jsonify_and_send_task(task, client_id)
-            user_input = self.server_client.get_user_input()["input"]
+            user_input = self.receive_user_input()["input"]
             # process our new input if it's mouse input
             user_input = (
                 self.process_mouse_input(user_input) if is_mouse else user_input
@@ -267,9 +367,9 @@ class PyxelManager:
         )
         if user_input != "y":
             return
-        task = tasks.SaveCampaign(campaign_state)
+        task = tasks.SaveCampaign(campaign_state.__dict__)
         self.jsonify_and_send_task(task)
-        filename = self.server_client.get_user_input()["input"]
+        filename = self.receive_user_input()["input"]
         self.get_user_input(f"Successfully saved {filename}. Hit enter to continue.")
 
     def get_campaign_to_load(self):
@@ -292,7 +392,7 @@ class PyxelManager:
         # if they do, retrieve all the saved campaign data
         task = tasks.LoadCampaign()
         self.jsonify_and_send_task(task, "frontend_1")
-        saved_campaigns = self.server_client.get_user_input()["input"]
+        saved_campaigns = self.receive_user_input()["input"]
         if not saved_campaigns:
             self.get_user_input(
                 "No saved files found. Hit enter to start a new campaign. ",
@@ -366,7 +466,7 @@ class PyxelManager:
         inputs_received = 0
         # wait for input from each player
         for _ in range(num_players):
-            x = self.server_client.get_user_input()["input"]
+            x = self.receive_user_input()["input"]
             inputs_received += 1
 
             if inputs_received < num_players:
@@ -458,3 +558,44 @@ class PyxelManager:
 
     def turn_off_cursor_grid_shape(self, client_id: str):
         self.jsonify_and_send_task(tasks.TurnOffCursorGridShape(), client_id)
+
+
+class HeadlessPyxelManager(PyxelManager):
+    """
+    A null sink for all-ai games with no server or frontend attached.
+    Tasks are dropped before they're built into json, and nothing ever
+    blocks on user input, so games run as fast as the backend can go
+    """
+
+    def __init__(self):
+        super().__init__(port=None)
+        # we never load the board, so there's nothing to offset
+        self.x_offset = 0
+        self.y_offset = 0
+
+    def connect_to_server(self, port, room=None):
+        return None
+
+    def load_board(self, locations, terrain):
+        return
+
+    def move_character(self, char, old_location, new_location, is_jump=False):
+        return
+
+    def add_entity(self, entity, row, col):
+        return
+
+    def load_log(self, log):
+        return
+
+    def load_characters(self, characters: list[character.Character]):
+        return
+
+    def jsonify_and_send_task(self, task, client_id="ALL_FRONTEND"):
+        return
+
+    def get_user_input(self, prompt, *args, **kwargs):
+        raise RuntimeError(f"Headless game asked for user input: {prompt}")
+
+    def pause_for_all_players(self, num_players: int, prompt: str = ""):
+        return
@@ -0,0 +1,62 @@
+import os
+import random
+from contextlib import redirect_stdout
+from itertools import count
+from typing import Optional
+
+from backend.models.campaign_manager import Campaign, CampaignResult
+from backend.models.pyxel_backend import HeadlessPyxelManager
+
+"""
+Runs all-ai campaigns without a server, frontend, or network I/O
+so we can simulate lots of games for balance tuning
+"""
+
+
+class HeadlessCampaign(Campaign):
+    """
+    an all-ai campaign that skips every prompt, plot screen, and save
+    """
+
+    def __init__(self, num_players: int, id_generator: Optional[count] = None):
+        super().__init__(
+            num_players, True, None, None, pyxel_manager=HeadlessPyxelManager()
+        )
+        if id_generator is not None:
+            self.id_generator = id_generator
+
+    def start_campaign(self):
+        self.set_up_player_chars()
+        self.make_levels()
+        self.initialized = True
+        self.run_levels()
+
+    def save_campaign(self):
+        return
+
+
+def run_headless_campaign(
+    num_players: int,
+    seed: Optional[int] = None,
+    id_generator: Optional[count] = None,
+    quiet: bool = True,
+) -> CampaignResult:
+    """
+    Plays a full all-ai campaign and returns per level results.
+    Seeding makes the game reproducible - everything in the backend
+    draws from the module level random.
+    quiet silences the prints the game loop makes every round
+    """
+    random.seed(seed)
+    campaign = HeadlessCampaign(num_players, id_generator)
+    if quiet:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            campaign.start_campaign()
+    else:
+        campaign.start_campaign()
+    return CampaignResult(
+        seed=seed,
+        num_players=num_players,
+        player_classes=campaign.player_classes,
+        level_results=campaign.level_results,
+    )
@@ -46,6 +46,19 @@ def wrap_color_tags(text: str, color: int) -> str:
     return "\n".join(f"<color:{color}>{line}</color>" for line in lines if line)
 
 
+def set_board_location(locations, entity_locations, row: int, col: int, entity):
+    """
+    puts entity (or None to clear the square) at row, col on the board,
+    keeping entity_locations (entity -> (row, col)) in sync
+    """
+    old_entity = locations[row][col]
+    if old_entity is not None:
+        del entity_locations[old_entity]
+    locations[row][col] = entity
+    if entity is not None:
+        entity_locations[entity] = (row, col)
+
+
 class DieAndEndTurn(Exception):
     pass
 
@@ -1,16 +1,22 @@
 import os
 import sys
+import threading
 import traceback
 from backend.models.campaign_manager import Campaign
-from server.tcp_server import TCPServer, ClientType
+from backend.models.pyxel_backend import PyxelManager
+from server.async_server import AsyncTCPServer, Room
+from server.backend_transport import InProcessTransport, RoomTransport
+from server.server_utils import PARKED_READY
+from server.tcp_server import TCPServer
 
 """
 Runs the backend for Drudgeford
 """
 
 
-def main(num_players: int = 1, all_ai_mode=False):
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+def main(num_players: int = 1, all_ai_mode=False, port: int = None):
+    if port is None:
+        port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
     server = None
 
     try:
@@ -22,21 +28,15 @@ def main(num_players: int = 1, all_ai_mode=False):
         server = TCPServer(port=port)
         server.start()
 
-        while True:
-            if (
-                len(
-                    [
-                        1
-                        for client in list(server.clients.values())
-                        if client.client_type == ClientType.FRONTEND
-                    ]
-                )
-                == 1
-            ):
-                print("Player 1 connected! Game running")
-                break
+        if not server.wait_for_frontends(1):
+            return
+        print("Player 1 connected! Game running")
 
-        campaign = Campaign(num_players, all_ai_mode, server, port)
+        # the server's in this process, so skip the socket
+        pyxel_manager = PyxelManager(port, transport=InProcessTransport(server))
+        campaign = Campaign(
+            num_players, all_ai_mode, server, port, pyxel_manager=pyxel_manager
+        )
         campaign.start_campaign()
 
     except KeyboardInterrupt:
@@ -71,5 +71,68 @@ def main(num_players: int = 1, all_ai_mode=False):
         print(f"Game on port {port} shut down complete")
 
 
+def host_rooms(num_players: int = 1, all_ai_mode=False):
+    """
+    Hosts every game on one port. Each room gets its own campaign thread
+    as soon as its first player joins
+    """
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+
+    def start_room(room: Room):
+        print(f"Player 1 joined room {room.room_id}! Game running")
+        threading.Thread(
+            target=run_room,
+            args=(server, room, port, num_players, all_ai_mode),
+            daemon=True,
+        ).start()
+
+    server = AsyncTCPServer(port=port, on_new_room=start_room)
+    try:
+        server.start()
+        print(f"Hosting games at port {port}")
+        server.stopped.wait()
+    except KeyboardInterrupt:
+        print("\nKeyboard interrupt received...")
+    finally:
+        server.stop()
+
+
+def run_room(
+    server: AsyncTCPServer, room: Room, port: int, num_players: int, all_ai_mode
+):
+    try:
+        pyxel_manager = PyxelManager(port, transport=RoomTransport(server, room))
+        campaign = Campaign(
+            num_players, all_ai_mode, room, port, pyxel_manager=pyxel_manager
+        )
+        campaign.start_campaign()
+    except Exception as e:
+        print(f"\nAn error occurred in room {room.room_id}: {str(e)}")
+        traceback.print_exc()
+    finally:
+        print(f"Closing room {room.room_id}")
+        server.close_room(room.room_id)
+
+
+def run_parked():
+    """
+    For the lobby's warm pool: everything's imported by now, so say so and
+    wait for the lobby to hand us a port to run a game on
+    """
+    print(PARKED_READY, flush=True)
+    port = sys.stdin.readline().strip()
+    # the lobby went away without using us
+    if not port:
+        return
+    main(port=int(port))
+
+
 if __name__ == "__main__":
-    main()
+    # backend_main.py <port> --rooms hosts many games on the one port
+    if "--rooms" in sys.argv:
+        host_rooms()
+    # backend_main.py --parked waits for its port on stdin
+    elif "--parked" in sys.argv:
+        run_parked()
+    else:
+        main()
@@ -6,10 +6,11 @@ from pyxel_ui.engine import PyxelEngine
 runs the frontend 
 - if in dev mode, looks for the backend on localhost
 - else, looks for the backend on the server and requires you to specify the port
+- pass --room to join a game on a server that hosts many games on one port
 """
 
 
-def main(dev_mode=False):
+def main(dev_mode=False, room=None):
     host = "13.59.128.25"
 
     if dev_mode:
@@ -28,12 +29,13 @@ def main(dev_mode=False):
         else:
             return
     port = int(port)
-    pyxel_view = PyxelEngine(port, host=host)
+    pyxel_view = PyxelEngine(port, host=host, room=room)
     pyxel_view.start()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--dev", action="store_true", help="Run in development mode")
+    parser.add_argument("--room", help="Game to join on a server hosting many games")
     args = parser.parse_args()
-    main(dev_mode=args.dev)
+    main(dev_mode=args.dev, room=args.room)
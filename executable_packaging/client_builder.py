@@ -28,6 +28,7 @@ def create_build_script():
         "pyxel_ui.views.sprite",
         "server.tcp_client",
         "server.task_jsonifier",
+        "server.task_codec",
         "server.server_utils",
     ]
 
@@ -0,0 +1,211 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional
+
+"""
+Decides who gets to start a game and when. Game ports are handed out from
+the ones the lobby knows are free, and given back when the supervisor sees
+a game end - nothing's probed. Once they're all taken, host requests wait
+in line with a ticket they poll for their place and a rough wait, and are
+let in as games end. How often each IP can host is a token bucket per IP,
+with only so many IPs remembered
+"""
+
+# host requests that can wait in line at once
+MAX_QUEUE_LENGTH = 50
+# a ticket nobody's polled for this long is dropped from the line
+TICKET_TIMEOUT = 60
+# admitted and ended tickets are remembered this long for the last poll
+FINISHED_TICKET_TTL = 10 * 60
+# a guess at how long a game lasts until we've seen some end
+DEFAULT_GAME_SECONDS = 30 * 60
+# how much each game that ends moves the average game length
+GAME_SECONDS_SMOOTHING = 0.2
+# games each IP can host per day, and how many IPs we keep buckets for
+GAMES_PER_DAY = 20
+MAX_TRACKED_IPS = 10000
+
+
+class RateLimiter:
+    """
+    A token bucket per key that refills steadily, so the same limit as
+    counting starts over a window but with two numbers per key. Keys are
+    kept in least recently used order and the oldest dropped past max_keys,
+    which only ever lets someone in early
+    """
+
+    def __init__(
+        self,
+        capacity: float = GAMES_PER_DAY,
+        per_seconds: float = 24 * 60 * 60,
+        max_keys: int = MAX_TRACKED_IPS,
+    ):
+        self.capacity = capacity
+        self.refill_rate = capacity / per_seconds
+        self.max_keys = max_keys
+        # key -> (tokens, when they were counted)
+        self.buckets: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self, key) -> bool:
+        """takes a token for key if there's one to take"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, counted_at = self.buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - counted_at) * self.refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return allowed
+
+
+@dataclass
+class Ticket:
+    ticket_id: str
+    queued_at: float
+    last_polled: float
+    # "queued", "admitted" or "expired"
+    status: str = "queued"
+    port: Optional[int] = None
+    # whatever on_admit returned for it, like the game id
+    admitted_as: Optional[str] = None
+    finished_at: Optional[float] = None
+
+
+class AdmissionQueue:
+    def __init__(self, ports: Iterable[int], on_admit: Callable[[int], str]):
+        """
+        ports are the ones games can run on. on_admit(port) starts a game on
+        port and returns its id - it's called with no locks held
+        """
+        self.ports = list(ports)
+        self.free_ports = deque(self.ports)
+        # port -> when its game started
+        self.running: Dict[int, float] = {}
+        self.on_admit = on_admit
+        self.queue = deque()
+        self.tickets: Dict[str, Ticket] = {}
+        self.average_game_seconds = DEFAULT_GAME_SECONDS
+        self.lock = threading.Lock()
+
+    @property
+    def slots_in_use(self) -> int:
+        return len(self.running)
+
+    def request(self) -> Optional[Ticket]:
+        """a ticket for a game, admitted already if there's room. None if the
+        line's full
+        """
+        now = time.monotonic()
+        with self.lock:
+            self._clean_up(now)
+            if len(self.queue) >= MAX_QUEUE_LENGTH:
+                return None
+            ticket = Ticket(str(uuid.uuid4()), queued_at=now, last_polled=now)
+            self.tickets[ticket.ticket_id] = ticket
+            self.queue.append(ticket)
+        self._admit_waiting()
+        return ticket
+
+    def poll(self, ticket_id: str) -> Optional[Ticket]:
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is not None:
+                ticket.last_polled = time.monotonic()
+            return ticket
+
+    def release(self, port: int):
+        """the game on port ended, so the next in line can have it"""
+        now = time.monotonic()
+        with self.lock:
+            started_at = self.running.pop(port, None)
+            if started_at is None:
+                return
+            self.average_game_seconds += GAME_SECONDS_SMOOTHING * (
+                now - started_at - self.average_game_seconds
+            )
+            self.free_ports.append(port)
+        self._admit_waiting()
+
+    def _next_admission(self) -> Optional[Ticket]:
+        """takes a free port for the first live ticket in line"""
+        now = time.monotonic()
+        with self.lock:
+            while self.queue and self.free_ports:
+                ticket = self.queue.popleft()
+                if now - ticket.last_polled > TICKET_TIMEOUT:
+                    # they gave up waiting
+                    ticket.status = "expired"
+                    ticket.finished_at = now
+                    continue
+                ticket.port = self.free_ports.popleft()
+                self.running[ticket.port] = now
+                return ticket
+        return None
+
+    def _admit_waiting(self):
+        while True:
+            ticket = self._next_admission()
+            if ticket is None:
+                return
+            try:
+                admitted_as = self.on_admit(ticket.port)
+            except Exception as e:
+                print(f"Couldn't start a game on port {ticket.port}: {str(e)}")
+                admitted_as = None
+            with self.lock:
+                ticket.finished_at = time.monotonic()
+                if admitted_as is None:
+                    # a game that died straight away may have been released
+                    # already, and the port mustn't be free twice
+                    if self.running.pop(ticket.port, None) is not None:
+                        self.free_ports.append(ticket.port)
+                    ticket.status = "expired"
+                else:
+                    ticket.status = "admitted"
+                    ticket.admitted_as = admitted_as
+
+    def _clean_up(self, now: float):
+        """drops tickets nobody's waiting on from the line and old ones for good"""
+        for ticket in list(self.queue):
+            if now - ticket.last_polled > TICKET_TIMEOUT:
+                self.queue.remove(ticket)
+                ticket.status = "expired"
+                ticket.finished_at = now
+        for ticket_id, ticket in list(self.tickets.items()):
+            if ticket.finished_at is not None:
+                if now - ticket.finished_at > FINISHED_TICKET_TTL:
+                    del self.tickets[ticket_id]
+
+    def position(self, ticket: Ticket) -> Optional[int]:
+        """how many are in line ahead of them, None if they're not in line"""
+        with self.lock:
+            for position, queued in enumerate(self.queue):
+                if queued is ticket:
+                    return position
+        return None
+
+    def eta_seconds(self, position: int) -> float:
+        """
+        Rough wait for whoever has position people ahead: games end in the
+        order they'll probably finish, each one freeing a port for the next
+        """
+        now = time.monotonic()
+        with self.lock:
+            average = self.average_game_seconds
+            remaining = sorted(
+                max(average - (now - started_at), 0)
+                for started_at in self.running.values()
+            )
+            # ports nobody's on yet will be taken by those ahead of them first
+            remaining = [0.0] * len(self.free_ports) + remaining
+        if not remaining:
+            return 0.0
+        rounds, slot = divmod(position, len(remaining))
+        return remaining[slot] + rounds * average
@@ -0,0 +1,115 @@
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Optional
+from server.server_utils import PARKED_READY
+
+"""
+Keeps a few backend processes started and parked, with the game code
+already imported, so hosting a game hands one a port instead of waiting on
+a cold python start. A thread tops the pool back up after each one's used
+"""
+
+# parked backends kept ready, each one's an idle python process
+WARM_BACKENDS = 2
+# how long we give a new backend to import everything before giving up on it
+PARK_TIMEOUT = 60
+# after a backend fails to park, wait this long before trying another
+RETRY_DELAY = 5
+
+
+class BackendPool:
+    def __init__(self, backend_main_path: str, size: int = WARM_BACKENDS):
+        self.backend_main_path = backend_main_path
+        self.size = size
+        self.parked = deque()
+        # notified whenever a parked backend is taken, or we stop
+        self.changed = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.size <= 0:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._refill, daemon=True)
+        self.thread.start()
+
+    def _park_one(self) -> Optional[subprocess.Popen]:
+        """starts a backend and waits for it to be ready for a port"""
+        process = subprocess.Popen(
+            ["python", self.backend_main_path, "--parked"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # it can hang on import, so don't let that hold up the pool forever
+        timer = threading.Timer(PARK_TIMEOUT, process.kill)
+        timer.start()
+        try:
+            ready = process.stdout.readline().decode().strip()
+        finally:
+            timer.cancel()
+        if ready != PARKED_READY:
+            process.kill()
+            print(f"Backend failed to park: {process.communicate()[1].decode()}")
+            return None
+        return process
+
+    def _refill(self):
+        while True:
+            with self.changed:
+                self.changed.wait_for(
+                    lambda: not self.running or len(self.parked) < self.size
+                )
+                if not self.running:
+                    return
+            process = self._park_one()
+            if process is None:
+                time.sleep(RETRY_DELAY)
+                continue
+            with self.changed:
+                if not self.running:
+                    process.kill()
+                    return
+                self.parked.append(process)
+
+    def _take_parked(self) -> Optional[subprocess.Popen]:
+        with self.changed:
+            while self.parked:
+                process = self.parked.popleft()
+                self.changed.notify_all()
+                if process.poll() is None:
+                    return process
+        return None
+
+    def launch(self, port: int) -> subprocess.Popen:
+        """
+        A backend running a game on port. Parked if we have one, otherwise
+        started from cold like before. Either way stdout and stderr are pipes
+        """
+        process = self._take_parked()
+        if process is not None:
+            try:
+                # communicate() closes stdin for us later
+                process.stdin.write(f"{port}\n".encode())
+                process.stdin.flush()
+                return process
+            except OSError:
+                # it died between checking and now
+                process.kill()
+        return subprocess.Popen(
+            ["python", self.backend_main_path, str(port)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def stop(self):
+        with self.changed:
+            self.running = False
+            self.changed.notify_all()
+            parked, self.parked = list(self.parked), deque()
+        for process in parked:
+            process.kill()
+            process.wait()
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from server.server_metrics import fetch_stats, quantile_from_counts
+
+"""
+Collects live numbers from every running game for the lobby's dashboard.
+Every so often each game server is asked for its stats, and the change
+since the last ask is turned into rates - rounds and tasks a second, cpu
+use, p99 post latency over just that stretch. Samples go in a fixed size
+ring, so there's some history without the lobby's memory growing
+"""
+
+# seconds between collecting from every game
+COLLECT_INTERVAL = 5
+# samples kept, half an hour's worth
+HISTORY_LENGTH = 360
+# how long we wait on a game that's too busy to answer
+FETCH_TIMEOUT = 1
+# commands whose latency is "post latency"
+POST_COMMANDS = ("post_task", "post_tasks")
+
+
+def _p99(counts) -> Optional[float]:
+    p99 = quantile_from_counts(counts, 0.99)
+    # json has no infinity, and past the biggest bucket is off the chart anyway
+    return None if p99 == float("inf") else p99
+
+
+def _subtract(counts, previous_counts):
+    if previous_counts is None or len(previous_counts) != len(counts):
+        return counts
+    return [count - previous for count, previous in zip(counts, previous_counts)]
+
+
+class MetricsCollector:
+    def __init__(
+        self,
+        running_games: Callable[[], Iterable[Tuple[str, int]]],
+        usage: Callable[[str], Optional[Dict]],
+        interval: float = COLLECT_INTERVAL,
+        history_length: int = HISTORY_LENGTH,
+    ):
+        """
+        running_games gives (game id, port) for every game to collect from,
+        usage gives the supervisor's cpu and memory numbers for a game
+        """
+        self.running_games = running_games
+        self.usage = usage
+        self.interval = interval
+        # {"time": ..., "games": {game id: sample}}, oldest first
+        self.history = deque(maxlen=history_length)
+        # game id -> (when, stats, usage, post counts) from the last collect
+        self.previous: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Error collecting game metrics: {str(e)}")
+
+    def _sample(self, game_id: str, now: float, stats: Dict, usage: Optional[Dict]):
+        """one game's numbers, as rates since the last collect where we can"""
+        clients = stats.get("clients", {})
+        queue_depths = [client["queue_depth"] for client in clients.values()]
+        sample = {
+            "round": stats.get("round"),
+            "clients": len(clients),
+            "spectators": stats.get("spectators", {}).get("count", 0),
+            "queue_depth_total": sum(queue_depths),
+            "queue_depth_max": max(queue_depths, default=0),
+            "rounds_per_second": None,
+            "tasks_per_second": None,
+            "post_p99_seconds": None,
+            "cpu_percent": None,
+            "rss_bytes": usage["rss_bytes"] if usage is not None else None,
+        }
+
+        post_counts = None
+        for command in POST_COMMANDS:
+            counts = stats.get("commands", {}).get(command, {}).get("counts")
+            if counts is not None:
+                post_counts = (
+                    counts
+                    if post_counts is None
+                    else [a + b for a, b in zip(post_counts, counts)]
+                )
+        if post_counts is not None:
+            # over the whole game until we have something to compare to
+            sample["post_p99_seconds"] = _p99(post_counts)
+
+        previous = self.previous.get(game_id)
+        self.previous[game_id] = (now, stats, usage, post_counts)
+        if previous is None:
+            return sample
+        then, previous_stats, previous_usage, previous_post_counts = previous
+        elapsed = now - then
+        if elapsed <= 0:
+            return sample
+
+        if stats.get("round") is not None and previous_stats.get("round") is not None:
+            # rounds start over each new board
+            sample["rounds_per_second"] = (
+                max(stats["round"] - previous_stats["round"], 0) / elapsed
+            )
+        sample["tasks_per_second"] = (
+            stats.get("tasks_posted", 0) - previous_stats.get("tasks_posted", 0)
+        ) / elapsed
+        if post_counts is not None:
+            recent = _subtract(post_counts, previous_post_counts)
+            if sum(recent):
+                sample["post_p99_seconds"] = _p99(recent)
+        if usage is not None and previous_usage is not None:
+            sample["cpu_percent"] = (
+                100 * (usage["cpu_seconds"] - previous_usage["cpu_seconds"]) / elapsed
+            )
+        return sample
+
+    def collect(self):
+        now = time.monotonic()
+        games = {}
+        for game_id, port in list(self.running_games()):
+            try:
+                stats = fetch_stats(port, timeout=FETCH_TIMEOUT)
+            except (OSError, ConnectionError):
+                # still starting up, or on its way out
+                continue
+            games[game_id] = self._sample(game_id, now, stats, self.usage(game_id))
+
+        # games that have gone don't need comparing to any more
+        for game_id in list(self.previous):
+            if game_id not in games:
+                del self.previous[game_id]
+        with self.lock:
+            self.history.append({"time": time.time(), "games": games})
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            history = list(self.history)
+        return {
+            "interval": self.interval,
+            "games": history[-1]["games"] if history else {},
+            "history": history,
+        }
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + FETCH_TIMEOUT)
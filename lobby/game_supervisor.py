@@ -0,0 +1,213 @@
+import os
+import selectors
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+"""
+Watches every game's backend process from one thread. Their stdout and
+stderr are read as they come and written straight to a rotating log file
+per game, so nothing piles up in the lobby however long a game runs. When
+a game's pipes close its process is reaped and on_exit is called. Every so
+often each game's cpu time and memory are read from /proc
+"""
+
+GAME_LOG_DIR = os.path.join("logs", "games")
+# a game's log rolls over at this size, keeping this many old ones
+MAX_LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 2
+# the end of stderr kept in memory, for the error when a game crashes
+STDERR_TAIL_BYTES = 4096
+READ_SIZE = 64 * 1024
+# seconds between reading each game's cpu and memory use
+SAMPLE_INTERVAL = 5
+# how often we check on a game that's closed its pipes but not exited yet
+EXIT_POLL_INTERVAL = 0.1
+
+
+def read_process_usage(pid: int) -> Optional[tuple[float, int]]:
+    """cpu seconds and rss bytes of a process, None if there's no /proc for it"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            stat = stat_file.read()
+    except OSError:
+        return None
+    # the process name can have spaces in it, so start after it.
+    # fields[0] is the state, field 3 in proc(5)
+    fields = stat[stat.rindex(")") + 2 :].split()
+    cpu_ticks = int(fields[11]) + int(fields[12])
+    rss_pages = int(fields[21])
+    return (
+        cpu_ticks / os.sysconf("SC_CLK_TCK"),
+        rss_pages * os.sysconf("SC_PAGE_SIZE"),
+    )
+
+
+class RotatingLog:
+    """like logging's RotatingFileHandler, for raw output"""
+
+    def __init__(self, path: str, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, "ab")
+        self.size = self.file.tell()
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "wb")
+        self.size = 0
+
+    def write(self, data: bytes):
+        if self.size and self.size + len(data) > self.max_bytes:
+            self._rotate()
+        self.file.write(data)
+        # written through as it comes, so the log's current if we crash
+        self.file.flush()
+        self.size += len(data)
+
+    def close(self):
+        self.file.close()
+
+
+@dataclass
+class SupervisedGame:
+    game_id: str
+    process: subprocess.Popen
+    log: RotatingLog
+    # called with the return code and the end of stderr once it's reaped
+    on_exit: Callable[[int, str], None]
+    open_pipes: int = 2
+    stderr_tail: bytearray = field(default_factory=bytearray)
+    cpu_seconds: float = 0.0
+    rss_bytes: int = 0
+
+
+class GameSupervisor:
+    def __init__(self, log_dir: str = GAME_LOG_DIR):
+        self.log_dir = log_dir
+        os.makedirs(log_dir, exist_ok=True)
+        self.games: Dict[str, SupervisedGame] = {}
+        # pipes closed, waiting on the process to exit
+        self.exiting: List[SupervisedGame] = []
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        # written to when a game is added, so the loop picks it up
+        self.wake_reader, self.wake_writer = os.pipe()
+        os.set_blocking(self.wake_reader, False)
+        os.set_blocking(self.wake_writer, False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _wake(self):
+        try:
+            os.write(self.wake_writer, b"\0")
+        except BlockingIOError:
+            pass  # it's already been woken
+
+    def watch(self, game_id: str, process: subprocess.Popen, on_exit):
+        """
+        Takes over a game's process, which has to have been started with
+        stdout and stderr as pipes
+        """
+        game = SupervisedGame(
+            game_id,
+            process,
+            RotatingLog(os.path.join(self.log_dir, f"{game_id}.log")),
+            on_exit,
+        )
+        with self.lock:
+            self.games[game_id] = game
+            for pipe in (process.stdout, process.stderr):
+                os.set_blocking(pipe.fileno(), False)
+                self.selector.register(pipe, selectors.EVENT_READ, game)
+        self._wake()
+
+    def usage(self, game_id: str) -> Optional[Dict]:
+        """cpu seconds and rss bytes as of the last sample"""
+        game = self.games.get(game_id)
+        if game is None:
+            return None
+        return {"cpu_seconds": game.cpu_seconds, "rss_bytes": game.rss_bytes}
+
+    def _read(self, game: SupervisedGame, pipe):
+        try:
+            data = os.read(pipe.fileno(), READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data:
+            game.log.write(data)
+            if pipe is game.process.stderr:
+                game.stderr_tail += data
+                del game.stderr_tail[:-STDERR_TAIL_BYTES]
+            return
+
+        with self.lock:
+            self.selector.unregister(pipe)
+        pipe.close()
+        game.open_pipes -= 1
+        if not game.open_pipes:
+            self.exiting.append(game)
+
+    def _reap(self):
+        for game in list(self.exiting):
+            if game.process.poll() is None:
+                continue
+            self.exiting.remove(game)
+            game.log.close()
+            with self.lock:
+                self.games.pop(game.game_id, None)
+            try:
+                game.on_exit(
+                    game.process.returncode,
+                    game.stderr_tail.decode(errors="replace"),
+                )
+            except Exception as e:
+                print(f"Error ending game {game.game_id}: {str(e)}")
+
+    def _sample(self):
+        for game in list(self.games.values()):
+            usage = read_process_usage(game.process.pid)
+            if usage is not None:
+                game.cpu_seconds, game.rss_bytes = usage
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while self.running:
+            timeout = max(next_sample - time.monotonic(), 0)
+            if self.exiting:
+                timeout = min(timeout, EXIT_POLL_INTERVAL)
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj == self.wake_reader:
+                    try:
+                        while os.read(self.wake_reader, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._read(key.data, key.fileobj)
+            self._reap()
+            if time.monotonic() >= next_sample:
+                self._sample()
+                next_sample = time.monotonic() + SAMPLE_INTERVAL
+
+    def stop(self):
+        self.running = False
+        self._wake()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
@@ -0,0 +1,18 @@
+import os
+
+"""
+gunicorn settings for the lobby, see wsgi.py
+"""
+
+bind = os.getenv("DRUDGEFORD_LOBBY_BIND", "0.0.0.0:8000")
+# the lobby's state is in memory, a second worker would have its own games
+workers = 1
+worker_class = "gthread"
+# a burst of downloads on a release can't take every thread, they're sent
+# with sendfile so each one's quick to hand off
+threads = int(os.getenv("DRUDGEFORD_LOBBY_THREADS", 32))
+sendfile = True
+# game logs and the lobby's own logs go next to this file like before
+chdir = os.path.dirname(os.path.abspath(__file__))
+timeout = 60
+keepalive = 5
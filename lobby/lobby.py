@@ -3,19 +3,37 @@ from flask import (
     send_file,
     render_template,
     jsonify,
+    make_response,
     send_from_directory,
     request,
 )
+import hashlib
 import os
 import time
 import subprocess
 import uuid
-import threading
-from typing import Dict
+from typing import Dict, Optional
 from dataclasses import dataclass
-from collections import defaultdict
-import socket
+import sys
 from logger import GameLogger
+from game_supervisor import GameSupervisor
+from admission import AdmissionQueue, RateLimiter
+
+# the lobby runs as a script from this folder, the game code is a level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server.server_metrics import METRIC_PREFIX, fetch_stats
+from backend_pool import BackendPool, WARM_BACKENDS
+from game_metrics import MetricsCollector
+
+# ended games stay around this long so their join link says they've ended
+ENDED_GAME_TTL = 60 * 60
+# games run on ports GAME_PORT_START and up, one game per port
+GAME_PORT_START = 5000
+NUM_GAME_PORTS = 5
+# pages that are the same for everyone, rendered once when the lobby starts
+CACHED_PAGES = ("main.html", "tutorial.html")
+# how long browsers can use static files before checking they've changed
+STATIC_MAX_AGE = 60 * 60
 
 
 @dataclass
@@ -24,73 +42,79 @@ class GameInstance:
     port: int
     process: subprocess.Popen
     status: str
+    ended_at: Optional[float] = None
 
 
 class Lobby:
-    def __init__(self, current_dir):
+    def __init__(self, current_dir, warm_backends: int = WARM_BACKENDS):
         # get some useful directory and file paths
         self.current_dir = current_dir
         self.base_dir = os.path.dirname(current_dir)
         self.static_dir = os.path.join(current_dir, "static")
         self.css_file = os.path.join(current_dir, "styles.css")
         self.backend_main_path = os.path.join(self.base_dir, "backend_main.py")
+        self.download_path = os.path.join(
+            self.base_dir, "executable_packaging", "executable_file", "drudgeford.dmg"
+        )
+        # template name -> (html, etag)
+        self.cached_pages: Dict[str, tuple[str, str]] = {}
+        # backends started ahead of time, so hosting doesn't wait on imports
+        self.backend_pool = BackendPool(self.backend_main_path, warm_backends)
+        # logs and reaps every game's process from one thread
+        self.supervisor = GameSupervisor()
+        # every running game's numbers for the dashboard, with some history
+        self.metrics_collector = MetricsCollector(
+            self.running_games, self.supervisor.usage
+        )
 
         # lets us keep track of attemps per IP
         # (resets everytime we reset the server)
-        self.ip_attempts = defaultdict(list)  # IP -> list of timestamps
+        self.rate_limiter = RateLimiter()
+        # hands out game ports, and queues people up when they're all taken
+        self.admission = AdmissionQueue(
+            range(GAME_PORT_START, GAME_PORT_START + NUM_GAME_PORTS), self.start_game
+        )
         self.app = Flask(__name__)
         self.logger = GameLogger()
 
         # Store active games and their info
         self.active_games: Dict[str, GameInstance] = {}
 
-    def is_port_available(self, port: int) -> bool:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(("localhost", port))
-                return True
-            except socket.error:
-                return False
-
-    def get_available_port(self, start_port: int = 5000, num_ports: int = 5) -> int:
-        used_ports = len(self.active_games)
+    def running_games(self):
+        return [
+            (game.id, game.port)
+            for game in list(self.active_games.values())
+            if game.status == "running"
+        ]
+
+    def start_game(self, port: int) -> Optional[str]:
+        """a new game on port, for the admission queue. Its id, or None if it
+        didn't start
+        """
+        self.prune_ended_games()
         self.logger.log_port_allocation(
-            None, num_ports, used_ports
-        )  # Log current usage
-        for port in range(start_port, start_port + num_ports):
-            if self.is_port_available(port):
-                self.logger.log_port_allocation(
-                    port, num_ports, used_ports + 1
-                )  # Log allocation
-                return port
-        return None
+            port, NUM_GAME_PORTS, self.admission.slots_in_use
+        )  # Log allocation
+        game_id = str(uuid.uuid4())
+        self.run_game_server(game_id, port)
+        game = self.active_games.get(game_id)
+        return game_id if game is not None and game.status == "running" else None
 
     def run_game_server(self, game_id: str, port: int):
-        """Run the game server in a separate process"""
+        """Start the game server in a separate process, the supervisor takes it
+        from there
+        """
         try:
-            process = subprocess.Popen(
-                ["python", self.backend_main_path, str(port)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-
+            process = self.backend_pool.launch(port)
             self.active_games[game_id] = GameInstance(
                 id=game_id, port=port, process=process, status="running"
             )
             self.logger.log_game_start(game_id, port)
-
-            stdout, stderr = process.communicate()
-
-            # Just mark game as ended, whether error or normal termination
-            if game_id in self.active_games:
-                status = "ended" if process.returncode == 0 else "error"
-                self.active_games[game_id].status = status
-                if status == "error":
-                    error_msg = stderr.decode()
-                    self.logger.log_game_end(game_id, status, error_msg)
-                    print(f"Game {game_id} ended with error: {stderr.decode()}")
-                else:
-                    self.logger.log_game_end(game_id, status)  # Log normal end
+            self.supervisor.watch(
+                game_id,
+                process,
+                lambda returncode, stderr: self.end_game(game_id, returncode, stderr),
+            )
 
         except Exception as e:
             error_msg = str(e)
@@ -98,45 +122,70 @@ class Lobby:
             print(f"Error running game {game_id}: {str(e)}")
             if game_id in self.active_games:
                 self.active_games[game_id].status = "error"
+                self.active_games[game_id].ended_at = time.time()
                 self.logger.log_game_end(game_id, "error", error_msg)
 
-    def has_started_too_many_games(self, ip) -> bool:
-        current_time = time.time()
-        # Clean up old attempts (older than 24 hours)
-        self.ip_attempts[ip] = [
-            t for t in self.ip_attempts[ip] if current_time - t < 86400
-        ]  # 24 hours in seconds
+    def end_game(self, game_id: str, returncode: int, stderr: str):
+        """called by the supervisor once the game's process has exited"""
+        # Just mark game as ended, whether error or normal termination
+        if game_id in self.active_games:
+            status = "ended" if returncode == 0 else "error"
+            self.active_games[game_id].status = status
+            self.active_games[game_id].ended_at = time.time()
+            if status == "error":
+                self.logger.log_game_end(game_id, status, stderr)
+                print(f"Game {game_id} ended with error: {stderr}")
+            else:
+                self.logger.log_game_end(game_id, status)  # Log normal end
+            # its port's free, so the next in line gets a game
+            self.admission.release(self.active_games[game_id].port)
+
+    def prune_ended_games(self):
+        """forget games that ended a while ago, so active_games doesn't grow forever"""
+        now = time.time()
+        for game_id, game in list(self.active_games.items()):
+            if game.ended_at is not None and now - game.ended_at > ENDED_GAME_TTL:
+                self.active_games.pop(game_id, None)
 
+    def has_started_too_many_games(self, ip) -> bool:
         # Check daily limit
-        if len(self.ip_attempts[ip]) >= 20:
+        if not self.rate_limiter.allow(ip):
             self.logger.log_rate_limit(ip)
             return True
-        else:
-            self.ip_attempts[ip].append(current_time)
-            return False
+        return False
 
     def setup_routes(self):
         self.app.route("/")(self.home)
         self.app.route("/static/<path:path>")(self.send_static)
         self.app.route("/download")(self.download)
         self.app.route("/host-game")(self.host_game)
+        self.app.route("/host-game/<ticket_id>")(self.host_game_status)
         self.app.route("/join/<game_id>")(self.join_game)
         self.app.route("/tutorial")(self.tutorial)
+        self.app.route("/games/<game_id>/metrics")(self.game_metrics)
+        self.app.route("/dashboard")(self.dashboard)
+        self.app.route("/dashboard.json")(self.dashboard_data)
 
     # route handlers
     def home(self):
-        return render_template("main.html")
+        return self.cached_page("main.html")
 
     def send_static(self, path):
-        return send_from_directory(self.static_dir, path)
+        # sets ETag and Last-Modified, and answers If-None-Match with a 304
+        return send_from_directory(self.static_dir, path, max_age=STATIC_MAX_AGE)
 
     def download(self):
-        exe_path = "../executable_packaging/executable_file/drudgeford.dmg"
+        # conditional lets a stopped download pick up where it left off with
+        # a Range request. The file goes out through the server's file
+        # wrapper, which is sendfile under gunicorn, so no worker thread
+        # copies it through python while a release goes out
         return send_file(
-            exe_path,
+            self.download_path,
             as_attachment=True,
             download_name="drudgeford.dmg",
             mimetype="application/x-apple-diskimage",
+            conditional=True,
+            max_age=STATIC_MAX_AGE,
         )
 
     def host_game(self):
@@ -149,24 +198,44 @@ class Lobby:
                         "error": "Daily game creation limit reached (20 games per day)",
                     }
                 )
-            port = self.get_available_port()
-            if port is None:
+            ticket = self.admission.request()
+            if ticket is None:
                 return jsonify(
                     {
                         "success": False,
-                        "error": "No ports available. Please try again later.",
+                        "error": "Too many people waiting. Please try again later.",
                     }
                 )
-
-            game_id = str(uuid.uuid4())
-            thread = threading.Thread(target=self.run_game_server, args=(game_id, port))
-            thread.start()
-
-            return jsonify({"success": True, "game_id": game_id, "port": port})
+            return jsonify(self.ticket_status(ticket))
         except Exception as e:
             self.logger.log_general_error(str(e))
             return jsonify({"success": False, "error": str(e)})
 
+    def host_game_status(self, ticket_id):
+        """polled by someone waiting in line for a game"""
+        ticket = self.admission.poll(ticket_id)
+        if ticket is None:
+            return jsonify({"success": False, "error": "Unknown ticket"}), 404
+        return jsonify(self.ticket_status(ticket))
+
+    def ticket_status(self, ticket) -> Dict:
+        if ticket.status == "admitted":
+            return {"success": True, "game_id": ticket.admitted_as, "port": ticket.port}
+        if ticket.status == "expired":
+            return {
+                "success": False,
+                "error": "Couldn't start a game. Please try again.",
+            }
+        # not in line any more means their game's being started right now
+        position = self.admission.position(ticket) or 0
+        return {
+            "success": True,
+            "queued": True,
+            "ticket": ticket.ticket_id,
+            "position": position + 1,
+            "eta_seconds": round(self.admission.eta_seconds(position)),
+        }
+
     def join_game(self, game_id):
         if game_id not in self.active_games:
             return render_template("error.html"), 404
@@ -178,7 +247,56 @@ class Lobby:
         return render_template("join.html", port=game.port)
 
     def tutorial(self):
-        return render_template("tutorial.html")
+        return self.cached_page("tutorial.html")
+
+    def render_pages(self):
+        """renders the pages that never change once, instead of every visit"""
+        with self.app.app_context():
+            for template in CACHED_PAGES:
+                html = render_template(template)
+                etag = hashlib.sha1(html.encode("utf-8")).hexdigest()
+                self.cached_pages[template] = (html, etag)
+
+    def cached_page(self, template):
+        html, etag = self.cached_pages[template]
+        response = make_response(html)
+        response.set_etag(etag)
+        # browsers check back each time, and get a 304 if it's the same page
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def game_metrics(self, game_id):
+        """prometheus text for one game, for scraping from this box only"""
+        if request.remote_addr not in ("127.0.0.1", "::1"):
+            return "", 404
+        game = self.active_games.get(game_id)
+        if game is None or game.status != "running":
+            return "", 404
+        try:
+            metrics = fetch_stats(game.port, stats_format="prometheus")
+        except (OSError, ConnectionError) as e:
+            return f"couldn't reach game: {str(e)}", 503
+        # what the game's whole process is using, as the supervisor sees it
+        usage = self.supervisor.usage(game_id)
+        if usage is not None:
+            metrics += (
+                f"# TYPE {METRIC_PREFIX}_process_cpu_seconds_total counter\n"
+                f"{METRIC_PREFIX}_process_cpu_seconds_total {usage['cpu_seconds']}\n"
+                f"# TYPE {METRIC_PREFIX}_process_resident_memory_bytes gauge\n"
+                f"{METRIC_PREFIX}_process_resident_memory_bytes {usage['rss_bytes']}\n"
+            )
+        return metrics, 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+    def dashboard(self):
+        """every running game at a glance, for looking at from this box only"""
+        if request.remote_addr not in ("127.0.0.1", "::1"):
+            return "", 404
+        return render_template("dashboard.html")
+
+    def dashboard_data(self):
+        if request.remote_addr not in ("127.0.0.1", "::1"):
+            return "", 404
+        return jsonify(self.metrics_collector.to_dict())
 
     def setup_static_files(self):
         os.makedirs(self.static_dir, exist_ok=True)
@@ -188,6 +306,11 @@ class Lobby:
                 css_content = source.read()
 
             css_destination = os.path.join(self.static_dir, "styles.css")
+            # only when it's changed, so browsers' cached copy stays good
+            if os.path.exists(css_destination):
+                with open(css_destination, "r") as dest:
+                    if dest.read() == css_content:
+                        return
             with open(css_destination, "w") as dest:
                 dest.write(css_content)
 
@@ -197,13 +320,36 @@ class Lobby:
             print(f"Error starting up: {str(e)}")
             raise
 
-    def run(self, host="0.0.0.0", port=8000):
+    def start(self):
+        """gets everything ready to serve, app can be handed to a wsgi server after"""
         self.setup_static_files()
         self.setup_routes()
-        self.app.run(host=host, port=port)
+        self.render_pages()
+        self.backend_pool.start()
+        self.supervisor.start()
+        self.metrics_collector.start()
 
+    def stop(self):
+        self.metrics_collector.stop()
+        self.backend_pool.stop()
+        self.supervisor.stop()
 
-if __name__ == "__main__":
+    def run(self, host="0.0.0.0", port=8000):
+        """flask's own server, for running locally. wsgi.py is for production"""
+        self.start()
+        try:
+            self.app.run(host=host, port=port, threaded=True)
+        finally:
+            self.stop()
+
+
+def create_lobby() -> Lobby:
     folder_path = os.path.dirname(os.path.abspath(__file__))
-    lobby = Lobby(folder_path)
+    # how many backends to keep warm, 0 starts every game from cold
+    warm_backends = int(os.getenv("DRUDGEFORD_WARM_BACKENDS", WARM_BACKENDS))
+    return Lobby(folder_path, warm_backends)
+
+
+if __name__ == "__main__":
+    lobby = create_lobby()
     lobby.run()
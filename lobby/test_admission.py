@@ -0,0 +1,123 @@
+import pytest
+from lobby import admission
+from lobby.admission import AdmissionQueue, RateLimiter
+
+
+class Clock:
+    """stands in for the time module, so tests decide when now is"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission, "time", clock)
+    return clock
+
+
+def start_games(games):
+    """an on_admit that starts a made up game on each port it's given"""
+
+    def on_admit(port):
+        games.append(port)
+        return f"game_{port}"
+
+    return on_admit
+
+
+def test_rate_limiter_refills(clock):
+    limiter = RateLimiter(capacity=2, per_seconds=10)
+    assert limiter.allow("a")
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+    # someone else has their own bucket
+    assert limiter.allow("b")
+    clock.now += 5
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+
+
+def test_rate_limiter_forgets_least_recently_used(clock):
+    limiter = RateLimiter(capacity=1, per_seconds=10, max_keys=2)
+    assert limiter.allow("a")
+    assert limiter.allow("b")
+    assert not limiter.allow("a")
+    # b's the oldest now, so it's the one dropped and starts full again
+    assert limiter.allow("c")
+    assert limiter.allow("b")
+    assert not limiter.allow("c")
+
+
+def test_admits_straight_away_while_ports_are_free(clock):
+    games = []
+    queue = AdmissionQueue([5000, 5001], start_games(games))
+    first, second = queue.request(), queue.request()
+    assert (first.status, first.port, first.admitted_as) == (
+        "admitted",
+        5000,
+        "game_5000",
+    )
+    assert (second.status, second.port) == ("admitted", 5001)
+    assert queue.slots_in_use == 2
+
+
+def test_release_admits_the_next_in_line(clock):
+    games = []
+    queue = AdmissionQueue([5000], start_games(games))
+    queue.request()
+    waiting = queue.request()
+    behind = queue.request()
+    assert waiting.status == "queued"
+    assert queue.position(waiting) == 0
+    assert queue.position(behind) == 1
+
+    queue.release(5000)
+    assert (waiting.status, waiting.port) == ("admitted", 5000)
+    assert queue.position(behind) == 0
+    assert games == [5000, 5000]
+
+
+def test_unpolled_tickets_expire(clock):
+    queue = AdmissionQueue([5000], start_games([]))
+    queue.request()
+    gave_up = queue.request()
+    still_here = queue.request()
+    clock.now += admission.TICKET_TIMEOUT / 2
+    queue.poll(still_here.ticket_id)
+    clock.now += admission.TICKET_TIMEOUT / 2 + 1
+
+    queue.release(5000)
+    assert gave_up.status == "expired"
+    assert still_here.status == "admitted"
+
+
+def test_eta_counts_down_running_games(clock):
+    queue = AdmissionQueue([5000, 5001], start_games([]))
+    queue.request()
+    clock.now += 100
+    queue.request()
+    average = queue.average_game_seconds
+    # the older game should end first, then the newer, then round again
+    assert queue.eta_seconds(0) == average - 100
+    assert queue.eta_seconds(1) == average
+    assert queue.eta_seconds(2) == average - 100 + average
+
+
+def test_game_that_ends_while_starting_frees_its_port_once(clock):
+    queue = None
+
+    def on_admit(port):
+        # the game dies and is released before it's seen to have started
+        queue.release(port)
+        return None
+
+    queue = AdmissionQueue([5000], on_admit)
+    ticket = queue.request()
+    assert ticket.status == "expired"
+    assert list(queue.free_ports) == [5000]
+    assert queue.slots_in_use == 0
@@ -0,0 +1,31 @@
+from lobby.game_metrics import MetricsCollector
+from server.backend_transport import InProcessTransport
+from server.tcp_client import TCPClient, ClientType
+from server.tcp_server import TCPServer
+
+PORT = 8089
+
+
+def test_samples_a_game_with_an_in_process_backend():
+    server = TCPServer(port=PORT)
+    server.start()
+    try:
+        frontend = TCPClient(ClientType.FRONTEND, port=PORT)
+        # how backend_main runs games the lobby starts
+        backend = InProcessTransport(server)
+        collector = MetricsCollector(lambda: [("game", PORT)], lambda game_id: None)
+
+        collector.collect()
+        for _ in range(10):
+            backend.post_task({"task_type": "test_task"}, "ALL_FRONTEND")
+        collector.collect()
+
+        sample = collector.to_dict()["games"]["game"]
+        assert sample["clients"] == 1
+        assert sample["queue_depth_total"] == 10
+        assert sample["tasks_per_second"] > 0
+        assert sample["post_p99_seconds"] is not None
+        assert len(collector.to_dict()["history"]) == 2
+        frontend.close()
+    finally:
+        server.stop()
@@ -0,0 +1,16 @@
+import atexit
+from lobby import create_lobby
+
+"""
+The lobby as a wsgi app, for running under gunicorn with gunicorn.conf.py:
+
+    cd lobby && gunicorn -c gunicorn.conf.py wsgi:app
+
+Games, the backend pool and the admission queue all live in the one
+lobby process, so it has to be one worker serving requests on threads
+"""
+
+lobby = create_lobby()
+lobby.start()
+atexit.register(lobby.stop)
+app = lobby.app
@@ -11,9 +11,16 @@ FONT_PATH = os.path.join(
 )
 GRID_COLOR = 0
 MAX_LOG_LINES = 10
+# the end of the log that frontends (and the server, for joiners) keep,
+# more than a LogView ever shows
+LOG_TAIL_LINES = 50
 WALL_THICKNESS = 8
 # approx 2 sec of durations with no movement
 WINDOW_LENGTH = 60
+# frames between polls for tasks, and between polls when the server is
+# pushing them to us
+POLL_INTERVAL = 20
+POLL_INTERVAL_SUBSCRIBED = 300
 
 BACKGROUND_TILES = {
     "dungeon_floor": {
@@ -147,12 +147,18 @@ class ViewManager:
         self.personal_log.font_color = 2
         self.personal_log.display_round_turn = False
 
-    def update_log(self, log: list[str]):
-        self.log_view.log = log
+    def update_log(self, log: list[str], start_index: int = 0):
+        self.log_view.load_log(log, start_index)
         if log:
             self.log_view.drawable = True
         self.log_view.draw()
 
+    def append_to_log(self, start_index: int, lines: list[str]):
+        if not self.log_view.append_log(start_index, lines):
+            return
+        self.log_view.drawable = True
+        self.log_view.draw()
+
     def update_round_turn(self, round_number: int, acting_character_name: str):
         self.log_view.round_number = round_number
         self.log_view.acting_character_name = acting_character_name
@@ -7,6 +7,8 @@ from pyxel_ui.constants import (
     WINDOW_LENGTH,
     DEFAULT_PYXEL_WIDTH,
     DEFAULT_PYXEL_HEIGHT,
+    POLL_INTERVAL,
+    POLL_INTERVAL_SUBSCRIBED,
 )
 from .models.tasks import (
     ActionTask,
@@ -16,17 +18,21 @@ from .models.tasks import (
 )
 from pyxel_ui.controllers.view_manager import ViewManager
 from server.tcp_client import TCPClient, ClientType
-from server.task_jsonifier import TaskJsonifier
+from server.task_codec import TaskCodec
 from .controllers.user_input_manager import UserInputManager
 
 
 class PyxelEngine:
-    def __init__(self, port, host):
+    def __init__(self, port, host, room=None):
         # self.total_time = 0
         # self.num_loops = 0
         # self.total_task_time = 0
-        self.server_client = TCPClient(ClientType.FRONTEND, port=port, host=host)
-        self.tj = TaskJsonifier()
+        self.server_client = TCPClient(
+            ClientType.FRONTEND, port=port, host=host, room=room
+        )
+        # have the server push tasks to us as they're posted
+        self.server_client.subscribe()
+        self.codec = TaskCodec()
         self.current_task = None
         self.task_queue = deque()
 
@@ -64,8 +70,16 @@ class PyxelEngine:
         get_task_time = -1
         unjsonify_time = -1
         perform_time = -1
-        # once in a while, grab all the tasks and queue them up
-        if self.loop_num % 20 == 0:
+        # tasks the server pushed since last frame
+        self.task_queue.extend(self.server_client.get_pushed_tasks())
+        # once in a while, grab anything that couldn't be pushed and queue it up.
+        # this also keeps our connection from timing out while we're subscribed
+        poll_interval = (
+            POLL_INTERVAL_SUBSCRIBED
+            if self.server_client.is_subscribed
+            else POLL_INTERVAL
+        )
+        if self.loop_num % poll_interval == 0:
             start_time = time.time()
             # jsonified_task = self.server_client.get_task()
             all_tasks = self.server_client.get_all_tasks()
@@ -80,8 +94,8 @@ class PyxelEngine:
         # every loop, try to grab a task from the queue
         if not self.current_task and self.task_queue:
             start_time = time.time()
-            current_task_json = self.task_queue.popleft()
-            self.current_task = self.tj.make_task_from_json(current_task_json)
+            encoded_task = self.task_queue.popleft()
+            self.current_task = self.codec.decode_task(encoded_task)
             unjsonify_time = time.time() - start_time
             # self.total_time += unjsonify_time
 
@@ -133,12 +133,47 @@ class LoadCharactersTask(Task):
 class LoadLogTask(Task):
     """
     task that updates the pyxel log
+    start_index is where log[0] is in the whole log, since only the
+    end of a long log gets sent
     """
 
     log: list[str]
+    start_index: int = 0
 
     def perform(self, view_manager, user_input_manager):
-        view_manager.update_log(self.log)
+        view_manager.update_log(self.log, self.start_index)
+
+
+@dataclass
+class AppendLogTask(Task):
+    """
+    task that adds new lines to the pyxel log
+    start_index is where the lines go in the log, so replayed or
+    out of date lines don't get duplicated
+    """
+
+    start_index: int
+    lines: list[str]
+
+    def perform(self, view_manager, user_input_manager):
+        view_manager.append_to_log(self.start_index, self.lines)
+
+    def apply_to(self, log_start: int, log: list[str], max_lines: int):
+        """
+        (log_start, log) once the lines are put in a log whose first line is
+        line log_start, keeping only its last max_lines. None if we're missing
+        lines before start_index - the next LoadLogTask will catch us up
+        """
+        offset = self.start_index - log_start
+        if offset > len(log) or not self.lines:
+            return None
+        if offset < 0:
+            # they replace everything we have
+            log_start, log = self.start_index, list(self.lines)
+        else:
+            log = log[:offset] + self.lines
+        extra = max(len(log) - max_lines, 0)
+        return log_start + extra, log[extra:]
 
 
 @dataclass
@@ -395,8 +430,8 @@ class SaveCampaign(Task):
     task that asks the user if they'd like to save and saves if so
     """
 
-    # ideally this would be a CampaignState but it's creating circular dependencies
-    campaign_state: any
+    # the fields of a CampaignState - the class itself would create circular dependencies
+    campaign_state: dict
 
     def perform(self, view_manager, user_input_manager):
         import os
@@ -406,7 +441,7 @@ class SaveCampaign(Task):
         filename = self.get_unused_filename()
         os.makedirs(SAVE_FILE_DIR, exist_ok=True)
         with open(SAVE_FILE_DIR + filename, "w") as f:
-            json.dump(self.campaign_state.__dict__, f)
+            json.dump(self.campaign_state, f)
         return filename
 
     def get_unused_filename(self):
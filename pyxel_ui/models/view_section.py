@@ -5,8 +5,10 @@ import pyxel
 from pyxel_ui.utils import draw_tile
 from pyxel_ui.views.sprite import Sprite, SpriteManager
 from pyxel_ui.enums import AnimationFrame
+from pyxel_ui.models.tasks import AppendLogTask
 from pyxel_ui.constants import (
     GRID_COLOR,
+    LOG_TAIL_LINES,
     MAX_LOG_LINES,
     BITS,
     BACKGROUND_TILES,
@@ -88,6 +90,8 @@ class LogView(ViewSection):
         super().__init__(*args, **kwargs)
 
         self._log: list[str] = []
+        # where _log[0] is in the whole log, we only keep its end
+        self.log_start = 0
         self.is_log_changed = False
         self.round_number: int = 0
         self.acting_character_name: str = ""
@@ -107,6 +111,26 @@ class LogView(ViewSection):
             self._log = new_log
             self.is_log_changed = True
 
+    def load_log(self, log: list[str], start_index: int = 0):
+        extra = max(len(log) - LOG_TAIL_LINES, 0)
+        self.log_start = start_index + extra
+        self.log = log[extra:]
+
+    def append_log(self, start_index: int, lines: list[str]) -> bool:
+        """
+        Puts lines into the log starting at start_index. Returns False without
+        changing anything if we're missing lines before start_index - the
+        next full log snapshot will catch us up
+        """
+        appended = AppendLogTask(start_index, lines).apply_to(
+            self.log_start, self._log, LOG_TAIL_LINES
+        )
+        if appended is None:
+            return False
+        self.log_start, self._log = appended
+        self.is_log_changed = True
+        return True
+
     def _redraw(self) -> None:
         if not self.log and self.round_number <= 0:
             return
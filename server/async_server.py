@@ -0,0 +1,599 @@
+import asyncio
+import hmac
+import os
+import secrets
+import threading
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from server.client_outbox import ClientOutbox
+from server.frontend_state import FrontendState
+from server.server_utils import ClientType, encode_message, read_message
+from server.spectator_stream import MAX_SPECTATORS, encode_frames
+
+"""
+Serves many games from one port on a single asyncio event loop.
+Every connection says which room (game) it's in when it identifies, and each
+room has its own clients, outboxes and user input queue - it's a
+TCPServer per room without a thread per client or a lock everyone shares
+"""
+
+ALLOWED_BACKEND_IPS = {
+    "127.0.0.1",  # IPv4 localhost
+    "::1",  # IPv6 localhost
+    "13.59.128.25",  # AWS instance
+}
+# how long a connection can go without sending anything
+IDLE_TIMEOUT = 600
+# how long a room stays open after its last player leaves
+ROOM_SHUTDOWN_DELAY = 300
+# rooms one IP can have open at once, each one runs a whole campaign
+MAX_ROOMS_PER_IP = 2
+# past this much unsent data, a client's tasks wait (and coalesce) in its outbox
+MAX_PUSH_BUFFER_BYTES = 256 * 1024
+# keeps pushed frames under the max message size
+MAX_TASKS_PER_PUSH = 100
+
+
+@dataclass
+class RoomClient:
+    client_id: str
+    client_type: ClientType
+    writer: asyncio.StreamWriter
+    outbox: ClientOutbox = field(default_factory=ClientOutbox)
+    push_writer: Optional[asyncio.StreamWriter] = None
+    # waiting for a slow reader to take what we've already written
+    push_draining: bool = False
+    # the coroutine serving this client's requests
+    handler: Optional[asyncio.Task] = None
+    # what a frontend's push connection has to show, so only they can open it
+    subscribe_token: str = ""
+
+
+class Room:
+    def __init__(self, room_id: str, max_players: int):
+        self.room_id = room_id
+        self.max_players = max_players
+        # replaced rather than changed in place, so the campaign thread can
+        # read it while the event loop adds and removes clients
+        self.clients: Dict[str, RoomClient] = {}
+        self.frontend_state = FrontendState()
+        # spectator id -> their connection. They're not clients, they just watch
+        self.spectators: Dict[str, asyncio.StreamWriter] = {}
+        self.spectator_counter = 0
+        # missing frames, they get a snapshot once they've taken what they have
+        self.lagging_spectators = set()
+        # the IP of the player who opened it
+        self.opened_by: Optional[str] = None
+        self.user_input_queue: asyncio.Queue = asyncio.Queue()
+        self.shutdown_timer: Optional[asyncio.TimerHandle] = None
+        # lets the campaign thread sleep until players come and go
+        self.clients_changed = threading.Condition()
+        self.closed = False
+
+    def add_client(self, client: RoomClient):
+        with self.clients_changed:
+            self.clients = {**self.clients, client.client_id: client}
+            self.clients_changed.notify_all()
+
+    def remove_client(self, client_id: str):
+        with self.clients_changed:
+            self.clients = {
+                other_id: client
+                for other_id, client in self.clients.items()
+                if other_id != client_id
+            }
+            self.clients_changed.notify_all()
+
+    def close(self):
+        with self.clients_changed:
+            self.closed = True
+            self.clients_changed.notify_all()
+
+    def count_frontends(self) -> int:
+        return sum(
+            1
+            for client in self.clients.values()
+            if client.client_type == ClientType.FRONTEND
+        )
+
+    def has_frontends(self) -> bool:
+        return self.count_frontends() > 0
+
+    def wait_for_frontends(self, num_frontends: int, timeout=None) -> bool:
+        """
+        Sleeps until at least num_frontends players are in the room.
+        Returns False if the room closed or the timeout ran out first
+        """
+        with self.clients_changed:
+            self.clients_changed.wait_for(
+                lambda: self.closed or self.count_frontends() >= num_frontends,
+                timeout,
+            )
+            return not self.closed and self.count_frontends() >= num_frontends
+
+    def generate_client_id(self, client_type: ClientType) -> Optional[str]:
+        """None if there's no room for another client of this type"""
+        if client_type == ClientType.BACKEND:
+            return None if "backend" in self.clients else "backend"
+        for i in range(1, self.max_players + 1):
+            if f"frontend_{i}" not in self.clients:
+                return f"frontend_{i}"
+        return None
+
+
+class AsyncTCPServer:
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=8080,
+        max_players=3,
+        max_rooms=500,
+        on_new_room: Optional[Callable[[Room], None]] = None,
+        unix_path=None,
+        max_rooms_per_ip=MAX_ROOMS_PER_IP,
+    ):
+        """
+        on_new_room is called from the event loop when a player opens a new
+        room - it must not block (start the room's game on a thread)
+        unix_path also listens on a unix domain socket, for backends that run
+        in another process on the same box. Each IP can only have
+        max_rooms_per_ip rooms open at once
+        """
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self._unix_server = None
+        self.max_players = max_players
+        self.max_rooms = max_rooms
+        self.max_rooms_per_ip = max_rooms_per_ip
+        self.on_new_room = on_new_room
+        self.rooms: Dict[str, Room] = {}
+        # IP -> how many open rooms it opened
+        self.rooms_opened_by: Dict[str, int] = {}
+        self.running = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread = None
+        self._server = None
+        self._started = threading.Event()
+        self._start_error = None
+        self.stopped = threading.Event()
+        # the coroutine serving each open connection
+        self.connections = set()
+
+    def start(self):
+        """Runs the event loop on a background thread"""
+        self.running = True
+        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread.start()
+        self._started.wait()
+        if self._start_error is not None:
+            self.running = False
+            raise self._start_error
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(
+                    self._handle_connection,
+                    self.host,
+                    self.port,
+                    reuse_address=True,
+                )
+            )
+            if self.unix_path is not None:
+                if os.path.exists(self.unix_path):
+                    os.unlink(self.unix_path)
+                self._unix_server = self.loop.run_until_complete(
+                    asyncio.start_unix_server(
+                        self._handle_connection, path=self.unix_path
+                    )
+                )
+        except Exception as e:
+            print(f"Failed to initialize server socket: {str(e)}")
+            self._start_error = e
+            self._started.set()
+            self.loop.close()
+            return
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        """Stop the server and drop every room"""
+        if not self.running:
+            return
+        print("Initiating server shutdown...")
+        self.running = False
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(
+                timeout=5
+            )
+        except Exception as e:
+            print(f"Error during shutdown: {str(e)}")
+            traceback.print_exc()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=5)
+        self.stopped.set()
+        print("Server shutdown complete")
+
+    async def _shutdown(self):
+        listeners = [self._server]
+        if self._unix_server is not None:
+            listeners.append(self._unix_server)
+        for listener in listeners:
+            listener.close()
+        for room_id in list(self.rooms):
+            self._close_room(room_id)
+        for listener in listeners:
+            await listener.wait_closed()
+        # let them finish closing up while the loop's still running
+        if self.connections:
+            await asyncio.wait(list(self.connections), timeout=1)
+        if self._unix_server is not None:
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+
+    def close_room(self, room_id: str):
+        """Drops everyone in a room - safe to call from any thread"""
+        if self.running:
+            self.loop.call_soon_threadsafe(self._close_room, room_id)
+
+    def _close_room(self, room_id: str):
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return
+        if room.opened_by is not None:
+            self.rooms_opened_by[room.opened_by] -= 1
+            if not self.rooms_opened_by[room.opened_by]:
+                del self.rooms_opened_by[room.opened_by]
+        room.close()
+        if room.shutdown_timer is not None:
+            room.shutdown_timer.cancel()
+        for client in room.clients.values():
+            for writer in (client.writer, client.push_writer):
+                if writer is not None:
+                    writer.close()
+            # a backend waiting on input would otherwise wait forever
+            if client.handler is not None:
+                client.handler.cancel()
+        for writer in room.spectators.values():
+            writer.close()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        handler = asyncio.current_task()
+        self.connections.add(handler)
+        handler.add_done_callback(self.connections.discard)
+        try:
+            client_info = await asyncio.wait_for(read_message(reader), IDLE_TIMEOUT)
+            client_type = ClientType(client_info.get("client_type"))
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            writer.close()
+            return
+
+        room_id = client_info.get("room")
+        if client_info.get("subscribe"):
+            await self._serve_subscription(
+                reader,
+                writer,
+                room_id,
+                client_info["subscribe"],
+                client_info.get("token"),
+            )
+            return
+        if client_type == ClientType.SPECTATOR:
+            await self._serve_spectator(reader, writer, room_id)
+            return
+
+        try:
+            room, client = self._join_room(room_id, client_type, writer)
+        except ValueError as e:
+            writer.write(encode_message({"error": str(e)}))
+            writer.close()
+            return
+
+        identification = {"client_id": client.client_id}
+        if client.subscribe_token:
+            identification["subscribe_token"] = client.subscribe_token
+        writer.write(encode_message(identification))
+        try:
+            while self.running:
+                try:
+                    request = await asyncio.wait_for(
+                        read_message(reader), IDLE_TIMEOUT
+                    )
+                except (asyncio.TimeoutError, ConnectionError):
+                    break
+                response = await self._process_command(
+                    room, client, request.get("command"), request.get("payload", {})
+                )
+                if "request_id" in request:
+                    response["request_id"] = request["request_id"]
+                writer.write(encode_message(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # cancelled when the room closes, we're done with them either way
+            pass
+        finally:
+            self._leave_room(room, client)
+
+    def _join_room(
+        self, room_id: Optional[str], client_type: ClientType, writer
+    ) -> tuple[Room, RoomClient]:
+        if not room_id:
+            raise ValueError("no room given")
+
+        room = self.rooms.get(room_id)
+        is_new_room = False
+        peername = writer.get_extra_info("peername")
+        # unix socket peers have no address - they can only be on this box
+        client_ip = peername[0] if peername else "127.0.0.1"
+        # Handle IPv6 mapped IPv4 addresses
+        if client_ip.startswith("::ffff:"):
+            client_ip = client_ip.replace("::ffff:", "")
+        if client_type == ClientType.BACKEND:
+            if client_ip not in ALLOWED_BACKEND_IPS:
+                print(f"Rejected backend connection from unauthorized IP: {client_ip}")
+                raise ValueError("unauthorized")
+            if room is None:
+                raise ValueError("unknown room")
+        elif room is None:
+            if len(self.rooms) >= self.max_rooms:
+                raise ValueError("server full")
+            if self.rooms_opened_by.get(client_ip, 0) >= self.max_rooms_per_ip:
+                raise ValueError("too many rooms open")
+            room = Room(room_id, self.max_players)
+            room.opened_by = client_ip
+            self.rooms_opened_by[client_ip] = self.rooms_opened_by.get(client_ip, 0) + 1
+            self.rooms[room_id] = room
+            is_new_room = True
+
+        client_id = room.generate_client_id(client_type)
+        if client_id is None:
+            raise ValueError("room full")
+        if client_type == ClientType.FRONTEND and room.shutdown_timer is not None:
+            room.shutdown_timer.cancel()
+            room.shutdown_timer = None
+            print(f"Player rejoined room {room_id}. Canceling shutdown timer.")
+
+        # new frontends catch up on the game so far
+        client = RoomClient(
+            client_id=client_id,
+            client_type=client_type,
+            writer=writer,
+            outbox=ClientOutbox(
+                room.frontend_state.snapshot()
+                if client_type == ClientType.FRONTEND
+                else ()
+            ),
+            handler=asyncio.current_task(),
+        )
+        if client_type == ClientType.FRONTEND:
+            client.subscribe_token = secrets.token_hex(16)
+        room.add_client(client)
+        if is_new_room and self.on_new_room is not None:
+            self.on_new_room(room)
+        return room, client
+
+    def _leave_room(self, room: Room, client: RoomClient):
+        if room.clients.get(client.client_id) is not client:
+            return
+        room.remove_client(client.client_id)
+        client.writer.close()
+        if client.push_writer is not None:
+            client.push_writer.close()
+
+        # give everyone a while to come back before we close the room
+        if self.rooms.get(room.room_id) is room and not room.has_frontends():
+            print(f"All players left room {room.room_id}. Starting shutdown timer...")
+            room.shutdown_timer = self.loop.call_later(
+                ROOM_SHUTDOWN_DELAY, self._close_room, room.room_id
+            )
+
+    async def _serve_subscription(self, reader, writer, room_id, client_id, token):
+        """
+        From now on, tasks for client_id are written to this connection as
+        soon as they're posted. Anything already waiting for them goes out
+        first. token has to be the subscribe_token client_id was given
+        """
+        room = self.rooms.get(room_id)
+        client = room.clients.get(client_id) if room is not None else None
+        if (
+            client is None
+            or client.client_type != ClientType.FRONTEND
+            or not hmac.compare_digest(
+                client.subscribe_token.encode(), str(token).encode()
+            )
+        ):
+            writer.write(encode_message({"error": "unknown client id"}))
+            writer.close()
+            return
+
+        writer.write(encode_message({"status": "subscribed"}))
+        writer.transport.set_write_buffer_limits(high=MAX_PUSH_BUFFER_BYTES)
+        client.push_writer = writer
+        self._push_tasks(client)
+
+        # clients never write here, so anything we read means they hung up
+        try:
+            await reader.read()
+        finally:
+            if client.push_writer is writer:
+                client.push_writer = None
+            writer.close()
+
+    async def _serve_spectator(self, reader, writer, room_id):
+        """streams a room's game to someone watching it until they hang up"""
+        room = self.rooms.get(room_id)
+        if room is None or len(room.spectators) >= MAX_SPECTATORS:
+            error = "unknown room" if room is None else "too many spectators"
+            writer.write(encode_message({"error": error}))
+            writer.close()
+            return
+
+        room.spectator_counter += 1
+        spectator_id = f"spectator_{room.spectator_counter}"
+        writer.write(encode_message({"client_id": spectator_id}))
+        writer.writelines(encode_frames(room.frontend_state.snapshot()))
+        writer.transport.set_write_buffer_limits(high=MAX_PUSH_BUFFER_BYTES)
+        room.spectators[spectator_id] = writer
+
+        # spectators never write here, so anything we read means they hung up
+        try:
+            await reader.read()
+        finally:
+            room.spectators.pop(spectator_id, None)
+            room.lagging_spectators.discard(spectator_id)
+            writer.close()
+
+    def _broadcast_to_spectators(self, room: Room, tasks: List):
+        """encodes the tasks once and writes the same frames to every spectator"""
+        frames = encode_frames(tasks)
+        for spectator_id, writer in list(room.spectators.items()):
+            if spectator_id in room.lagging_spectators or writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() >= MAX_PUSH_BUFFER_BYTES:
+                # they miss these, so they start over once they've caught up
+                room.lagging_spectators.add(spectator_id)
+                self.loop.create_task(
+                    self._resync_spectator(room, spectator_id, writer)
+                )
+                continue
+            writer.writelines(frames)
+
+    async def _resync_spectator(self, room: Room, spectator_id: str, writer):
+        try:
+            await writer.drain()
+        except ConnectionError:
+            return
+        finally:
+            room.lagging_spectators.discard(spectator_id)
+        if room.spectators.get(spectator_id) is writer:
+            print(f"{spectator_id} in room {room.room_id} fell behind. Resyncing")
+            writer.writelines(encode_frames(room.frontend_state.snapshot()))
+
+    def _deliver_tasks(self, room: Room, client: RoomClient, tasks: List, own_tasks=()):
+        """own_tasks are the ones in tasks sent only to them, a resync keeps those"""
+        if not client.outbox.extend(tasks, own_tasks):
+            # it's missing tasks now, so start it over from what the game looks like
+            print(f"{client.client_id} in room {room.room_id} fell behind. Resyncing")
+            client.outbox.reset(room.frontend_state.snapshot())
+        self._push_tasks(client)
+
+    def _push_tasks(self, client: RoomClient):
+        """
+        Writes the client's outbox to its push connection, unless they're
+        still reading what we sent last time - then it waits in the outbox
+        """
+        writer = client.push_writer
+        if writer is None or writer.is_closing():
+            client.push_writer = None
+            return
+        while len(client.outbox) and not client.push_draining:
+            if writer.transport.get_write_buffer_size() >= MAX_PUSH_BUFFER_BYTES:
+                client.push_draining = True
+                self.loop.create_task(self._push_when_drained(client, writer))
+                return
+            tasks = client.outbox.drain(limit=MAX_TASKS_PER_PUSH)
+            writer.write(encode_message({"tasks": tasks}))
+
+    async def _push_when_drained(self, client: RoomClient, writer):
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            client.push_draining = False
+        self._push_tasks(client)
+
+    def _post_tasks(self, room: Room, task_payloads: List[Dict]) -> Dict:
+        tasks_by_client: Dict[str, List] = {}
+        # the tasks sent to just that client, which no snapshot has
+        own_tasks_by_client: Dict[str, List] = {}
+        broadcast = []
+        # all or nothing, so nobody's state gets a task that wasn't delivered
+        for task_payload in task_payloads:
+            target_client_id = task_payload.get("target_client_id")
+            if target_client_id == "ALL_FRONTEND" or target_client_id in room.clients:
+                continue
+            return {"error": f"unknown client id: {target_client_id}"}
+        for task_payload in task_payloads:
+            target_client_id = task_payload.get("target_client_id")
+            if target_client_id == "ALL_FRONTEND":
+                target_client_ids = [
+                    client.client_id
+                    for client in room.clients.values()
+                    if client.client_type == ClientType.FRONTEND
+                ]
+            else:
+                target_client_ids = [target_client_id]
+                own_tasks_by_client.setdefault(target_client_id, []).append(
+                    task_payload["task"]
+                )
+            for client_id in target_client_ids:
+                tasks_by_client.setdefault(client_id, []).append(task_payload["task"])
+            if target_client_id == "ALL_FRONTEND":
+                room.frontend_state.add(task_payload["task"])
+                broadcast.append(task_payload["task"])
+
+        for client_id, tasks in tasks_by_client.items():
+            self._deliver_tasks(
+                room,
+                room.clients[client_id],
+                tasks,
+                own_tasks_by_client.get(client_id, ()),
+            )
+        if room.spectators and broadcast:
+            self._broadcast_to_spectators(room, broadcast)
+        return {"status": "success"}
+
+    async def _process_command(
+        self, room: Room, client: RoomClient, command: str, payload
+    ) -> Dict:
+        """Process commands and return appropriate response"""
+        try:
+            # while subscribed, tasks only come down the push connection
+            # so they can't arrive out of order
+            if command == "get_task":
+                if client.push_writer is not None:
+                    return {"task": None}
+                return {"task": client.outbox.pop()}
+
+            if command == "get_all_tasks":
+                if client.push_writer is not None:
+                    return {"tasks": []}
+                return {"tasks": client.outbox.drain()}
+
+            if command == "post_task":
+                return self._post_tasks(room, [payload])
+
+            if command == "post_tasks":
+                return self._post_tasks(room, payload.get("tasks", []))
+
+            if command == "get_user_input":
+                if client.client_type != ClientType.BACKEND:
+                    return {"error": "Only backend can get user input"}
+                return {"user_input": await room.user_input_queue.get()}
+
+            if command == "post_user_input":
+                if client.client_type != ClientType.FRONTEND:
+                    return {"error": "Only frontend can post user input"}
+                room.user_input_queue.put_nowait(
+                    {"source_client_id": client.client_id, "input": payload}
+                )
+                return {"status": "success"}
+
+            return {"error": "unknown command"}
+        except Exception as e:
+            # only this room's request failed, everyone else keeps playing
+            print(f"Error processing command in room {room.room_id}: {str(e)}")
+            traceback.print_exc()
+            return {"error": str(e)}
@@ -0,0 +1,133 @@
+import abc
+import asyncio
+import concurrent.futures
+import queue
+import time
+from server.async_server import AsyncTCPServer, Room
+from server.tcp_client import TCPClient
+from server.tcp_server import TCPServer
+
+"""
+How PyxelManager talks to the server. TCPClient works from anywhere (and over
+a unix socket with unix_path); when the backend runs in the same process as
+its server, the in-process transports skip sockets, json and waiting on
+replies and hand tasks straight to the server
+"""
+
+# how often a backend waiting on input checks that the server is still up
+INPUT_POLL_SECONDS = 0.5
+
+
+class BackendTransport(abc.ABC):
+    """everything the backend needs from the server"""
+
+    @abc.abstractmethod
+    def post_tasks(self, tasks_to_post):
+        """tasks_to_post is a list of (task_data, target_client_id)"""
+        pass
+
+    def post_task(self, task_data, target_client_id):
+        return self.post_tasks([(task_data, target_client_id)])
+
+    @abc.abstractmethod
+    def get_user_input(self):
+        """blocks until a player sends input, returns None if the server is gone"""
+        pass
+
+    def close(self):
+        pass
+
+
+BackendTransport.register(TCPClient)
+
+
+class InProcessTransport(BackendTransport):
+    """
+    for a backend running in the same process as its TCPServer. Commands are
+    timed into the server's metrics, like the server times them over tcp
+    """
+
+    def __init__(self, server: TCPServer):
+        self.server = server
+        self.client_id = "backend"
+
+    def _post(self, command, tasks_to_post):
+        start = time.perf_counter()
+        try:
+            return self.server._process_post_tasks(
+                {
+                    "tasks": [
+                        {"target_client_id": target_client_id, "task": task_data}
+                        for task_data, target_client_id in tasks_to_post
+                    ]
+                }
+            )
+        finally:
+            self.server.metrics.observe_command(command, time.perf_counter() - start)
+
+    def post_tasks(self, tasks_to_post):
+        return self._post("post_tasks", tasks_to_post)
+
+    def post_task(self, task_data, target_client_id):
+        return self._post("post_task", [(task_data, target_client_id)])
+
+    def get_user_input(self):
+        start = time.perf_counter()
+        try:
+            while self.server.running:
+                try:
+                    return self.server.user_input_queue.get(
+                        timeout=INPUT_POLL_SECONDS
+                    )
+                except queue.Empty:
+                    continue
+            return None
+        finally:
+            self.server.metrics.observe_command(
+                "get_user_input", time.perf_counter() - start
+            )
+
+
+class RoomTransport(BackendTransport):
+    """for a backend running in the same process as its AsyncTCPServer room"""
+
+    def __init__(self, server: AsyncTCPServer, room: Room):
+        self.server = server
+        self.room = room
+        self.client_id = "backend"
+
+    def _post_on_loop(self, task_payloads):
+        response = self.server._post_tasks(self.room, task_payloads)
+        if "error" in response:
+            print(f"Error posting tasks in room {self.room.room_id}: {response}")
+
+    def post_tasks(self, tasks_to_post):
+        # the event loop runs callbacks in the order they're scheduled,
+        # so tasks still arrive in order without waiting on a reply
+        task_payloads = [
+            {"target_client_id": target_client_id, "task": task_data}
+            for task_data, target_client_id in tasks_to_post
+        ]
+        self.server.loop.call_soon_threadsafe(self._post_on_loop, task_payloads)
+        return {"status": "success"}
+
+    def is_room_open(self):
+        return self.server.running and self.server.rooms.get(self.room.room_id) is (
+            self.room
+        )
+
+    def get_user_input(self):
+        if not self.is_room_open():
+            return None
+        future = asyncio.run_coroutine_threadsafe(
+            self.room.user_input_queue.get(), self.server.loop
+        )
+        while self.is_room_open():
+            try:
+                return future.result(timeout=INPUT_POLL_SECONDS)
+            except concurrent.futures.TimeoutError:
+                continue
+            except concurrent.futures.CancelledError:
+                return None
+        future.cancel()
+        return None
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+from server.task_codec import TaskCodec
+from pyxel_ui.models import tasks
+
+"""
+Tasks waiting to go out to one client. Each client has its own outbox and
+its own lock, so a player who stops reading (laptop asleep, bad wifi) only
+backs up their own queue. Once a queue gets long, tasks that a later task
+makes pointless are dropped, and if the client still falls too far behind
+the backlog is thrown away so the server can resync them from a snapshot.
+A snapshot only has what was sent to everyone, so tasks sent just to this
+client (like a prompt the backend's waiting on) are kept through that
+"""
+
+# tasks that only carry the latest state replace the pending tasks they
+# supersede, unless an animation is queued between them
+SUPERSEDED_BY = {
+    tasks.LoadCharactersTask: (tasks.LoadCharactersTask,),
+    tasks.LoadRoundTurnInfoTask: (tasks.LoadRoundTurnInfoTask,),
+    tasks.LoadLogTask: (tasks.LoadLogTask, tasks.AppendLogTask),
+}
+COALESCE_BARRIERS = (tasks.ActionTask, tasks.RemoveEntityTask)
+
+# a client that's kept up never has this many tasks waiting
+COALESCE_AFTER_TASKS = 200
+# past this, even after coalescing, the client's backlog gets dropped
+MAX_OUTBOX_TASKS = 2000
+
+codec = TaskCodec()
+
+
+class ClientOutbox:
+    def __init__(
+        self,
+        tasks_to_send=(),
+        max_tasks: int = MAX_OUTBOX_TASKS,
+        coalesce_after: int = COALESCE_AFTER_TASKS,
+    ):
+        self.tasks = deque(tasks_to_send)
+        # ids of the queued tasks that were sent only to this client
+        self.own_task_ids = set()
+        self.max_tasks = max_tasks
+        self.coalesce_after = coalesce_after
+        # only coalesce again once the queue has grown a good deal,
+        # so a client stuck at the limit doesn't get scanned on every post
+        self.coalesce_at = coalesce_after
+        # when the queue last went from empty to not, for how stale it's getting
+        self.waiting_since = time.time() if self.tasks else None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def age(self) -> float:
+        """how long tasks have been waiting here, 0 if there aren't any"""
+        waiting_since = self.waiting_since
+        return time.time() - waiting_since if waiting_since is not None else 0.0
+
+    def _update_waiting_since(self):
+        if not self.tasks:
+            self.waiting_since = None
+        elif self.waiting_since is None:
+            self.waiting_since = time.time()
+
+    def _coalesce(self):
+        kept = deque()
+        superseded = set()
+        for task_data in reversed(self.tasks):
+            task_class = codec.peek_task_class(task_data)
+            if task_class in COALESCE_BARRIERS:
+                superseded = set()
+            elif task_class in superseded:
+                continue
+            superseded.update(SUPERSEDED_BY.get(task_class, ()))
+            kept.appendleft(task_data)
+        self.tasks = kept
+        self.own_task_ids &= {id(task_data) for task_data in kept}
+        self.coalesce_at = max(self.coalesce_after, 2 * len(kept))
+
+    def _own_tasks(self) -> List:
+        return [
+            task_data
+            for task_data in self.tasks
+            if id(task_data) in self.own_task_ids
+        ]
+
+    def extend(self, tasks_to_send, own_tasks=()) -> bool:
+        """
+        own_tasks are the ones in tasks_to_send that were sent only to this
+        client. Returns False if the client fell too far behind and its
+        backlog was dropped (all but its own tasks), in which case it needs
+        resyncing
+        """
+        with self.lock:
+            self.tasks.extend(tasks_to_send)
+            self.own_task_ids.update(id(task_data) for task_data in own_tasks)
+            if len(self.tasks) > self.coalesce_at:
+                self._coalesce()
+            caught_up = len(self.tasks) <= self.max_tasks
+            if not caught_up:
+                self.tasks = deque(self._own_tasks())
+                self.coalesce_at = self.coalesce_after
+            self._update_waiting_since()
+            self.changed.notify_all()
+            return caught_up
+
+    def requeue(self, tasks_to_send):
+        """puts tasks we failed to send back at the front"""
+        with self.lock:
+            self.tasks.extendleft(reversed(tasks_to_send))
+            self._update_waiting_since()
+            self.changed.notify_all()
+
+    def reset(self, tasks_to_send):
+        """starts over from tasks_to_send, then any tasks of their own still queued"""
+        with self.lock:
+            self.tasks = deque(tasks_to_send) + deque(self._own_tasks())
+            self.coalesce_at = self.coalesce_after
+            self.waiting_since = None
+            self._update_waiting_since()
+            self.changed.notify_all()
+
+    def pop(self) -> Optional:
+        with self.lock:
+            task = self.tasks.popleft() if self.tasks else None
+            self.own_task_ids.discard(id(task))
+            self._update_waiting_since()
+            return task
+
+    def _take(self, limit: Optional[int]) -> List:
+        if limit is None or limit >= len(self.tasks):
+            taken = list(self.tasks)
+            self.tasks.clear()
+        else:
+            taken = [self.tasks.popleft() for _ in range(limit)]
+        if self.own_task_ids:
+            self.own_task_ids.difference_update(id(task_data) for task_data in taken)
+        self._update_waiting_since()
+        return taken
+
+    def drain(self, limit: Optional[int] = None) -> List:
+        """takes everything waiting, or the first limit tasks"""
+        with self.lock:
+            return self._take(limit)
+
+    def wait_and_drain(self, timeout=None, limit: Optional[int] = None) -> List:
+        """sleeps until there's something to send, or timeout or wake()"""
+        with self.changed:
+            if not self.tasks:
+                self.changed.wait(timeout)
+            return self._take(limit)
+
+    def wake(self):
+        with self.changed:
+            self.changed.notify_all()
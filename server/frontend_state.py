@@ -0,0 +1,112 @@
+from collections import deque
+from typing import Any, Dict, List, Optional
+from server.task_codec import TaskCodec
+from pyxel_ui.constants import LOG_TAIL_LINES
+from pyxel_ui.models import tasks
+
+"""
+Keeps what a frontend joining mid game needs to see, instead of every task
+ever sent to all frontends. Tasks that set state (the board, entities,
+characters, round info, log) are folded into the current state as they go
+by; everything else goes into a short tail of recent tasks so a new player
+still gets things like the prompt everyone's waiting on
+"""
+
+# recent tasks kept on top of the folded state
+MAX_TAIL_TASKS = 50
+
+
+class FrontendState:
+    def __init__(
+        self, max_tail_tasks: int = MAX_TAIL_TASKS, max_log_lines: int = LOG_TAIL_LINES
+    ):
+        self.codec = TaskCodec()
+        # the task that set up the current screen (board or plot screen)
+        self.screen_task = None
+        self.entities: Dict[int, dict] = {}
+        self.characters_task = None
+        self.round_info_task = None
+        # only the end of the log, like the frontend keeps. log_start is
+        # where log[0] is in the whole thing
+        self.max_log_lines = max_log_lines
+        self.log_start = 0
+        self.log: List[str] = []
+        self.tail = deque(maxlen=max_tail_tasks)
+
+    def _decode(self, task_data) -> Optional[Any]:
+        # anything that isn't an encoded task just gets replayed as is
+        if not isinstance(task_data, bytes):
+            return None
+        try:
+            return self.codec.decode_task(task_data)
+        except Exception:
+            return None
+
+    def _reset_screen(self, screen_task):
+        # the frontend builds all new views when it changes screens
+        self.screen_task = screen_task
+        self.entities = {}
+        self.characters_task = None
+        self.round_info_task = None
+        self.log_start = 0
+        self.log = []
+        self.tail.clear()
+
+    def add(self, task_data) -> None:
+        """fold in a task that was sent to all frontends"""
+        task = self._decode(task_data)
+        if isinstance(task, (tasks.BoardInitTask, tasks.LoadPlotScreen)):
+            self._reset_screen(task_data)
+        elif isinstance(task, tasks.AddEntitiesTask):
+            for entity in task.entities:
+                self.entities[entity["id"]] = dict(entity)
+        elif isinstance(task, tasks.ActionTask):
+            if task.entity_id in self.entities:
+                self.entities[task.entity_id]["position"] = tuple(task.to_grid_pos)
+        elif isinstance(task, tasks.RemoveEntityTask):
+            self.entities.pop(task.entity_id, None)
+        elif isinstance(task, tasks.LoadCharactersTask):
+            self.characters_task = task_data
+        elif isinstance(task, tasks.LoadRoundTurnInfoTask):
+            self.round_info_task = task_data
+        elif isinstance(task, tasks.LoadLogTask):
+            extra = max(len(task.log) - self.max_log_lines, 0)
+            self.log_start = task.start_index + extra
+            self.log = list(task.log[extra:])
+        elif isinstance(task, tasks.AppendLogTask):
+            # same rules as the frontend's LogView
+            appended = task.apply_to(self.log_start, self.log, self.max_log_lines)
+            if appended is not None:
+                self.log_start, self.log = appended
+        else:
+            self.tail.append(task_data)
+
+    def round_number(self) -> Optional[int]:
+        """the round the game's on, if it's said"""
+        task = self._decode(self.round_info_task)
+        return task.round_number if task is not None else None
+
+    def snapshot(self) -> List:
+        """the tasks that bring a new frontend up to date"""
+        snapshot = []
+        if self.screen_task is not None:
+            snapshot.append(self.screen_task)
+        if self.entities:
+            snapshot.append(
+                self.codec.encode_task(
+                    tasks.AddEntitiesTask(
+                        entities=[dict(entity) for entity in self.entities.values()]
+                    )
+                )
+            )
+        for task_data in (self.characters_task, self.round_info_task):
+            if task_data is not None:
+                snapshot.append(task_data)
+        if self.log or self.log_start:
+            snapshot.append(
+                self.codec.encode_task(
+                    tasks.LoadLogTask(list(self.log), self.log_start)
+                )
+            )
+        snapshot.extend(self.tail)
+        return snapshot
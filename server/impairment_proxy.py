@@ -0,0 +1,191 @@
+import queue
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+"""
+A TCP proxy that makes a local connection behave like a bad internet one:
+added latency, jitter, a bandwidth cap and the odd held up segment. Put it
+between clients and TCPServer to see how the game feels at a given RTT
+without leaving the box.
+
+TCP hands bytes over in order, so jitter and "reordering" can't shuffle
+data - a segment that arrives late holds up everything behind it, the same
+as a real connection waiting on a retransmit
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class Impairment:
+    # round trip time added, half each way
+    rtt_ms: float = 0.0
+    # each chunk's delay varies by up to this much either way
+    jitter_ms: float = 0.0
+    # per direction, None for no cap
+    bandwidth_kbps: Optional[float] = None
+    # chance a chunk (and whatever's queued behind it) gets held up
+    reorder_chance: float = 0.0
+    reorder_delay_ms: float = 0.0
+    seed: Optional[int] = None
+
+
+class _Pipe:
+    """one direction of a proxied connection"""
+
+    def __init__(self, source, destination, impairment: Impairment, on_done):
+        self.source = source
+        self.destination = destination
+        self.impairment = impairment
+        self.rng = random.Random(impairment.seed)
+        self.on_done = on_done
+        # (when to send, data) in the order it has to go
+        self.in_flight = queue.Queue()
+        # when the bandwidth cap lets the next chunk start going out
+        self.link_free_at = 0.0
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.writer = threading.Thread(target=self._write, daemon=True)
+
+    def start(self):
+        self.reader.start()
+        self.writer.start()
+
+    def _delay(self, now: float, size: int) -> float:
+        impairment = self.impairment
+        sent_at = now
+        if impairment.bandwidth_kbps:
+            # it can't start going out until what's ahead of it has
+            bytes_per_second = impairment.bandwidth_kbps * 1000 / 8
+            self.link_free_at = max(self.link_free_at, now) + size / bytes_per_second
+            sent_at = self.link_free_at
+        delay = impairment.rtt_ms / 2000
+        if impairment.jitter_ms:
+            delay += self.rng.uniform(-1, 1) * impairment.jitter_ms / 1000
+        if impairment.reorder_chance and self.rng.random() < impairment.reorder_chance:
+            delay += impairment.reorder_delay_ms / 1000
+        return sent_at + max(delay, 0)
+
+    def _read(self):
+        last_due = 0.0
+        while True:
+            try:
+                data = self.source.recv(CHUNK_SIZE)
+            except OSError:
+                data = b""
+            now = time.perf_counter()
+            if not data:
+                self.in_flight.put((max(now, last_due), None))
+                return
+            # nothing overtakes what was sent before it
+            last_due = max(self._delay(now, len(data)), last_due)
+            self.in_flight.put((last_due, data))
+
+    def _write(self):
+        try:
+            while True:
+                due, data = self.in_flight.get()
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                if data is None:
+                    self.destination.shutdown(socket.SHUT_WR)
+                    return
+                self.destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            self.on_done()
+
+
+class ImpairmentProxy:
+    def __init__(
+        self,
+        listen_port: int,
+        target_port: int,
+        impairment: Impairment = None,
+        target_host="localhost",
+        listen_host="localhost",
+    ):
+        """clients connect to listen_port and get passed through to target_port"""
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.target_host = target_host
+        self.impairment = impairment or Impairment()
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.bind((listen_host, listen_port))
+        self.listen_socket.listen(5)
+        self.listen_socket.settimeout(0.5)
+        self.connections: List[socket.socket] = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.accept_thread = None
+
+    def start(self):
+        self.running = True
+        self.accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self.accept_thread.start()
+
+    def _accept(self):
+        while self.running:
+            try:
+                client_socket, _ = self.listen_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            try:
+                server_socket = socket.create_connection(
+                    (self.target_host, self.target_port)
+                )
+            except OSError as e:
+                print(f"Proxy couldn't reach {self.target_port}: {str(e)}")
+                client_socket.close()
+                continue
+            self._connect(client_socket, server_socket)
+
+    def _connect(self, client_socket, server_socket):
+        for sock in (client_socket, server_socket):
+            # we're adding delay on purpose, don't let nagle add more
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        pipes_left = [2]
+
+        def pipe_done():
+            with self.lock:
+                pipes_left[0] -= 1
+                if pipes_left[0]:
+                    return
+            for sock in (client_socket, server_socket):
+                sock.close()
+
+        # each direction gets its own random stream so they don't move in step
+        seed = self.impairment.seed
+        pipes = [
+            _Pipe(client_socket, server_socket, self.impairment, pipe_done),
+            _Pipe(server_socket, client_socket, self.impairment, pipe_done),
+        ]
+        if seed is not None:
+            pipes[1].rng = random.Random(seed + 1)
+        with self.lock:
+            self.connections += [client_socket, server_socket]
+        for pipe in pipes:
+            pipe.start()
+
+    def stop(self):
+        self.running = False
+        if self.accept_thread is not None:
+            # the listening socket isn't really closed while accept() is on it
+            self.accept_thread.join()
+        self.listen_socket.close()
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from server.backend_transport import InProcessTransport
+from server.impairment_proxy import Impairment, ImpairmentProxy
+from server.task_codec import TaskCodec
+from server.tcp_client import TCPClient, ClientType
+from server.tcp_server import TCPServer
+from pyxel_ui.constants import POLL_INTERVAL, POLL_INTERVAL_SUBSCRIBED
+from pyxel_ui.models import tasks
+
+"""
+Measures how long a backend action takes to show up on a player's screen
+when the player's connection has a given RTT. The server and backend run
+together like backend_main, and a frontend that runs PyxelEngine's frame
+loop (without drawing anything) connects through an ImpairmentProxy.
+
+Two numbers per scenario:
+ - action to pixels: backend posts an ActionTask -> the frame that performs it ends
+ - input to pixels: player answers a prompt -> the next action's frame ends,
+   which is what playing the game feels like
+"""
+
+# pyxel's default frame rate, which PyxelEngine runs at
+ENGINE_FPS = 30
+# the RTTs worth comparing: close by, across the country, across the world
+DEFAULT_RTTS_MS = (20, 80, 200)
+
+
+@dataclass
+class ScenarioResult:
+    impairment: Impairment
+    subscribe: bool
+    action_to_pixels: List[float] = field(default_factory=list)
+    input_to_pixels: List[float] = field(default_factory=list)
+
+    @staticmethod
+    def _percentile(samples: List[float], q: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """p50/p99 of each measurement, in ms"""
+        summary = {}
+        for name in ("action_to_pixels", "input_to_pixels"):
+            samples = getattr(self, name)
+            for q in (0.5, 0.99):
+                value = self._percentile(samples, q)
+                summary[f"{name}_p{int(q * 100)}"] = (
+                    None if value is None else value * 1000
+                )
+        return summary
+
+
+class FrameLoopFrontend:
+    """
+    PyxelEngine.update without pyxel: once a frame it takes pushed tasks,
+    polls every so often and performs one task. A task is on screen when
+    the frame that performed it ends
+    """
+
+    def __init__(self, port: int, subscribe=True):
+        self.client = TCPClient(ClientType.FRONTEND, port=port)
+        if subscribe:
+            self.client.subscribe()
+        self.codec = TaskCodec()
+        self.task_queue = deque()
+        # entity id of each ActionTask -> when it was on screen
+        self.shown_at: Dict[int, float] = {}
+        self.answered_at: List[float] = []
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        frame_time = 1 / ENGINE_FPS
+        loop_num = 1
+        try:
+            while self.running:
+                frame_start = time.perf_counter()
+                self.task_queue.extend(self.client.get_pushed_tasks())
+                poll_interval = (
+                    POLL_INTERVAL_SUBSCRIBED
+                    if self.client.is_subscribed
+                    else POLL_INTERVAL
+                )
+                if loop_num % poll_interval == 0:
+                    self.task_queue.extend(self.client.get_all_tasks())
+                    loop_num = 0
+                if self.task_queue:
+                    task = self.codec.decode_task(self.task_queue.popleft())
+                    if isinstance(task, tasks.ActionTask):
+                        # polling can make the frame run long, so it ends
+                        # whenever the frame's work is done or on schedule
+                        self.shown_at[task.entity_id] = max(
+                            time.perf_counter(), frame_start + frame_time
+                        )
+                    elif isinstance(task, tasks.InputTask):
+                        self.client.post_user_input("1")
+                        self.answered_at.append(time.perf_counter())
+                loop_num += 1
+                wait = frame_start + frame_time - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+        except ConnectionError:
+            return
+
+    def wait_until_shown(self, entity_id: int, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while entity_id not in self.shown_at:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2)
+        self.client.close()
+
+
+def run_scenario(
+    impairment: Impairment,
+    turns: int = 30,
+    subscribe=True,
+    server_port: int = 9100,
+    proxy_port: int = 9101,
+) -> ScenarioResult:
+    """plays turns of action then prompt with one player behind the proxy"""
+    result = ScenarioResult(impairment, subscribe)
+    codec = TaskCodec()
+    server = TCPServer(port=server_port)
+    server.start()
+    proxy = ImpairmentProxy(proxy_port, server_port, impairment)
+    proxy.start()
+    frontend = None
+    try:
+        frontend = FrameLoopFrontend(proxy_port, subscribe)
+        frontend.thread.start()
+        if not server.wait_for_frontends(1, timeout=30):
+            raise ConnectionError("frontend never joined")
+        backend = InProcessTransport(server)
+
+        for turn in range(turns):
+            posted_at = time.perf_counter()
+            action = tasks.ActionTask(turn, (0, 0), (0, 1), 0)
+            prompt = tasks.InputTask("Hit enter to continue.", single_keystroke=True)
+            backend.post_tasks(
+                [
+                    (codec.encode_task(action), "ALL_FRONTEND"),
+                    (codec.encode_task(prompt), "ALL_FRONTEND"),
+                ]
+            )
+            if frontend.wait_until_shown(turn, timeout=30):
+                result.action_to_pixels.append(frontend.shown_at[turn] - posted_at)
+            if turn > 0 and turn in frontend.shown_at:
+                result.input_to_pixels.append(
+                    frontend.shown_at[turn] - frontend.answered_at[turn - 1]
+                )
+            if backend.get_user_input() is None:
+                break
+    finally:
+        if frontend is not None:
+            frontend.stop()
+        proxy.stop()
+        server.stop()
+    return result
+
+
+def run_scenarios(
+    rtts_ms=DEFAULT_RTTS_MS,
+    turns: int = 30,
+    subscribe=True,
+    server_port: int = 9100,
+    proxy_port: int = 9101,
+    **impairment,
+) -> List[ScenarioResult]:
+    """run_scenario at each RTT, the rest of the impairment staying the same"""
+    return [
+        run_scenario(
+            Impairment(rtt_ms=rtt_ms, **impairment),
+            turns=turns,
+            subscribe=subscribe,
+            server_port=server_port,
+            proxy_port=proxy_port,
+        )
+        for rtt_ms in rtts_ms
+    ]
+
+
+def to_text(results: List[ScenarioResult]) -> str:
+    columns = (
+        "action_to_pixels_p50",
+        "action_to_pixels_p99",
+        "input_to_pixels_p50",
+        "input_to_pixels_p99",
+    )
+    lines = [f"{'rtt ms':>8}{'mode':>12}" + "".join(f"{c:>24}" for c in columns)]
+    for result in results:
+        summary = result.summary()
+        mode = "subscribed" if result.subscribe else "polling"
+        cells = "".join(
+            f"{'-' if summary[c] is None else f'{summary[c]:.1f}':>24}"
+            for c in columns
+        )
+        lines.append(f"{result.impairment.rtt_ms:>8g}{mode:>12}{cells}")
+    return "\n".join(lines)
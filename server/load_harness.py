@@ -0,0 +1,331 @@
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from server.backend_transport import InProcessTransport
+from server.server_metrics import LatencyHistogram
+from server.task_codec import TaskCodec
+from server.tcp_client import TCPClient, ClientType
+from server.tcp_server import TCPServer
+from pyxel_ui.models import tasks
+
+"""
+Puts TCPServer under load without real players. Every game runs in its own
+process - a TCPServer plus a synthetic backend that plays turns the way
+PyxelManager does - while bot frontends in this process read their tasks
+and answer every input prompt straight away. Reports throughput, latency
+per command and how much cpu each game took, so server changes can be
+compared before they're deployed
+"""
+
+# tasks the backend sends in a turn, before asking the acting player for input.
+# roughly what a PyxelManager turn looks like: a few moves, log lines and
+# character updates, then the new turn info
+TASK_MIX = {
+    "move": 3,
+    "log": 4,
+    "characters": 2,
+    "round_info": 1,
+    "personal_log": 1,
+}
+# every this many turns the prompt is a mouse prompt with reachable tiles
+MOUSE_PROMPT_EVERY = 2
+# how long a game waits for its bots to connect
+JOIN_TIMEOUT = 30
+# how long we wait on a game to finish its turns before giving up on it
+GAME_TIMEOUT = 600
+
+
+@dataclass
+class LoadTestConfig:
+    games: int = 1
+    frontends_per_game: int = 3
+    turns: int = 100
+    # bot frontends subscribe to pushes, or poll every poll_interval
+    subscribe: bool = True
+    poll_interval: float = 0.05
+    base_port: int = 9000
+    # the backend runs next to its server like backend_main, or over tcp
+    in_process_backend: bool = True
+    task_mix: Dict[str, int] = field(default_factory=lambda: dict(TASK_MIX))
+    seed: int = 0
+
+
+def make_turn_tasks(turn: int, task_mix: Dict[str, int], rng: random.Random):
+    """the broadcast tasks for one turn of a synthetic game"""
+    turn_tasks = []
+    for _ in range(task_mix.get("move", 0)):
+        x, y = rng.randrange(10), rng.randrange(10)
+        turn_tasks.append(tasks.ActionTask(rng.randrange(1, 6), (x, y), (x, y + 1), 0))
+    for i in range(task_mix.get("log", 0)):
+        line_index = turn * task_mix["log"] + i
+        turn_tasks.append(
+            tasks.AppendLogTask(line_index, [f"line {line_index} of the log"])
+        )
+    for _ in range(task_mix.get("characters", 0)):
+        turn_tasks.append(
+            tasks.LoadCharactersTask(
+                [rng.randrange(10) for _ in range(5)],
+                [10] * 5,
+                ["wizard", "skeleton", "monk", "ghost", "fiend"],
+                [False, True, False, True, True],
+            )
+        )
+    for _ in range(task_mix.get("round_info", 0)):
+        turn_tasks.append(tasks.LoadRoundTurnInfoTask(turn, "wizard"))
+    for _ in range(task_mix.get("personal_log", 0)):
+        turn_tasks.append(tasks.AddToPersonalLog(f"turn {turn}", False))
+    return turn_tasks
+
+
+def make_prompt(turn: int, rng: random.Random):
+    if turn % MOUSE_PROMPT_EVERY:
+        return tasks.InputTask("Hit enter to continue.", single_keystroke=True)
+    reachable = [(rng.randrange(10), rng.randrange(10)) for _ in range(8)]
+    return tasks.MouseInputTask(
+        "Pick where to move",
+        reachable_positions=reachable,
+        reachable_paths={position: [position] for position in reachable},
+    )
+
+
+class TimedCalls:
+    """client side latency of every call, per command"""
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+
+    def call(self, command, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.histograms[command].observe(time.perf_counter() - start)
+        return result
+
+    def states(self):
+        return {
+            command: histogram.state()
+            for command, histogram in self.histograms.items()
+        }
+
+
+class SyntheticBackend:
+    def __init__(self, transport, frontend_ids: List[str], config: LoadTestConfig):
+        self.transport = transport
+        self.frontend_ids = frontend_ids
+        self.config = config
+        self.codec = TaskCodec()
+        self.rng = random.Random(config.seed)
+        self.timed = TimedCalls()
+        self.tasks_posted = 0
+
+    def run(self):
+        for turn in range(self.config.turns):
+            acting_id = self.frontend_ids[turn % len(self.frontend_ids)]
+            to_post = [
+                (self.codec.encode_task(task), "ALL_FRONTEND")
+                for task in make_turn_tasks(turn, self.config.task_mix, self.rng)
+            ]
+            prompt = make_prompt(turn, self.rng)
+            to_post.append((self.codec.encode_task(prompt), acting_id))
+            self.timed.call("post_tasks", self.transport.post_tasks, to_post)
+            self.tasks_posted += len(to_post)
+
+            # what a player sees as lag: prompt sent to answer back
+            user_input = self.timed.call(
+                "input_round_trip", self.transport.get_user_input
+            )
+            if user_input is None:
+                print(f"Server went away on turn {turn}")
+                return
+
+
+class BotFrontend:
+    """a player that answers every prompt it's sent straight away"""
+
+    def __init__(self, port: int, config: LoadTestConfig):
+        self.config = config
+        self.client = TCPClient(ClientType.FRONTEND, port=port)
+        if config.subscribe:
+            self.client.subscribe()
+        self.codec = TaskCodec()
+        self.timed = TimedCalls()
+        self.tasks_received = 0
+        self.inputs_sent = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def _answer(self, task):
+        if isinstance(task, tasks.MouseInputTask) and task.reachable_positions:
+            x, y = task.reachable_positions[0]
+            answer = f"{x},{y}"
+        else:
+            answer = "1"
+        self.timed.call("post_user_input", self.client.post_user_input, answer)
+        self.inputs_sent += 1
+
+    def run(self):
+        try:
+            while self.running:
+                if self.config.subscribe:
+                    # the real frontend checks for pushed tasks once a frame
+                    received = self.client.get_pushed_tasks()
+                    if not self.client.is_subscribed:
+                        return
+                else:
+                    received = self.timed.call(
+                        "get_all_tasks", self.client.get_all_tasks
+                    )
+                for task_data in received:
+                    self.tasks_received += 1
+                    task = self.codec.decode_task(task_data)
+                    if isinstance(task, (tasks.InputTask, tasks.MouseInputTask)):
+                        self._answer(task)
+                time.sleep(self.config.poll_interval if not received else 0)
+        except ConnectionError:
+            return
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2)
+        self.client.close()
+
+
+def run_game(port: int, config: LoadTestConfig, ready, results):
+    """one game's process: its server and synthetic backend"""
+    server = TCPServer(port=port, max_players=config.frontends_per_game)
+    server.start()
+    ready.set()
+    try:
+        if not server.wait_for_frontends(config.frontends_per_game, JOIN_TIMEOUT):
+            results.put({"port": port, "error": "bots never joined"})
+            return
+        frontend_ids = sorted(
+            client_id for client_id in server.clients if client_id != "backend"
+        )
+        if config.in_process_backend:
+            transport = InProcessTransport(server)
+        else:
+            transport = TCPClient(ClientType.BACKEND, port=port)
+
+        start_cpu, start = os.times(), time.perf_counter()
+        backend = SyntheticBackend(transport, frontend_ids, config)
+        backend.run()
+        end_cpu = os.times()
+        results.put(
+            {
+                "port": port,
+                "wall_seconds": time.perf_counter() - start,
+                "cpu_seconds": (end_cpu.user - start_cpu.user)
+                + (end_cpu.system - start_cpu.system),
+                "tasks_posted": backend.tasks_posted,
+                "backend_latency": backend.timed.states(),
+                "server_stats": server.get_stats(),
+            }
+        )
+    finally:
+        server.stop()
+
+
+@dataclass
+class LoadTestReport:
+    config: LoadTestConfig
+    wall_seconds: float = 0.0
+    games: List[Dict] = field(default_factory=list)
+    tasks_received: int = 0
+    inputs_sent: int = 0
+    latency: Dict[str, LatencyHistogram] = field(
+        default_factory=lambda: defaultdict(LatencyHistogram)
+    )
+    errors: List[str] = field(default_factory=list)
+
+    def add_latencies(self, states: Dict):
+        for command, state in states.items():
+            self.latency[command].merge(state)
+
+    def to_text(self) -> str:
+        mode = "subscribed" if self.config.subscribe else "polling"
+        lines = [
+            f"{len(self.games)} games x {self.config.frontends_per_game} {mode} "
+            f"frontends, {self.config.turns} turns each, "
+            f"{self.wall_seconds:.2f}s",
+            f"tasks delivered: {self.tasks_received} "
+            f"({self.tasks_received / max(self.wall_seconds, 1e-9):.0f}/s)",
+            f"inputs answered: {self.inputs_sent} "
+            f"({self.inputs_sent / max(self.wall_seconds, 1e-9):.0f}/s)",
+            "",
+            f"{'command':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}",
+        ]
+        for command, histogram in sorted(self.latency.items()):
+            lines.append(
+                f"{command:<20}{histogram.count:>8}"
+                f"{_ms(histogram.quantile(0.5)):>10}{_ms(histogram.quantile(0.99)):>10}"
+            )
+        lines += ["", f"{'game port':<12}{'cpu s':>8}{'wall s':>8}{'cpu %':>8}"]
+        for game in self.games:
+            cpu_percent = 100 * game["cpu_seconds"] / max(game["wall_seconds"], 1e-9)
+            lines.append(
+                f"{game['port']:<12}{game['cpu_seconds']:>8.2f}"
+                f"{game['wall_seconds']:>8.2f}{cpu_percent:>8.1f}"
+            )
+        lines += [f"error: {error}" for error in self.errors]
+        return "\n".join(lines)
+
+
+def _ms(seconds: Optional[float]) -> str:
+    """histograms give bucket bounds, so this is an upper bound"""
+    if seconds is None:
+        return "-"
+    return "inf" if seconds == float("inf") else f"<{seconds * 1000:g}"
+
+
+def run_load_test(config: LoadTestConfig) -> LoadTestReport:
+    report = LoadTestReport(config)
+    results = multiprocessing.Queue()
+    games = []
+    for i in range(config.games):
+        port = config.base_port + i
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=run_game, args=(port, config, ready, results), daemon=True
+        )
+        process.start()
+        games.append((port, process, ready))
+
+    start = time.perf_counter()
+    bots = []
+    for port, process, ready in games:
+        if not ready.wait(JOIN_TIMEOUT):
+            report.errors.append(f"game on port {port} never started")
+            continue
+        for _ in range(config.frontends_per_game):
+            bots.append(BotFrontend(port, config))
+    for bot in bots:
+        bot.thread.start()
+
+    for _ in games:
+        try:
+            result = results.get(timeout=GAME_TIMEOUT)
+        except queue.Empty:
+            report.errors.append("a game never finished")
+            break
+        if "error" in result:
+            report.errors.append(f"game on port {result['port']}: {result['error']}")
+            continue
+        report.games.append(result)
+        report.add_latencies(result["backend_latency"])
+    report.wall_seconds = time.perf_counter() - start
+
+    for bot in bots:
+        bot.stop()
+        report.tasks_received += bot.tasks_received
+        report.inputs_sent += bot.inputs_sent
+        report.add_latencies(bot.timed.states())
+    for _, process, _ in games:
+        process.join(timeout=5)
+    report.games.sort(key=lambda game: game["port"])
+    return report
@@ -0,0 +1,234 @@
+import bisect
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+from server.server_utils import receive_message, send_message
+
+"""
+Counters for how a game server is doing: how long each command takes, how
+long clients' tasks sit waiting, bytes in and out and time spent waiting on
+the server lock. Cheap enough to leave on all the time. Read them from the
+box the game runs on with fetch_stats, as json or as prometheus text
+"""
+
+# upper bounds, in seconds. get_user_input waits on players so it goes high
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+)
+# anything else gets counted as "unknown", so junk can't add labels forever
+TRACKED_COMMANDS = (
+    "get_task",
+    "get_all_tasks",
+    "post_task",
+    "post_tasks",
+    "get_user_input",
+    "post_user_input",
+)
+METRIC_PREFIX = "drudgeford"
+
+
+def quantile_from_counts(
+    counts: List[int], q: float, buckets=LATENCY_BUCKETS
+) -> Optional[float]:
+    """
+    upper bound of the bucket the q'th observation falls in, from a
+    histogram's counts (or the difference between two of them)
+    """
+    count = sum(counts)
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for bound, bucket_count in zip(buckets, counts):
+        seen += bucket_count
+        if seen >= rank:
+            return bound
+    return float("inf")
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # the last count is for anything over the biggest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+
+    def state(self) -> tuple[List[int], float]:
+        """plain data version of the counts, for sending to another process"""
+        with self.lock:
+            return list(self.counts), self.total
+
+    def merge(self, state: tuple[List[int], float]):
+        """adds in the counts from another histogram's state()"""
+        counts, total = state
+        with self.lock:
+            for i, bucket_count in enumerate(counts):
+                self.counts[i] += bucket_count
+            self.count += sum(counts)
+            self.total += total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """upper bound of the bucket the q'th observation falls in"""
+        with self.lock:
+            counts = list(self.counts)
+        return quantile_from_counts(counts, q, self.buckets)
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            # per bucket of LATENCY_BUCKETS, so readers can work out recent ones
+            "counts": list(self.counts),
+        }
+
+    def to_prometheus(self, name: str, labels: str = "") -> List[str]:
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.total
+        separator = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(
+                f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+
+class ServerMetrics:
+    def __init__(self):
+        self.start_time = time.time()
+        self.command_latency = {
+            command: LatencyHistogram() for command in TRACKED_COMMANDS + ("unknown",)
+        }
+        self.lock_wait = LatencyHistogram()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.tasks_posted = 0
+        self.byte_lock = threading.Lock()
+
+    def observe_command(self, command: str, seconds: float):
+        histogram = self.command_latency.get(command) or self.command_latency["unknown"]
+        histogram.observe(seconds)
+
+    def observe_lock_wait(self, seconds: float):
+        self.lock_wait.observe(seconds)
+
+    def add_bytes(self, received: int = 0, sent: int = 0):
+        with self.byte_lock:
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def add_tasks(self, posted: int):
+        with self.byte_lock:
+            self.tasks_posted += posted
+
+    def to_dict(
+        self,
+        clients: Dict[str, Dict],
+        spectators: Dict = None,
+        round_number: Optional[int] = None,
+    ) -> Dict:
+        """
+        clients is client id -> queue_depth, queue_age and the like,
+        spectators is their count and bytes_sent, round_number the game's
+        """
+        return {
+            "uptime": time.time() - self.start_time,
+            "round": round_number,
+            "tasks_posted": self.tasks_posted,
+            "commands": {
+                command: histogram.to_dict()
+                for command, histogram in self.command_latency.items()
+                if histogram.count
+            },
+            "lock_wait": self.lock_wait.to_dict(),
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "clients": clients,
+            "spectators": spectators or {"count": 0, "bytes_sent": 0},
+        }
+
+    def to_prometheus(self, clients: Dict[str, Dict], spectators: Dict = None) -> str:
+        spectators = spectators or {"count": 0, "bytes_sent": 0}
+        prefix = METRIC_PREFIX
+        lines = [
+            f"# TYPE {prefix}_uptime_seconds gauge",
+            f"{prefix}_uptime_seconds {time.time() - self.start_time}",
+            f"# TYPE {prefix}_command_seconds histogram",
+        ]
+        for command, histogram in self.command_latency.items():
+            lines += histogram.to_prometheus(
+                f"{prefix}_command_seconds", f'command="{command}"'
+            )
+        lines.append(f"# TYPE {prefix}_lock_wait_seconds histogram")
+        lines += self.lock_wait.to_prometheus(f"{prefix}_lock_wait_seconds")
+        lines += [
+            f"# TYPE {prefix}_received_bytes_total counter",
+            f"{prefix}_received_bytes_total {self.bytes_received}",
+            f"# TYPE {prefix}_sent_bytes_total counter",
+            f"{prefix}_sent_bytes_total {self.bytes_sent}",
+            f"# TYPE {prefix}_posted_tasks_total counter",
+            f"{prefix}_posted_tasks_total {self.tasks_posted}",
+            f"# TYPE {prefix}_clients gauge",
+            f"{prefix}_clients {len(clients)}",
+            f"# TYPE {prefix}_spectators gauge",
+            f"{prefix}_spectators {spectators['count']}",
+            f"# TYPE {prefix}_spectator_sent_bytes_total counter",
+            f"{prefix}_spectator_sent_bytes_total {spectators['bytes_sent']}",
+        ]
+        for stat in ("queue_depth", "queue_age_seconds"):
+            lines.append(f"# TYPE {prefix}_client_{stat} gauge")
+            for client_id, client_stats in clients.items():
+                lines.append(
+                    f'{prefix}_client_{stat}{{client="{client_id}"}} '
+                    f"{client_stats[stat]}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def fetch_stats(port: int, host="localhost", stats_format="json", timeout=5):
+    """
+    Asks the game server on port for its metrics. stats_format is "json"
+    (returns a dict) or "prometheus" (returns the text). Only works from
+    the box the server runs on
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        send_message(sock, {"stats": stats_format})
+        response = receive_message(sock)
+    if "error" in response:
+        raise ConnectionError(f"Couldn't get stats: {response['error']}")
+    return response["stats"]
@@ -1,71 +1,220 @@
+import asyncio
 import socket
 import json
 from enum import Enum
 
 
+# bytes in a message are sent raw after the json and this marks where they go
+FRAME_KEY = "__frame__"
+MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
+# what a FramedConnection starts out reading into, it grows for bigger messages
+RECV_BUFFER_SIZE = 64 * 1024
+# sendmsg takes at most this many buffers at once on most systems
+MAX_SEND_BUFFERS = 1024
+# what a parked backend prints once its imports are done
+PARKED_READY = "parked"
+
+
 def send_message(sock: socket.socket, data: dict):
-    """Send a message with length prefix in a single send"""
-    message = json.dumps(data).encode("utf-8")
-    length_bytes = len(message).to_bytes(4, byteorder="big")
-    sock.send(length_bytes + message)  # Send length and message together
+    """Send a message with length prefix, without joining its parts first"""
+    send_parts(sock, encode_message_parts(data))
+
+
+def send_parts(sock: socket.socket, parts: list) -> int:
+    """sends the buffers one after another, returns how many bytes that was"""
+    total = sum(len(part) for part in parts)
+    if not hasattr(sock, "sendmsg") or len(parts) > MAX_SEND_BUFFERS:
+        # no scatter-gather on windows
+        sock.sendall(b"".join(parts))
+        return total
+    sent = sock.sendmsg(parts)
+    if sent < total:
+        # the socket buffer filled up part way through
+        sock.sendall(b"".join(parts)[sent:])
+    return total
+
+
+def encode_message(data: dict) -> bytes:
+    """Length prefixed message ready to go on the wire"""
+    return b"".join(encode_message_parts(data))
+
+
+def encode_message_parts(data: dict) -> list:
+    """
+    encode_message as a list of buffers to send one after another.
+    Any bytes values in data (like encoded tasks) go after the json as
+    length prefixed frames instead of being encoded into it
+    """
+    frames = []
+
+    def add_frame(value):
+        if isinstance(value, (bytes, bytearray)):
+            frames.append(value)
+            return {FRAME_KEY: len(frames) - 1}
+        raise TypeError(f"Can't send {type(value).__name__}")
+
+    header = json.dumps(data, default=add_frame, separators=(",", ":")).encode(
+        "utf-8"
+    )
+    parts = [None, len(header).to_bytes(4, byteorder="big"), header]
+    message_length = 4 + len(header)
+    for frame in frames:
+        parts.append(len(frame).to_bytes(4, byteorder="big"))
+        parts.append(frame)
+        message_length += 4 + len(frame)
+    parts[0] = message_length.to_bytes(4, byteorder="big")
+    return parts
 
 
 def receive_message(sock: socket.socket) -> dict:
     """Receive a complete message using length prefix"""
     try:
-        # Get initial data that should contain length
-        initial_data = sock.recv(4)
-        if not initial_data or len(initial_data) < 4:
+        initial_data = recv_all(sock, 4)
+        if not initial_data:
             raise ConnectionError("Connection closed")
 
         message_length = int.from_bytes(initial_data, byteorder="big")
-        MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
         if message_length > MAX_MESSAGE_SIZE:
             raise ConnectionError(f"Message too large: {message_length} bytes")
 
-        remaining_data = b""
-
-        # If we got extra data beyond the length, keep it
-        if len(initial_data) > 4:
-            remaining_data = initial_data[4:]
-            message_length -= len(remaining_data)
-
-        # Get any remaining message data
-        if message_length > 0:
-            message_data = recv_all(sock, message_length)
-            if not message_data:
-                raise ConnectionError("Connection closed")
-            remaining_data += message_data
-
-        return json.loads(remaining_data.decode("utf-8"))
+        message_data = recv_all(sock, message_length)
+        if not message_data:
+            raise ConnectionError("Connection closed")
+        return decode_message(message_data)
     except Exception as e:
         raise ConnectionError(f"Error receiving message: {str(e)}")
 
 
-def recv_all(sock: socket.socket, n: int) -> bytes:
-    """Receive exactly n bytes, optimized for fewer recv calls"""
-    # Try to get all data at once first
-    data = sock.recv(n)
-    if not data:
-        return None
-
-    if len(data) == n:  # Got everything in one call
-        return data
+async def read_message(reader: asyncio.StreamReader) -> dict:
+    """receive_message for asyncio streams"""
+    try:
+        initial_data = await reader.readexactly(4)
+        message_length = int.from_bytes(initial_data, byteorder="big")
+        if message_length > MAX_MESSAGE_SIZE:
+            raise ConnectionError(f"Message too large: {message_length} bytes")
+        return decode_message(await reader.readexactly(message_length))
+    except Exception as e:
+        raise ConnectionError(f"Error receiving message: {str(e)}")
 
-    # If we didn't get everything, then accumulate the rest
-    buffer = bytearray(data)
-    remaining = n - len(data)
 
-    while remaining > 0:
-        chunk = sock.recv(remaining)
-        if not chunk:
+def decode_message(message_data) -> dict:
+    """Splits a message body (bytes or a memoryview) back into its json and frames"""
+    message = memoryview(message_data)
+    header_length = int.from_bytes(message[:4], byteorder="big")
+    header = message[4 : 4 + header_length]
+    pos = 4 + header_length
+    frames = []
+    while pos < len(message):
+        frame_length = int.from_bytes(message[pos : pos + 4], byteorder="big")
+        pos += 4
+        frames.append(bytes(message[pos : pos + frame_length]))
+        pos += frame_length
+
+    if not frames:
+        return json.loads(str(header, "utf-8"))
+
+    def restore_frame(obj):
+        if len(obj) == 1 and FRAME_KEY in obj:
+            return frames[obj[FRAME_KEY]]
+        return obj
+
+    return json.loads(str(header, "utf-8"), object_hook=restore_frame)
+
+
+def recv_all(sock: socket.socket, n: int) -> bytearray:
+    """Receive exactly n bytes straight into one buffer"""
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    received = 0
+    while received < n:
+        chunk_size = sock.recv_into(view[received:])
+        if not chunk_size:
             return None
-        buffer.extend(chunk)
-        remaining -= len(chunk)
-
-    return bytes(buffer)
+        received += chunk_size
+    return buffer
+
+
+class FramedConnection:
+    """
+    Sends and receives length prefixed messages on a socket that's used for
+    more than one message. Reads go into one reusable buffer, as much as
+    the socket has each time, so a burst of messages is parsed out of a
+    single recv instead of two recvs and a couple of copies per message.
+    Only safe to read from one thread at a time
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = RECV_BUFFER_SIZE):
+        self.socket = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        # unread data is buffer[start:end]
+        self.start = 0
+        self.end = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def send_message(self, data: dict):
+        self.bytes_sent += send_parts(self.socket, encode_message_parts(data))
+
+    def has_buffered_message(self) -> bool:
+        """if the next receive_message can return without reading the socket"""
+        available = self.end - self.start
+        if available < 4:
+            return False
+        length = int.from_bytes(self.view[self.start : self.start + 4], "big")
+        return available >= 4 + length
+
+    def _next_message(self):
+        """the next whole message body in the buffer, and how much to read if none"""
+        available = self.end - self.start
+        if available < 4:
+            return None, 4
+        length = int.from_bytes(self.view[self.start : self.start + 4], "big")
+        if length > MAX_MESSAGE_SIZE:
+            raise ConnectionError(f"Message too large: {length} bytes")
+        if available < 4 + length:
+            return None, 4 + length
+        body = self.view[self.start + 4 : self.start + 4 + length]
+        self.start += 4 + length
+        if self.start == self.end:
+            # the body gets decoded before anything new is read in
+            self.start = self.end = 0
+        return body, 0
+
+    def _fill(self, needed: int):
+        """reads whatever the socket has, making room for needed unread bytes"""
+        if self.start + needed > len(self.buffer):
+            unread = self.end - self.start
+            if needed > len(self.buffer):
+                buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                buffer[:unread] = self.view[self.start : self.end]
+                self.view.release()
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                self.buffer[:unread] = self.buffer[self.start : self.end]
+            self.start, self.end = 0, unread
+        received = self.socket.recv_into(self.view[self.end :])
+        if not received:
+            raise ConnectionError("Connection closed")
+        self.end += received
+        self.bytes_received += received
+
+    def receive_message(self) -> dict:
+        try:
+            while True:
+                body, needed = self._next_message()
+                if body is not None:
+                    return decode_message(body)
+                self._fill(needed)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            raise ConnectionError(f"Error receiving message: {str(e)}")
 
 
 class ClientType(Enum):
     BACKEND = "backend"
     FRONTEND = "frontend"
+    # read only, gets the game streamed to it
+    SPECTATOR = "spectator"
@@ -0,0 +1,258 @@
+import selectors
+import socket
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from server.frontend_state import FrontendState
+from server.server_utils import encode_message, send_message
+
+"""
+Streams a game to read-only spectators. Every batch of tasks sent to all
+frontends is encoded into frames once and kept in a log everyone shares.
+A single thread copies those same bytes to every spectator's socket, so
+posting costs the same however many are watching and a slow watcher only
+holds up itself. One that falls so far behind its next frame has left the
+log starts over from a snapshot of the game
+"""
+
+# watchers per game
+MAX_SPECTATORS = 500
+# frames kept for spectators that are behind
+MAX_LOG_FRAMES = 1000
+# keeps frames under the max message size
+MAX_TASKS_PER_FRAME = 100
+# how long the writer sleeps with nothing to do before checking we're running
+IDLE_WAIT_SECONDS = 0.5
+
+
+def encode_frames(tasks: List) -> List[bytes]:
+    """tasks as ready to send {"tasks": [...]} messages, like a push connection's"""
+    return [
+        encode_message({"tasks": tasks[i : i + MAX_TASKS_PER_FRAME]})
+        for i in range(0, len(tasks), MAX_TASKS_PER_FRAME)
+    ]
+
+
+@dataclass
+class Spectator:
+    socket: socket.socket
+    spectator_id: str
+    # number of the next log frame they get
+    next_frame: int
+    # frames just for them (their snapshot), sent before the log
+    own_frames: deque = field(default_factory=deque)
+    # what's left to send of the frame in progress
+    pending: memoryview = memoryview(b"")
+
+
+class SpectatorStream:
+    def __init__(
+        self,
+        frontend_state: FrontendState,
+        state_lock: threading.Lock,
+        max_spectators: int = MAX_SPECTATORS,
+        max_log_frames: int = MAX_LOG_FRAMES,
+    ):
+        """
+        frontend_state is the game spectators get snapshots of and state_lock
+        the lock it's changed under. publish has to be called with
+        state_lock held, right after the tasks are folded in
+        """
+        self.frontend_state = frontend_state
+        self.state_lock = state_lock
+        self.max_spectators = max_spectators
+        self.max_log_frames = max_log_frames
+        # the log, frames[0] is frame number first_frame
+        self.frames = deque()
+        self.first_frame = 0
+        self.lock = threading.Lock()
+        # socket fd -> spectator, only changed under self.lock
+        self.spectators: Dict[int, Spectator] = {}
+        self.spectator_counter = 0
+        self.bytes_sent = 0
+        self.selector = selectors.DefaultSelector()
+        # written to when there's something new, so the writer stops waiting
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        return len(self.spectators)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _wake(self):
+        try:
+            self.wake_writer.send(b"\0")
+        except BlockingIOError:
+            pass  # it's already been woken
+
+    def publish(self, tasks: List):
+        """adds tasks sent to all frontends to the stream, caller holds state_lock"""
+        if not tasks:
+            return
+        with self.lock:
+            if not self.spectators:
+                # nobody to send them to, and a joiner gets a snapshot anyway
+                self.first_frame += len(self.frames)
+                self.frames.clear()
+                return
+            for frame in encode_frames(tasks):
+                self.frames.append(frame)
+            while len(self.frames) > self.max_log_frames:
+                self.frames.popleft()
+                self.first_frame += 1
+        self._wake()
+
+    def _catch_up(self, spectator: Spectator, joining=False):
+        """queues a snapshot for them and moves them to the end of the log"""
+        with self.state_lock:
+            # queued before they're registered so nothing goes out ahead of it
+            spectator.own_frames.extend(encode_frames(self.frontend_state.snapshot()))
+            with self.lock:
+                spectator.next_frame = self.first_frame + len(self.frames)
+                if joining:
+                    # in the same go, so publish can't drop frames they need
+                    self.spectators[spectator.socket.fileno()] = spectator
+                    # spectators never write to us, so anything readable
+                    # means they hung up
+                    self.selector.register(
+                        spectator.socket,
+                        selectors.EVENT_READ | selectors.EVENT_WRITE,
+                        spectator,
+                    )
+
+    def add(self, client_socket: socket.socket) -> Optional[str]:
+        """
+        Takes over a spectator's connection and starts streaming the game to
+        it. Returns their id, or None if they were turned away
+        """
+        with self.lock:
+            if len(self.spectators) >= self.max_spectators:
+                spectator_id = None
+            else:
+                self.spectator_counter += 1
+                spectator_id = f"spectator_{self.spectator_counter}"
+        if spectator_id is None:
+            send_message(client_socket, {"error": "too many spectators"})
+            client_socket.close()
+            return None
+
+        send_message(client_socket, {"client_id": spectator_id})
+        client_socket.setblocking(False)
+        self._catch_up(
+            Spectator(client_socket, spectator_id, next_frame=0), joining=True
+        )
+        self._wake()
+        return spectator_id
+
+    def _remove(self, spectator: Spectator):
+        with self.lock:
+            if self.spectators.pop(spectator.socket.fileno(), None) is None:
+                return
+            self.selector.unregister(spectator.socket)
+        try:
+            spectator.socket.close()
+        except OSError:
+            pass
+
+    def _next_frame(self, spectator: Spectator) -> Optional[bytes]:
+        if spectator.own_frames:
+            return spectator.own_frames.popleft()
+        with self.lock:
+            behind_log = spectator.next_frame < self.first_frame
+            if not behind_log:
+                index = spectator.next_frame - self.first_frame
+                if index >= len(self.frames):
+                    return None
+                spectator.next_frame += 1
+                return self.frames[index]
+        # it's missing frames now, so start it over from what the game looks like
+        print(f"{spectator.spectator_id} fell too far behind. Resyncing...")
+        self._catch_up(spectator)
+        return self._next_frame(spectator)
+
+    def _flush(self, spectator: Spectator):
+        """sends them all they're due until their socket buffer fills up"""
+        sent_now = 0
+        try:
+            while True:
+                if not spectator.pending:
+                    frame = self._next_frame(spectator)
+                    if frame is None:
+                        break
+                    spectator.pending = memoryview(frame)
+                sent = spectator.socket.send(spectator.pending)
+                spectator.pending = spectator.pending[sent:]
+                sent_now += sent
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._remove(spectator)
+            return
+        finally:
+            self.bytes_sent += sent_now
+
+        # only ask to hear about the socket being writable when it's full
+        events = selectors.EVENT_READ
+        if spectator.pending:
+            events |= selectors.EVENT_WRITE
+        with self.lock:
+            if spectator.socket.fileno() in self.spectators:
+                self.selector.modify(spectator.socket, events, spectator)
+
+    def _has_hung_up(self, spectator: Spectator) -> bool:
+        try:
+            return not spectator.socket.recv(4096)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def _run(self):
+        while self.running:
+            woken = False
+            for key, events in self.selector.select(IDLE_WAIT_SECONDS):
+                if key.fileobj is self.wake_reader:
+                    woken = True
+                    try:
+                        while self.wake_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                spectator = key.data
+                if events & selectors.EVENT_READ and self._has_hung_up(spectator):
+                    self._remove(spectator)
+                elif events & selectors.EVENT_WRITE:
+                    self._flush(spectator)
+            if woken:
+                # there's something new in the log, everyone not stuck gets it
+                with self.lock:
+                    spectators = list(self.spectators.values())
+                for spectator in spectators:
+                    if not spectator.pending:
+                        self._flush(spectator)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self._wake()
+            self.thread.join(timeout=2)
+        with self.lock:
+            spectators, self.spectators = list(self.spectators.values()), {}
+        for spectator in spectators:
+            try:
+                spectator.socket.close()
+            except OSError:
+                pass
+        self.selector.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
@@ -0,0 +1,411 @@
+import struct
+import typing
+from collections import deque
+from dataclasses import fields
+from enum import Enum
+from typing import Any, Callable
+from pyxel_ui.models import tasks
+
+"""
+Binary encoding for the task dataclasses that go over the wire.
+
+Every frame is a version byte, the task's type id, then its fields in
+dataclass order. How each field is written comes from its type annotation,
+so field names never go over the wire and lists of coordinates pack down to
+flat int arrays. Fields without a useful annotation fall back to a small
+tagged format that only knows plain data types, so decoding never runs code
+the way unpickling does.
+"""
+
+# append only! a task's id is its index, so entries can never move or be
+# removed without bumping the version and adding a new table
+TASK_TYPES_V1 = (
+    tasks.AddEntitiesTask,
+    tasks.RemoveEntityTask,
+    tasks.LoadCharactersTask,
+    tasks.LoadLogTask,
+    tasks.AppendLogTask,
+    tasks.LoadActionCardsTask,
+    tasks.LoadRoundTurnInfoTask,
+    tasks.BoardInitTask,
+    tasks.ActionTask,
+    tasks.InputTask,
+    tasks.MouseInputTask,
+    tasks.PrintTerminalMessage,
+    tasks.AddToPersonalLog,
+    tasks.SaveCampaign,
+    tasks.LoadCampaign,
+    tasks.ResetViewManager,
+    tasks.ShowCharacterPickerTask,
+    tasks.MakeCarouselUndrawable,
+    tasks.LoadPlotScreen,
+    tasks.HighlightMapTiles,
+    tasks.RedrawMap,
+    tasks.DrawCursorGridShape,
+    tasks.TurnOffCursorGridShape,
+)
+TASK_REGISTRY = {1: TASK_TYPES_V1}
+CODEC_VERSION = 1
+
+HEADER = struct.Struct(">BH")
+INT = struct.Struct(">i")
+FLOAT = struct.Struct(">d")
+LENGTH = struct.Struct(">I")
+BOOL = struct.Struct(">?")
+
+# tags for values we don't have a schema for
+(NONE, FALSE, TRUE, INT_TAG, FLOAT_TAG, STR, LIST, TUPLE, DICT, BYTES, BIG_INT) = range(
+    11
+)
+
+Encoder = Callable[[Any, bytearray], None]
+Decoder = Callable[[memoryview, int], tuple[Any, int]]
+
+
+def _encode_str(value: str, out: bytearray) -> None:
+    data = value.encode("utf-8")
+    out += LENGTH.pack(len(data))
+    out += data
+
+
+def _decode_str(buf: memoryview, pos: int) -> tuple[str, int]:
+    (length,) = LENGTH.unpack_from(buf, pos)
+    pos += LENGTH.size
+    return str(buf[pos : pos + length], "utf-8"), pos + length
+
+
+def _encode_any(value: Any, out: bytearray) -> None:
+    # bool first since it's an int subclass
+    if value is None:
+        out.append(NONE)
+    elif value is True or value is False:
+        out.append(TRUE if value else FALSE)
+    elif isinstance(value, int):
+        if -(2**31) <= value < 2**31:
+            out.append(INT_TAG)
+            out += INT.pack(value)
+        else:
+            out.append(BIG_INT)
+            _encode_str(str(int(value)), out)
+    elif isinstance(value, float):
+        out.append(FLOAT_TAG)
+        out += FLOAT.pack(value)
+    elif isinstance(value, str):
+        out.append(STR)
+        _encode_str(value, out)
+    elif isinstance(value, (list, tuple, deque)):
+        out.append(TUPLE if isinstance(value, tuple) else LIST)
+        out += LENGTH.pack(len(value))
+        for item in value:
+            _encode_any(item, out)
+    elif isinstance(value, dict):
+        out.append(DICT)
+        out += LENGTH.pack(len(value))
+        for key, item in value.items():
+            _encode_any(key, out)
+            _encode_any(item, out)
+    elif isinstance(value, bytes):
+        out.append(BYTES)
+        out += LENGTH.pack(len(value))
+        out += value
+    else:
+        raise TypeError(f"Can't encode {type(value).__name__}: {value!r}")
+
+
+def _decode_any(buf: memoryview, pos: int) -> tuple[Any, int]:
+    tag = buf[pos]
+    pos += 1
+    if tag == NONE:
+        return None, pos
+    if tag == FALSE:
+        return False, pos
+    if tag == TRUE:
+        return True, pos
+    if tag == INT_TAG:
+        return INT.unpack_from(buf, pos)[0], pos + INT.size
+    if tag == BIG_INT:
+        value, pos = _decode_str(buf, pos)
+        return int(value), pos
+    if tag == FLOAT_TAG:
+        return FLOAT.unpack_from(buf, pos)[0], pos + FLOAT.size
+    if tag == STR:
+        return _decode_str(buf, pos)
+    if tag in (LIST, TUPLE):
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        items = []
+        for _ in range(length):
+            item, pos = _decode_any(buf, pos)
+            items.append(item)
+        return (tuple(items) if tag == TUPLE else items), pos
+    if tag == DICT:
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        result = {}
+        for _ in range(length):
+            key, pos = _decode_any(buf, pos)
+            result[key], pos = _decode_any(buf, pos)
+        return result, pos
+    if tag == BYTES:
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        return bytes(buf[pos : pos + length]), pos + length
+    raise ValueError(f"Unknown value tag: {tag}")
+
+
+def _fixed(packer: struct.Struct) -> tuple[Encoder, Decoder]:
+    def encode(value, out):
+        out += packer.pack(value)
+
+    def decode(buf, pos):
+        return packer.unpack_from(buf, pos)[0], pos + packer.size
+
+    return encode, decode
+
+
+def _int_pairs() -> tuple[Encoder, Decoder]:
+    """list[tuple[int, int]] packs into a single flat int array"""
+
+    def encode(value, out):
+        out += LENGTH.pack(len(value))
+        out += struct.pack(f">{2 * len(value)}i", *(n for pair in value for n in pair))
+
+    def decode(buf, pos):
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        flat = struct.unpack_from(f">{2 * length}i", buf, pos)
+        pairs = list(zip(flat[::2], flat[1::2]))
+        return pairs, pos + 2 * length * INT.size
+
+    return encode, decode
+
+
+def _optional(inner: tuple[Encoder, Decoder]) -> tuple[Encoder, Decoder]:
+    inner_encode, inner_decode = inner
+
+    def encode(value, out):
+        if value is None:
+            out.append(0)
+            return
+        out.append(1)
+        inner_encode(value, out)
+
+    def decode(buf, pos):
+        if not buf[pos]:
+            return None, pos + 1
+        return inner_decode(buf, pos + 1)
+
+    return encode, decode
+
+
+def _sequence(
+    item: tuple[Encoder, Decoder], container: type
+) -> tuple[Encoder, Decoder]:
+    item_encode, item_decode = item
+
+    def encode(value, out):
+        out += LENGTH.pack(len(value))
+        for element in value:
+            item_encode(element, out)
+
+    def decode(buf, pos):
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        items = []
+        for _ in range(length):
+            element, pos = item_decode(buf, pos)
+            items.append(element)
+        return container(items), pos
+
+    return encode, decode
+
+
+def _fixed_tuple(items: list[tuple[Encoder, Decoder]]) -> tuple[Encoder, Decoder]:
+    def encode(value, out):
+        if len(value) != len(items):
+            raise ValueError(f"Expected {len(items)} items, got {value!r}")
+        for (item_encode, _), element in zip(items, value):
+            item_encode(element, out)
+
+    def decode(buf, pos):
+        result = []
+        for _, item_decode in items:
+            element, pos = item_decode(buf, pos)
+            result.append(element)
+        return tuple(result), pos
+
+    return encode, decode
+
+
+def _mapping(
+    key: tuple[Encoder, Decoder], value: tuple[Encoder, Decoder]
+) -> tuple[Encoder, Decoder]:
+    key_encode, key_decode = key
+    value_encode, value_decode = value
+
+    def encode(mapping, out):
+        out += LENGTH.pack(len(mapping))
+        for k, v in mapping.items():
+            key_encode(k, out)
+            value_encode(v, out)
+
+    def decode(buf, pos):
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        result = {}
+        for _ in range(length):
+            k, pos = key_decode(buf, pos)
+            result[k], pos = value_decode(buf, pos)
+        return result, pos
+
+    return encode, decode
+
+
+def _enum(enum_class: type[Enum]) -> tuple[Encoder, Decoder]:
+    def encode(value, out):
+        _encode_any(enum_class(value).value, out)
+
+    def decode(buf, pos):
+        value, pos = _decode_any(buf, pos)
+        return enum_class(value), pos
+
+    return encode, decode
+
+
+def _codec_for(hint: Any) -> tuple[Encoder, Decoder]:
+    """picks how to write a field from its type annotation"""
+    if hint is int:
+        return _fixed(INT)
+    if hint is float:
+        return _fixed(FLOAT)
+    if hint is bool:
+        return _fixed(BOOL)
+    if hint is str:
+        return _encode_str, _decode_str
+    if isinstance(hint, type) and issubclass(hint, Enum):
+        return _enum(hint)
+
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+    if origin is typing.Union and len(args) == 2 and type(None) in args:
+        (inner,) = [arg for arg in args if arg is not type(None)]
+        return _optional(_codec_for(inner))
+    if origin is list and args == (tuple[int, int],):
+        return _int_pairs()
+    if origin in (list, deque) and len(args) == 1:
+        return _sequence(_codec_for(args[0]), origin)
+    if origin is tuple and args and Ellipsis not in args:
+        return _fixed_tuple([_codec_for(arg) for arg in args])
+    if origin is dict and len(args) == 2:
+        return _mapping(_codec_for(args[0]), _codec_for(args[1]))
+    # no schema to go on (bare list, tuple, any) - use the tagged format
+    return _encode_any, _decode_any
+
+
+def _entity_list() -> tuple[Encoder, Decoder]:
+    """AddEntitiesTask.entities - a list of dicts that always have the same keys"""
+    entity = struct.Struct(">iiii")
+
+    def encode(entities, out):
+        out += LENGTH.pack(len(entities))
+        for e in entities:
+            x, y = e["position"]
+            out += entity.pack(e["id"], x, y, e["priority"])
+            _encode_str(e["name"], out)
+
+    def decode(buf, pos):
+        (length,) = LENGTH.unpack_from(buf, pos)
+        pos += LENGTH.size
+        entities = []
+        for _ in range(length):
+            entity_id, x, y, priority = entity.unpack_from(buf, pos)
+            name, pos = _decode_str(buf, pos + entity.size)
+            entities.append(
+                {
+                    "id": entity_id,
+                    "position": (x, y),
+                    "name": name,
+                    "priority": priority,
+                }
+            )
+        return entities, pos
+
+    return encode, decode
+
+
+# fields whose annotation doesn't say enough to pack them tightly
+FIELD_CODECS = {
+    (tasks.AddEntitiesTask, "entities"): _entity_list(),
+    # animation steps are filled in on the frontend and don't match their hints
+    (tasks.RemoveEntityTask, "action_steps"): _optional(
+        _sequence((_encode_any, _decode_any), deque)
+    ),
+    (tasks.ActionTask, "action_steps"): _optional(
+        _sequence((_encode_any, _decode_any), deque)
+    ),
+}
+
+
+class TaskCodec:
+    def __init__(self):
+        self._type_ids = {task_class: i for i, task_class in enumerate(TASK_TYPES_V1)}
+        # per version, per type id: (task class, [(field name, encoder, decoder)])
+        self._schemas = {
+            version: [self._make_schema(task_class) for task_class in task_types]
+            for version, task_types in TASK_REGISTRY.items()
+        }
+
+    def _make_schema(self, task_class):
+        hints = typing.get_type_hints(task_class)
+        schema = []
+        for field in fields(task_class):
+            encode, decode = FIELD_CODECS.get(
+                (task_class, field.name)
+            ) or _codec_for(hints.get(field.name, Any))
+            schema.append((field.name, encode, decode))
+        return task_class, schema
+
+    def encode_task(self, task: Any) -> bytes:
+        type_id = self._type_ids.get(type(task))
+        if type_id is None:
+            raise ValueError(f"Unknown task class: {type(task).__name__}")
+        _, schema = self._schemas[CODEC_VERSION][type_id]
+        out = bytearray(HEADER.pack(CODEC_VERSION, type_id))
+        for name, encode, _ in schema:
+            try:
+                encode(getattr(task, name), out)
+            except (TypeError, ValueError, struct.error) as e:
+                raise ValueError(
+                    f"Can't encode {type(task).__name__}.{name}: {str(e)}"
+                )
+        return bytes(out)
+
+    def peek_task_class(self, data) -> Any:
+        """the class of an encoded task, from its header alone. None if unknown"""
+        if not isinstance(data, bytes) or len(data) < HEADER.size:
+            return None
+        version, type_id = HEADER.unpack_from(data, 0)
+        if version not in self._schemas or type_id >= len(self._schemas[version]):
+            return None
+        return self._schemas[version][type_id][0]
+
+    def decode_task(self, data: bytes) -> Any:
+        if not data:
+            return None
+        buf = memoryview(data)
+        version, type_id = HEADER.unpack_from(buf, 0)
+        if version not in self._schemas:
+            raise ValueError(f"Unknown task codec version: {version}")
+        if type_id >= len(self._schemas[version]):
+            raise ValueError(f"Unknown task type id: {type_id}")
+        task_class, schema = self._schemas[version][type_id]
+
+        pos = HEADER.size
+        task_data = {}
+        for name, _, decode in schema:
+            task_data[name], pos = decode(buf, pos)
+        if pos != len(buf):
+            raise ValueError(
+                f"{len(buf) - pos} extra bytes after {task_class.__name__}"
+            )
+        return task_class(**task_data)
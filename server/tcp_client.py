@@ -1,36 +1,181 @@
 import socket
 import json
-from server.server_utils import ClientType, receive_message, send_message
+import threading
+from collections import deque
+from server.server_utils import ClientType, FramedConnection
+
+# posts we'll send before stopping to wait for the server to ack them
+MAX_POSTS_IN_FLIGHT = 64
 
 
 class TCPClient:
-    def __init__(self, client_type: ClientType, host="localhost", port=8080):
+    def __init__(
+        self,
+        client_type: ClientType,
+        host="localhost",
+        port=8080,
+        room=None,
+        unix_path=None,
+    ):
+        """room picks the game to join on a server that hosts more than one
+        unix_path connects over a unix domain socket instead of tcp
+        """
         self.client_type = client_type
         self.client_id = None
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # disable nagle's algo
-        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        self.socket.connect((host, port))
+        # proves a push connection is ours when we subscribe
+        self.subscribe_token = None
+        self.room = room
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        # filled by the push thread once we subscribe
+        self.pushed_tasks = deque()
+        self.push_socket = None
+        self.push_thread = None
+        # posts are sent without waiting for their replies. The server answers
+        # requests in order, so replies get matched up by their request id
+        self.next_request_id = 0
+        self.unacked_posts = deque()
+        # (request id, error) for posts the server turned down
+        self.post_errors = deque()
+        self.socket = self._connect()
+        self.connection = FramedConnection(self.socket)
         self._identify()
+        if client_type == ClientType.SPECTATOR:
+            # the server streams the game down our only connection
+            self._start_push_thread(self.connection)
+
+    def _connect(self):
+        if self.unix_path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.unix_path)
+            return sock
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # disable nagle's algo
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect((self.host, self.port))
+        return sock
 
     def _identify(self):
         """Identify client type to server and receive client ID"""
         identification = {"client_type": self.client_type.value}
-        send_message(self.socket, identification)
-        response = receive_message(self.socket)
+        if self.room is not None:
+            identification["room"] = self.room
+        self.connection.send_message(identification)
+        response = self.connection.receive_message()
+        if "error" in response:
+            self.close()
+            raise ConnectionError(f"Server refused connection: {response['error']}")
         self.client_id = response["client_id"]
+        self.subscribe_token = response.get("subscribe_token")
 
-    def _send_request(self, command, payload=None):
-        request = {"command": command}
+    def _send(self, command, payload=None) -> int:
+        if self.client_type == ClientType.SPECTATOR:
+            raise PermissionError("Spectators can only watch, use get_pushed_tasks")
+        self.next_request_id += 1
+        request = {"command": command, "request_id": self.next_request_id}
         if payload is not None:
             request["payload"] = payload
         try:
-            send_message(self.socket, request)
-            response = receive_message(self.socket)
-            return response
-        except (json.JSONDecodeError, ConnectionError) as e:
+            self.connection.send_message(request)
+        except OSError as e:
             self.close()
             raise ConnectionError(f"Connection error: {str(e)}")
+        return self.next_request_id
+
+    def _receive_response(self, request_id):
+        """reads replies in order until request_id's, checking acks on the way"""
+        while True:
+            try:
+                response = self.connection.receive_message()
+            except (json.JSONDecodeError, ConnectionError) as e:
+                self.close()
+                raise ConnectionError(f"Connection error: {str(e)}")
+            response_id = response.pop("request_id", None)
+            if response_id is None:
+                # a server that doesn't echo ids still answers in order
+                response_id = (
+                    self.unacked_posts[0] if self.unacked_posts else request_id
+                )
+            if self.unacked_posts and response_id == self.unacked_posts[0]:
+                self.unacked_posts.popleft()
+                if "error" in response:
+                    self.post_errors.append((response_id, response["error"]))
+            if response_id == request_id:
+                return response
+
+    def _send_request(self, command, payload=None):
+        """sends a request and waits for its reply"""
+        return self._receive_response(self._send(command, payload))
+
+    def _post(self, command, payload):
+        """sends a request without waiting for its reply"""
+        request_id = self._send(command, payload)
+        self.unacked_posts.append(request_id)
+        if len(self.unacked_posts) > MAX_POSTS_IN_FLIGHT:
+            self._receive_response(self.unacked_posts[0])
+        return {"request_id": request_id}
+
+    def wait_for_acks(self):
+        """
+        Blocks until the server has handled every post sent so far.
+        Returns the (request id, error) of any it turned down
+        """
+        if self.unacked_posts:
+            self._receive_response(self.unacked_posts[-1])
+        errors = list(self.post_errors)
+        self.post_errors.clear()
+        return errors
+
+    def subscribe(self):
+        """Open a second connection the server pushes our tasks down as soon
+        as they're posted (frontend only). A background thread reads them into
+        pushed_tasks, drain it with get_pushed_tasks
+        """
+        if self.client_type != ClientType.FRONTEND:
+            raise PermissionError("Only frontend clients can subscribe to tasks")
+        self.push_socket = self._connect()
+        push_connection = FramedConnection(self.push_socket)
+        subscription = {
+            "client_type": self.client_type.value,
+            "subscribe": self.client_id,
+            "token": self.subscribe_token,
+        }
+        if self.room is not None:
+            subscription["room"] = self.room
+        push_connection.send_message(subscription)
+        response = push_connection.receive_message()
+        if "error" in response:
+            self.push_socket.close()
+            self.push_socket = None
+            raise ConnectionError(f"Subscribe failed: {response['error']}")
+        self._start_push_thread(push_connection)
+
+    def _start_push_thread(self, push_connection: FramedConnection):
+        self.push_thread = threading.Thread(
+            target=self._receive_pushed_tasks, args=(push_connection,), daemon=True
+        )
+        self.push_thread.start()
+
+    def _receive_pushed_tasks(self, push_connection: FramedConnection):
+        # the socket is only ever read here, and deque appends are thread safe
+        while True:
+            try:
+                message = push_connection.receive_message()
+            except ConnectionError:
+                return
+            self.pushed_tasks.extend(message.get("tasks", []))
+
+    @property
+    def is_subscribed(self):
+        return self.push_thread is not None and self.push_thread.is_alive()
+
+    def get_pushed_tasks(self):
+        """Take every task pushed since the last call"""
+        tasks = []
+        while self.pushed_tasks:
+            tasks.append(self.pushed_tasks.popleft())
+        return tasks
 
     def get_task(self):
         """Get tasks assigned to this client"""
@@ -45,9 +190,22 @@ class TCPClient:
         return response.get("tasks")
 
     def post_task(self, task_data, target_client_id):
-        """Post a task for a specific client"""
+        """Post a task for a specific client, without waiting for the server"""
         payload = {"target_client_id": target_client_id, "task": task_data}
-        return self._send_request("post_task", payload)
+        return self._post("post_task", payload)
+
+    def post_tasks(self, tasks_to_post):
+        """Post many tasks in one message
+        tasks_to_post is a list of (task_data, target_client_id) in the order
+        they should run
+        """
+        payload = {
+            "tasks": [
+                {"target_client_id": target_client_id, "task": task_data}
+                for task_data, target_client_id in tasks_to_post
+            ]
+        }
+        return self._post("post_tasks", payload)
 
     def get_user_input(self):
         """Get user input (backend only)"""
@@ -62,18 +220,21 @@ class TCPClient:
             return None
 
     def post_user_input(self, user_input):
-        """Post user input (frontend only)"""
+        """Post user input (frontend only), without waiting for the server"""
         if self.client_type != ClientType.FRONTEND:
             raise PermissionError("Only frontend clients can post user input")
-        return self._send_request("post_user_input", user_input)
+        return self._post("post_user_input", user_input)
 
     def close(self):
         """Close the client connection"""
-        try:
-            self.socket.shutdown(socket.SHUT_RDWR)
-        except OSError:
-            pass  # Socket might already be closed
-        self.socket.close()
+        for sock in (self.socket, self.push_socket):
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Socket might already be closed
+            sock.close()
 
     @property
     def id(self):
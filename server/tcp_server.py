@@ -1,3 +1,6 @@
+import hmac
+import os
+import secrets
 import socket
 import threading
 from dataclasses import dataclass
@@ -5,8 +8,23 @@ import queue
 import json
 import time
 import traceback
-from typing import List, Dict
-from server.server_utils import ClientType, receive_message, send_message
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+from server.client_outbox import ClientOutbox
+from server.frontend_state import FrontendState
+from server.server_metrics import ServerMetrics
+from server.spectator_stream import SpectatorStream
+from server.server_utils import (
+    ClientType,
+    FramedConnection,
+    receive_message,
+    send_message,
+)
+
+# how often a push thread with nothing to send checks it's still needed
+PUSH_WAIT_SECONDS = 0.5
+# keeps pushed frames under the max message size
+MAX_TASKS_PER_PUSH = 100
 
 
 @dataclass
@@ -14,26 +32,52 @@ class ClientData:
     socket: socket.socket
     client_id: str
     client_type: ClientType
-    tasks: List[Dict]
+    outbox: ClientOutbox
     thread: threading.Thread
     last_active: float = time.time()
     DISCONNECT_TIMEOUT: float = 10.0
+    # second connection we push tasks down as soon as they're posted
+    push_socket: Optional[socket.socket] = None
+    # writes the outbox to push_socket, so a slow reader only holds up itself
+    push_thread: Optional[threading.Thread] = None
+    # what a frontend's push connection has to show, so only they can open it
+    subscribe_token: str = ""
 
 
 class TCPServer:
-    def __init__(self, host="0.0.0.0", port=8080, testing_mode=True, max_players=3):
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=8080,
+        testing_mode=True,
+        max_players=3,
+        unix_path=None,
+    ):
+        """
+        unix_path also listens on a unix domain socket, for backends that run
+        in another process on the same box
+        """
         self.host = host
         self.port = port
+        self.unix_path = unix_path
+        self.unix_socket = None
+        self.unix_accept_thread = None
         self.clients: Dict[str, ClientData] = {}
         self.frontend_counter = 0
         self.user_input_queue = queue.Queue()
-        self.persistent_frontend_tasks: List[Dict] = []
+        # what a frontend joining now needs, folded from tasks sent to all frontends
+        self.frontend_state = FrontendState()
         self.lock = threading.Lock()
+        # people watching, who aren't clients - they never send us anything
+        self.spectators = SpectatorStream(self.frontend_state, self.lock)
+        # notified whenever a client connects or disconnects, or we stop
+        self.clients_changed = threading.Condition(self.lock)
         self.running = False
         self.accept_thread = None
         self.shutdown_thread = None
         self.max_players = max_players
         self.start_time = None
+        self.metrics = ServerMetrics()
 
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -45,30 +89,45 @@ class TCPServer:
             self.server_socket.settimeout(
                 0.5
             )  # Allow checking running flag periodically
+            if unix_path is not None:
+                if os.path.exists(unix_path):
+                    os.unlink(unix_path)
+                self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.unix_socket.bind(unix_path)
+                self.unix_socket.listen(5)
+                self.unix_socket.settimeout(0.5)
         except Exception as e:
             print(f"Failed to initialize server socket: {str(e)}")
-            if hasattr(self, "server_socket"):
+            for listen_socket in (
+                getattr(self, "server_socket", None),
+                self.unix_socket,
+            ):
                 try:
-                    self.server_socket.close()
+                    listen_socket.close()
                 except:
                     pass
             raise
 
-    def _accept_connections(self):
+    def _accept_connections(self, listen_socket=None):
         """Accept incoming client connections"""
+        listen_socket = listen_socket or self.server_socket
+        # only processes on this box can reach the unix socket
+        is_unix_socket = listen_socket is self.unix_socket
         while self.running:
             try:
                 # Check for startup timeout
                 if (
-                    not self.clients and time.time() - self.start_time > 600
+                    not is_unix_socket
+                    and not self.clients
+                    and time.time() - self.start_time > 600
                 ):  # 10 minutes
                     print("No clients connected within 10 minutes. Shutting down...")
                     self.stop()
                     return
 
                 try:
-                    client_socket, address = self.server_socket.accept()
-                    client_ip = address[0]
+                    client_socket, address = listen_socket.accept()
+                    client_ip = "127.0.0.1" if is_unix_socket else address[0]
                 except socket.timeout:
                     continue
 
@@ -76,7 +135,27 @@ class TCPServer:
                 client_socket.settimeout(600)
 
                 client_info = receive_message(client_socket)
+                # a one off request for our metrics, not a player
+                if "stats" in client_info:
+                    self._send_stats(client_socket, client_ip, client_info["stats"])
+                    continue
                 client_type = ClientType(client_info.get("client_type"))
+                # an existing frontend opening its push connection
+                if client_info.get("subscribe"):
+                    # its own thread, so a slow subscriber can't hold up accepting
+                    threading.Thread(
+                        target=self._subscribe,
+                        args=(
+                            client_socket,
+                            client_info["subscribe"],
+                            client_info.get("token"),
+                        ),
+                        daemon=True,
+                    ).start()
+                    continue
+                if client_type == ClientType.SPECTATOR:
+                    self.spectators.add(client_socket)
+                    continue
                 # Add IP whitelist check for backend
                 if client_type == ClientType.BACKEND:
                     ALLOWED_IPS = {
@@ -107,7 +186,9 @@ class TCPServer:
                         print("New player connected. Canceling shutdown timer.")
 
                 client_id = self._generate_client_id(client_type)
-                send_message(client_socket, {"client_id": client_id})
+                identification = {"client_id": client_id}
+                if client_type == ClientType.FRONTEND:
+                    identification["subscribe_token"] = secrets.token_hex(16)
 
                 client_thread = threading.Thread(
                     target=self._handle_client,
@@ -116,14 +197,28 @@ class TCPServer:
                 )
 
                 with self.lock:
+                    # new frontends catch up on the game so far
+                    # before they can subscribe, so pushes never jump ahead of it
                     self.clients[client_id] = ClientData(
                         socket=client_socket,
                         client_id=client_id,
                         client_type=client_type,
-                        tasks=[],
+                        outbox=ClientOutbox(
+                            self.frontend_state.snapshot()
+                            if client_type == ClientType.FRONTEND
+                            else ()
+                        ),
                         thread=client_thread,
+                        subscribe_token=identification.get("subscribe_token", ""),
                     )
+                    self.clients_changed.notify_all()
 
+                # only once it's registered, so the id can be posted to right away
+                try:
+                    send_message(client_socket, identification)
+                except OSError:
+                    self._handle_client_disconnect(client_id)
+                    continue
                 client_thread.start()
             except Exception as e:
                 if not isinstance(e, (socket.timeout, ConnectionError)):
@@ -142,6 +237,14 @@ class TCPServer:
                 target=self._accept_connections, daemon=True
             )
             self.accept_thread.start()
+            self.spectators.start()
+            if self.unix_socket is not None:
+                self.unix_accept_thread = threading.Thread(
+                    target=self._accept_connections,
+                    args=(self.unix_socket,),
+                    daemon=True,
+                )
+                self.unix_accept_thread.start()
         except Exception as e:
             print(f"Failed to start server: {str(e)}")
             self.stop()
@@ -161,23 +264,153 @@ class TCPServer:
             if i not in used_numbers:
                 return f"frontend_{i}"
 
+    @contextmanager
+    def _timed_lock(self):
+        """self.lock, keeping track of how long we waited for it"""
+        start = time.perf_counter()
+        with self.lock:
+            self.metrics.observe_lock_wait(time.perf_counter() - start)
+            yield
+
+    def get_stats(self, stats_format="json"):
+        """our metrics as a dict, or prometheus text if stats_format is prometheus"""
+        clients = {
+            client_data.client_id: {
+                "client_type": client_data.client_type.value,
+                "subscribed": client_data.push_socket is not None,
+                "queue_depth": len(client_data.outbox),
+                "queue_age_seconds": client_data.outbox.age(),
+            }
+            for client_data in list(self.clients.values())
+        }
+        spectators = {
+            "count": len(self.spectators),
+            "bytes_sent": self.spectators.bytes_sent,
+        }
+        if stats_format == "prometheus":
+            return self.metrics.to_prometheus(clients, spectators)
+        with self._timed_lock():
+            round_number = self.frontend_state.round_number()
+        return self.metrics.to_dict(clients, spectators, round_number)
+
+    def _send_stats(self, client_socket: socket.socket, client_ip, stats_format):
+        try:
+            if client_ip.replace("::ffff:", "") not in ("127.0.0.1", "::1"):
+                send_message(client_socket, {"error": "stats are local only"})
+            else:
+                send_message(client_socket, {"stats": self.get_stats(stats_format)})
+        finally:
+            client_socket.close()
+
+    def _subscribe(self, push_socket: socket.socket, client_id: str, token):
+        """
+        From now on, tasks for client_id are written to push_socket as soon as
+        they're posted. Anything already waiting for them goes out first.
+        token has to be the subscribe_token client_id was given when it joined
+        """
+        with self.lock:
+            client_data = self.clients.get(client_id)
+        if (
+            client_data is None
+            or client_data.client_type != ClientType.FRONTEND
+            or not hmac.compare_digest(
+                client_data.subscribe_token.encode(), str(token).encode()
+            )
+        ):
+            try:
+                send_message(push_socket, {"error": "unknown client id"})
+            except OSError:
+                pass
+            push_socket.close()
+            return
+
+        try:
+            send_message(push_socket, {"status": "subscribed"})
+        except OSError:
+            push_socket.close()
+            return
+        # under the lock the disconnect path takes, so a client that left
+        # while we were answering doesn't get a push thread nobody stops
+        with self.lock:
+            if self.clients.get(client_id) is not client_data:
+                push_socket.close()
+                return
+            if client_data.push_socket is not None:
+                # resubscribing - the old connection's push thread stops when it fails
+                try:
+                    client_data.push_socket.close()
+                except:
+                    pass
+            client_data.push_socket = push_socket
+            client_data.push_thread = threading.Thread(
+                target=self._push_tasks,
+                args=(client_data, push_socket),
+                daemon=True,
+            )
+            client_data.push_thread.start()
+
+    def _push_tasks(self, client_data: ClientData, push_socket: socket.socket):
+        """
+        Sends the client's outbox down push_socket as tasks come in. If the
+        push connection goes, the tasks wait in the outbox for them to poll
+        """
+        connection = FramedConnection(push_socket)
+        while self.running and client_data.push_socket is push_socket:
+            tasks = client_data.outbox.wait_and_drain(
+                timeout=PUSH_WAIT_SECONDS, limit=MAX_TASKS_PER_PUSH
+            )
+            if not tasks:
+                continue
+            try:
+                bytes_sent = connection.bytes_sent
+                connection.send_message({"tasks": tasks})
+                self.metrics.add_bytes(sent=connection.bytes_sent - bytes_sent)
+            except OSError:
+                client_data.outbox.requeue(tasks)
+                break
+        if client_data.push_socket is push_socket:
+            client_data.push_socket = None
+        try:
+            push_socket.close()
+        except:
+            pass
+
+    def _deliver_tasks(self, client_data: ClientData, tasks: List[Dict], own_tasks=()):
+        """own_tasks are the ones in tasks sent only to them, a resync keeps those"""
+        if client_data.outbox.extend(tasks, own_tasks):
+            return
+        # it's missing tasks now, so start it over from what the game looks like
+        print(f"{client_data.client_id} fell too far behind. Resyncing...")
+        with self._timed_lock():
+            snapshot = self.frontend_state.snapshot()
+        client_data.outbox.reset(snapshot)
+
     def _handle_client(self, client_socket: socket.socket, client_id: str):
         try:
             client_data = self.clients[client_id]
-
-            if client_data.client_type == ClientType.FRONTEND:
-                with self.lock:
-                    for task in self.persistent_frontend_tasks:
-                        client_data.tasks.append(task)
+            connection = FramedConnection(client_socket)
+            # what's been added to the metrics so far
+            bytes_received = bytes_sent = 0
 
             while self.running:
                 try:
-                    request = receive_message(client_socket)
+                    request = connection.receive_message()
+                    # counted before it's answered, so it's in any stats asked
+                    # for once the client has its reply
+                    self.metrics.add_bytes(connection.bytes_received - bytes_received)
+                    bytes_received = connection.bytes_received
                     client_data.last_active = time.time()
                     command = request.get("command")
                     payload = request.get("payload", {})
+                    start = time.perf_counter()
                     response = self._process_command(command, payload, client_id)
-                    send_message(client_socket, response)
+                    self.metrics.observe_command(command, time.perf_counter() - start)
+                    # lets clients send more requests before this one's answered
+                    if "request_id" in request:
+                        response["request_id"] = request["request_id"]
+                    connection.send_message(response)
+                    self.metrics.add_bytes(sent=connection.bytes_sent - bytes_sent)
+                    bytes_sent = connection.bytes_sent
                 except socket.timeout:
                     if (
                         time.time() - client_data.last_active
@@ -202,12 +435,16 @@ class TCPServer:
                     return
 
                 client = self.clients[client_id]
-                try:
-                    client.socket.close()
-                except:
-                    pass
+                for client_socket in (client.socket, client.push_socket):
+                    try:
+                        client_socket.close()
+                    except:
+                        pass
 
                 del self.clients[client_id]
+                client.push_socket = None
+                client.outbox.wake()
+                self.clients_changed.notify_all()
 
                 # Only start shutdown timer if server is still running
                 if self.running and not any(
@@ -231,6 +468,8 @@ class TCPServer:
 
         print("Initiating server shutdown...")
         self.running = False
+        with self.lock:
+            self.clients_changed.notify_all()
 
         try:
             # Close all client connections first
@@ -276,22 +515,33 @@ class TCPServer:
             except:
                 pass
 
+    def count_frontends(self) -> int:
+        return sum(
+            1
+            for c in list(self.clients.values())
+            if c.client_type == ClientType.FRONTEND
+        )
+
+    def wait_for_frontends(self, num_frontends: int, timeout=None) -> bool:
+        """
+        Sleeps until at least num_frontends players are connected.
+        Returns False if the server stopped or the timeout ran out first
+        """
+        with self.clients_changed:
+            self.clients_changed.wait_for(
+                lambda: not self.running or self.count_frontends() >= num_frontends,
+                timeout,
+            )
+            return self.running and self.count_frontends() >= num_frontends
+
     def _shutdown_timer(self):
         try:
-            start_time = time.time()
-            while self.running:
-                if any(
-                    c.client_type == ClientType.FRONTEND for c in self.clients.values()
-                ):
-                    print("Player reconnected. Canceling shutdown timer.")
-                    return
-
-                if time.time() - start_time > 300:  # 5 minutes
-                    print("No players for 5 minutes. Shutting down...")
-                    self.stop()
-                    return
-
-                time.sleep(1)
+            if self.wait_for_frontends(1, timeout=300):  # 5 minutes
+                print("Player reconnected. Canceling shutdown timer.")
+                return
+            if self.running:
+                print("No players for 5 minutes. Shutting down...")
+                self.stop()
         except Exception as e:
             print(f"Error in shutdown timer: {str(e)}")
             self.stop()
@@ -301,22 +551,24 @@ class TCPServer:
         try:
             client_data = self.clients[client_id]
 
+            # while subscribed, tasks only come down the push connection
+            # so they can't arrive out of order
             if command == "get_task":
-                with self.lock:
-                    task = None
-                    if client_data.tasks:
-                        task = client_data.tasks.pop(0)
-                return {"task": task}
+                if client_data.push_socket is not None:
+                    return {"task": None}
+                return {"task": client_data.outbox.pop()}
 
             if command == "get_all_tasks":
-                with self.lock:
-                    tasks = client_data.tasks.copy()  # Create a copy of all tasks
-                    client_data.tasks.clear()  # Clear the original task list
-                return {"tasks": tasks}
+                if client_data.push_socket is not None:
+                    return {"tasks": []}
+                return {"tasks": client_data.outbox.drain()}
 
             elif command == "post_task":
                 return self._process_post_task(payload)
 
+            elif command == "post_tasks":
+                return self._process_post_tasks(payload)
+
             elif command == "get_user_input":
                 if client_data.client_type != ClientType.BACKEND:
                     raise PermissionError(
@@ -343,23 +595,53 @@ class TCPServer:
 
     def _process_post_task(self, payload):
         """Process post task command"""
-        try:
-            target_client_id = payload.get("target_client_id")
-            task_data = payload.get("task")
-            if not target_client_id:
-                raise ValueError("No target client id")
+        return self._process_post_tasks({"tasks": [payload]})
 
-            if target_client_id == "ALL_FRONTEND":
-                with self.lock:
-                    self.persistent_frontend_tasks.append(task_data)
-                    for client_data in self.clients.values():
-                        if client_data.client_type == ClientType.FRONTEND:
-                            client_data.tasks.append(task_data)
-            elif target_client_id in self.clients:
-                with self.lock:
-                    self.clients[target_client_id].tasks.append(task_data)
-            else:
-                raise ValueError("unknown client id")
+    def _process_post_tasks(self, payload):
+        """Process post tasks command - each client gets their share in one go"""
+        try:
+            tasks_by_client: Dict[str, List[Dict]] = {}
+            # the tasks sent to just that client, which no snapshot has
+            own_tasks_by_client: Dict[str, List[Dict]] = {}
+            broadcast = []
+            with self._timed_lock():
+                for task_payload in payload.get("tasks", []):
+                    target_client_id = task_payload.get("target_client_id")
+                    task_data = task_payload.get("task")
+                    if not target_client_id:
+                        raise ValueError("No target client id")
+
+                    if target_client_id == "ALL_FRONTEND":
+                        self.frontend_state.add(task_data)
+                        broadcast.append(task_data)
+                        target_client_ids = [
+                            client_data.client_id
+                            for client_data in self.clients.values()
+                            if client_data.client_type == ClientType.FRONTEND
+                        ]
+                    elif target_client_id in self.clients:
+                        target_client_ids = [target_client_id]
+                        own_tasks_by_client.setdefault(target_client_id, []).append(
+                            task_data
+                        )
+                    else:
+                        raise ValueError("unknown client id")
+                    for client_id in target_client_ids:
+                        tasks_by_client.setdefault(client_id, []).append(task_data)
+                client_datas = {
+                    client_id: self.clients[client_id] for client_id in tasks_by_client
+                }
+                # encoded once for all of them, in the same order as frontend_state
+                self.spectators.publish(broadcast)
+
+            self.metrics.add_tasks(len(payload.get("tasks", [])))
+            # outside the server lock - each client has its own
+            for client_id, tasks in tasks_by_client.items():
+                self._deliver_tasks(
+                    client_datas[client_id],
+                    tasks,
+                    own_tasks_by_client.get(client_id, ()),
+                )
             return {"status": "success"}
         except Exception as e:
             print(f"Error processing post task: {str(e)}")
@@ -372,6 +654,8 @@ class TCPServer:
         print("Initiating server shutdown...")
 
         self.running = False
+        with self.lock:
+            self.clients_changed.notify_all()
 
         try:
             if self.accept_thread and self.accept_thread.is_alive():
@@ -397,13 +681,21 @@ class TCPServer:
 
             with self.lock:
                 for client_data in self.clients.values():
-                    try:
-                        client_data.socket.close()
-                    except:
-                        pass
+                    for client_socket in (client_data.socket, client_data.push_socket):
+                        try:
+                            client_socket.close()
+                        except:
+                            pass
                 self.clients.clear()
 
+            self.spectators.stop()
             self.server_socket.close()
+            if self.unix_socket is not None:
+                self.unix_socket.close()
+                try:
+                    os.unlink(self.unix_path)
+                except OSError:
+                    pass
             print("Server shutdown complete")
         except Exception as e:
             print(f"Error during shutdown: {str(e)}")
@@ -0,0 +1,161 @@
+import threading
+import time
+import pytest
+from server.async_server import AsyncTCPServer
+from server.tcp_client import TCPClient, ClientType
+
+PORT = 8090
+
+
+@pytest.fixture
+def server():
+    rooms_opened = []
+    server = AsyncTCPServer(port=PORT, on_new_room=rooms_opened.append)
+    server.rooms_opened = rooms_opened
+    server.start()
+    yield server
+    server.stop()
+
+
+def join(room, client_type=ClientType.FRONTEND):
+    return TCPClient(client_type, port=PORT, room=room)
+
+
+def test_rooms_are_isolated(server):
+    frontend_a = join("a")
+    frontend_b = join("b")
+    backend_a = join("a", ClientType.BACKEND)
+    backend_b = join("b", ClientType.BACKEND)
+    assert [room.room_id for room in server.rooms_opened] == ["a", "b"]
+    # every room numbers its own players
+    assert frontend_a.id == frontend_b.id == "frontend_1"
+
+    backend_a.post_tasks([({"task_type": "a"}, "ALL_FRONTEND")])
+    backend_b.post_task({"task_type": "b"}, frontend_b.id)
+    assert backend_a.wait_for_acks() == backend_b.wait_for_acks() == []
+    assert frontend_a.get_all_tasks() == [{"task_type": "a"}]
+    assert frontend_b.get_all_tasks() == [{"task_type": "b"}]
+
+    frontend_b.post_user_input("from b")
+    frontend_a.post_user_input("from a")
+    assert backend_a.get_user_input()["input"] == "from a"
+    assert backend_b.get_user_input()["input"] == "from b"
+
+
+def test_get_user_input_only_blocks_its_room(server):
+    join("a")
+    join("b")
+    backend_a = join("a", ClientType.BACKEND)
+    backend_b = join("b", ClientType.BACKEND)
+    completed = False
+
+    def wait_for_input():
+        nonlocal completed
+        backend_a.get_user_input()
+        completed = True
+
+    thread = threading.Thread(target=wait_for_input, daemon=True)
+    thread.start()
+    # the other room still gets served while room a waits
+    backend_b.post_task({"task_type": "b"}, "ALL_FRONTEND")
+    thread.join(timeout=0.5)
+    assert not completed
+
+
+def test_late_joiner_gets_room_history_pushed(server):
+    join("a")
+    backend = join("a", ClientType.BACKEND)
+    backend.post_task({"task_type": "before_join"}, "ALL_FRONTEND")
+    frontend_2 = join("a")
+    frontend_2.subscribe()
+    backend.post_task({"task_type": "after_join"}, frontend_2.id)
+
+    pushed = []
+    deadline = time.time() + 2
+    while len(pushed) < 2 and time.time() < deadline:
+        pushed += frontend_2.get_pushed_tasks()
+        time.sleep(0.01)
+    assert [task["task_type"] for task in pushed] == ["before_join", "after_join"]
+
+
+def test_closing_a_room_drops_its_clients(server):
+    join("a")
+    backend = join("a", ClientType.BACKEND)
+    with pytest.raises(ConnectionError):
+        join("missing", ClientType.BACKEND)
+
+    server.close_room("a")
+    # the backend's blocked input request ends instead of hanging forever
+    assert backend.get_user_input() is None
+    assert "a" not in server.rooms
+
+
+def test_wait_for_frontends(server):
+    frontends = [join("a")]
+    room = server.rooms["a"]
+    assert room.wait_for_frontends(1, timeout=0)
+    assert not room.wait_for_frontends(2, timeout=0.1)
+
+    threading.Timer(0.2, lambda: frontends.append(join("a"))).start()
+    assert room.wait_for_frontends(2, timeout=5)
+
+    threading.Timer(0.2, server.close_room, args=("a",)).start()
+    assert not room.wait_for_frontends(3)
+
+
+def test_rejected_posts_come_back_as_errors(server):
+    frontend = join("a")
+    backend = join("a", ClientType.BACKEND)
+    backend.post_task({"task_type": "a"}, "frontend_3")
+    backend.post_task({"task_type": "b"}, frontend.id)
+    assert backend.wait_for_acks() == [
+        (backend.next_request_id - 1, "unknown client id: frontend_3")
+    ]
+    assert frontend.get_all_tasks() == [{"task_type": "b"}]
+
+
+def test_a_bad_target_rejects_the_whole_batch(server):
+    frontend = join("a")
+    backend = join("a", ClientType.BACKEND)
+    backend.post_tasks(
+        [({"task_type": "a"}, "ALL_FRONTEND"), ({"task_type": "b"}, "frontend_3")]
+    )
+    assert backend.wait_for_acks() == [
+        (backend.next_request_id, "unknown client id: frontend_3")
+    ]
+    assert frontend.get_all_tasks() == []
+    # and someone joining now doesn't see it either
+    assert join("a").get_all_tasks() == []
+
+
+def test_rooms_per_ip_are_capped(server):
+    join("a")
+    join("b")
+    with pytest.raises(ConnectionError):
+        join("c")
+    # joining a room that's already open is fine
+    join("a")
+    server.close_room("b")
+    time.sleep(0.1)
+    join("c")
+
+
+def test_spectators_get_the_rooms_broadcasts(server):
+    with pytest.raises(ConnectionError):
+        join("a", ClientType.SPECTATOR)
+    frontend = join("a")
+    backend = join("a", ClientType.BACKEND)
+    backend.post_task({"task_type": "before_join"}, "ALL_FRONTEND")
+    assert backend.wait_for_acks() == []
+    spectators = [join("a", ClientType.SPECTATOR) for _ in range(3)]
+    backend.post_task({"task_type": "private"}, frontend.id)
+    backend.post_task({"task_type": "after_join"}, "ALL_FRONTEND")
+
+    for spectator in spectators:
+        pushed = []
+        deadline = time.time() + 2
+        while len(pushed) < 2 and time.time() < deadline:
+            pushed += spectator.get_pushed_tasks()
+            time.sleep(0.01)
+        assert [task["task_type"] for task in pushed] == ["before_join", "after_join"]
+    assert server.rooms["a"].count_frontends() == 1
@@ -0,0 +1,87 @@
+import threading
+import time
+from server.async_server import AsyncTCPServer
+from server.backend_transport import InProcessTransport, RoomTransport
+from server.tcp_server import TCPServer
+from server.tcp_client import TCPClient, ClientType
+
+PORT = 8091
+
+
+def wait_for_tasks(frontend, num_tasks):
+    tasks = []
+    deadline = time.time() + 2
+    while len(tasks) < num_tasks and time.time() < deadline:
+        tasks += frontend.get_all_tasks()
+        time.sleep(0.01)
+    return tasks
+
+
+def test_in_process_transport():
+    server = TCPServer(port=PORT)
+    server.start()
+    frontend = TCPClient(ClientType.FRONTEND, port=PORT)
+    backend = InProcessTransport(server)
+    try:
+        backend.post_task({"task_type": "one"}, "ALL_FRONTEND")
+        backend.post_tasks([({"task_type": "two"}, frontend.id)])
+        assert frontend.get_all_tasks() == [{"task_type": "one"}, {"task_type": "two"}]
+
+        frontend.post_user_input("hi")
+        assert backend.get_user_input() == {
+            "source_client_id": frontend.id,
+            "input": "hi",
+        }
+        # timed like the same commands over tcp
+        commands = server.get_stats()["commands"]
+        assert commands["post_task"]["count"] == 1
+        assert commands["post_tasks"]["count"] == 1
+        assert commands["get_user_input"]["count"] == 1
+    finally:
+        server.stop()
+    # nothing left to wait on once the server's down
+    assert backend.get_user_input() is None
+
+
+def test_unix_socket_backend(tmp_path):
+    unix_path = str(tmp_path / "game.sock")
+    server = TCPServer(port=PORT + 1, unix_path=unix_path)
+    server.start()
+    try:
+        frontend = TCPClient(ClientType.FRONTEND, port=PORT + 1)
+        backend = TCPClient(ClientType.BACKEND, unix_path=unix_path)
+        backend.post_task({"task_type": "one"}, frontend.id)
+        backend.wait_for_acks()
+        assert frontend.get_all_tasks() == [{"task_type": "one"}]
+    finally:
+        server.stop()
+
+
+def test_room_transport():
+    rooms = []
+    server = AsyncTCPServer(port=PORT + 2, on_new_room=rooms.append)
+    server.start()
+    try:
+        frontend = TCPClient(ClientType.FRONTEND, port=PORT + 2, room="a")
+        backend = RoomTransport(server, rooms[0])
+        backend.post_tasks([({"task_type": "one"}, "ALL_FRONTEND")])
+        backend.post_task({"task_type": "two"}, frontend.id)
+        assert wait_for_tasks(frontend, 2) == [
+            {"task_type": "one"},
+            {"task_type": "two"},
+        ]
+
+        frontend.post_user_input("hi")
+        assert backend.get_user_input()["input"] == "hi"
+
+        # closing the room wakes up a backend waiting on input
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(backend.get_user_input()), daemon=True
+        )
+        thread.start()
+        server.close_room("a")
+        thread.join(timeout=2)
+        assert result == [None]
+    finally:
+        server.stop()
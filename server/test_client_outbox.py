@@ -0,0 +1,112 @@
+import socket
+import time
+from server.backend_transport import InProcessTransport
+from server.client_outbox import MAX_OUTBOX_TASKS, ClientOutbox
+from server.server_utils import receive_message, send_message
+from server.task_codec import TaskCodec
+from server.tcp_client import TCPClient, ClientType
+from server.tcp_server import TCPServer
+from pyxel_ui.models import tasks
+
+PORT = 8094
+codec = TaskCodec()
+
+
+def encode_all(*tasks_to_encode):
+    return [codec.encode_task(task) for task in tasks_to_encode]
+
+
+def test_coalesces_superseded_tasks_once_behind():
+    outbox = ClientOutbox(coalesce_after=4)
+    round_info = [tasks.LoadRoundTurnInfoTask(i, "wizard") for i in range(3)]
+    move = tasks.ActionTask(1, (0, 0), (0, 1), 700)
+    queued = encode_all(
+        round_info[0],
+        tasks.LoadLogTask(["a"]),
+        move,
+        tasks.AppendLogTask(1, ["b"]),
+        round_info[1],
+        tasks.LoadLogTask(["a", "b", "c"]),
+        round_info[2],
+    )
+    assert outbox.extend(queued)
+    # nothing jumps the animation, everything after it collapses to the latest
+    assert outbox.drain() == queued[:3] + queued[5:]
+
+
+def test_falling_too_far_behind_drops_the_backlog():
+    outbox = ClientOutbox(max_tasks=3, coalesce_after=2)
+    assert outbox.extend([{"task_type": "a"}] * 3)
+    assert not outbox.extend([{"task_type": "b"}])
+    assert len(outbox) == 0
+
+
+def test_resync_keeps_tasks_only_for_that_client():
+    outbox = ClientOutbox(max_tasks=3, coalesce_after=2)
+    prompt = codec.encode_task(tasks.InputTask("pick a card"))
+    assert outbox.extend([prompt], own_tasks=[prompt])
+    assert not outbox.extend([{"task_type": "b"}] * 3)
+    snapshot = [{"task_type": "snapshot"}]
+    outbox.reset(snapshot)
+    # the backend's still waiting on an answer to it
+    assert outbox.drain() == snapshot + [prompt]
+
+
+def test_requeued_tasks_go_first():
+    outbox = ClientOutbox([1, 2, 3, 4])
+    sent = outbox.drain(limit=2)
+    outbox.extend([5])
+    outbox.requeue(sent)
+    assert outbox.drain() == [1, 2, 3, 4, 5]
+
+
+def test_stalled_subscriber_does_not_block_others():
+    server = TCPServer(port=PORT)
+    server.start()
+    try:
+        stalled = TCPClient(ClientType.FRONTEND, port=PORT)
+        frontend = TCPClient(ClientType.FRONTEND, port=PORT)
+        backend = InProcessTransport(server)
+
+        # subscribes for stalled, then never reads what's pushed
+        push_socket = socket.create_connection(("localhost", PORT))
+        send_message(
+            push_socket,
+            {
+                "client_type": ClientType.FRONTEND.value,
+                "subscribe": stalled.id,
+                "token": stalled.subscribe_token,
+            },
+        )
+        assert receive_message(push_socket) == {"status": "subscribed"}
+
+        # far more than fits in the socket buffers
+        big_task = {"task_type": "big", "data": "x" * 16 * 1024}
+        start = time.time()
+        for _ in range(15):
+            backend.post_tasks([(big_task, "ALL_FRONTEND")] * 100)
+        assert time.time() - start < 5
+        assert frontend.get_task() == big_task
+
+        frontend.post_user_input("still here")
+        assert backend.get_user_input()["input"] == "still here"
+        push_socket.close()
+    finally:
+        server.stop()
+
+
+def test_prompt_survives_an_overflowing_outbox():
+    server = TCPServer(port=8095)
+    server.start()
+    try:
+        frontend = TCPClient(ClientType.FRONTEND, port=8095)
+        backend = InProcessTransport(server)
+        prompt = codec.encode_task(tasks.InputTask("your move"))
+        backend.post_task(prompt, frontend.id)
+        # they're not reading, so this overflows their outbox
+        flood = [({"task_type": "flood"}, "ALL_FRONTEND")] * 100
+        for _ in range(MAX_OUTBOX_TASKS // 100 + 1):
+            backend.post_tasks(flood)
+        assert prompt in frontend.get_all_tasks()
+    finally:
+        server.stop()
@@ -0,0 +1,89 @@
+from server.frontend_state import FrontendState
+from server.task_codec import TaskCodec
+from pyxel_ui.models import tasks
+
+codec = TaskCodec()
+
+
+def add_all(state, *tasks_to_add):
+    for task in tasks_to_add:
+        state.add(codec.encode_task(task))
+
+
+def decoded_snapshot(state):
+    return [codec.decode_task(task_data) for task_data in state.snapshot()]
+
+
+def test_snapshot_folds_game_state():
+    state = FrontendState()
+    board_init = tasks.BoardInitTask(2, 2, [(0, 0), (0, 1), (1, 0), (1, 1)])
+    skeleton = {"id": 1, "position": (0, 0), "name": "skeleton", "priority": 20}
+    wizard = {"id": 2, "position": (1, 1), "name": "wizard", "priority": 20}
+    characters = tasks.LoadCharactersTask([1], [5], ["wizard"], [False])
+    add_all(
+        state,
+        tasks.LoadPlotScreen("once upon a time"),
+        tasks.InputTask("Hit enter to continue."),
+        board_init,
+        tasks.AddEntitiesTask([skeleton, wizard]),
+        tasks.LoadCharactersTask([1, 5], [5, 5], ["skeleton", "wizard"], [True, False]),
+        tasks.AppendLogTask(0, ["skeleton moves"]),
+        tasks.ActionTask(1, (0, 0), (0, 1), 700),
+        tasks.AppendLogTask(1, ["skeleton attacks"]),
+        tasks.RemoveEntityTask(1, show_death_animation=True),
+        characters,
+        tasks.LoadLogTask([]),
+        tasks.AppendLogTask(0, ["wizard's turn"]),
+        tasks.InputTask("End of turn. Hit enter to continue"),
+    )
+
+    assert decoded_snapshot(state) == [
+        board_init,
+        tasks.AddEntitiesTask([wizard]),
+        characters,
+        tasks.LoadLogTask(["wizard's turn"]),
+        tasks.InputTask("End of turn. Hit enter to continue"),
+    ]
+
+
+def test_entities_follow_their_moves():
+    state = FrontendState()
+    skeleton = {"id": 1, "position": (0, 0), "name": "skeleton", "priority": 20}
+    add_all(
+        state,
+        tasks.BoardInitTask(1, 3, [(0, 0), (1, 0), (2, 0)]),
+        tasks.AddEntitiesTask([skeleton]),
+        tasks.ActionTask(1, (0, 0), (1, 0), 700),
+        tasks.ActionTask(1, (1, 0), (2, 0), 700),
+    )
+    entities = decoded_snapshot(state)[1].entities
+    assert entities == [{**skeleton, "position": (2, 0)}]
+
+
+def test_tail_is_bounded():
+    state = FrontendState(max_tail_tasks=3)
+    add_all(state, *[tasks.AddToPersonalLog(str(i), False) for i in range(10)])
+    assert [task.string_to_add for task in decoded_snapshot(state)] == ["7", "8", "9"]
+
+
+def test_log_keeps_only_its_end():
+    state = FrontendState(max_log_lines=3)
+    add_all(
+        state,
+        tasks.LoadLogTask(["a", "b"]),
+        *[tasks.AppendLogTask(i, [str(i)]) for i in range(2, 10)],
+    )
+    assert decoded_snapshot(state) == [tasks.LoadLogTask(["7", "8", "9"], 7)]
+
+    # lines go where they say, not where they'd be in what we kept
+    add_all(state, tasks.AppendLogTask(8, ["x"]))
+    assert decoded_snapshot(state) == [tasks.LoadLogTask(["7", "x"], 7)]
+    # and lines we can't place are left for the next LoadLogTask
+    add_all(state, tasks.AppendLogTask(20, ["y"]))
+    assert decoded_snapshot(state) == [tasks.LoadLogTask(["7", "x"], 7)]
+
+
+def test_unknown_tasks_pass_through():
+    state = FrontendState()
+    state.add({"task_type": "test_task"})
+    assert state.snapshot() == [{"task_type": "test_task"}]
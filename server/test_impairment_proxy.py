@@ -0,0 +1,49 @@
+import socket
+import threading
+import time
+from server.impairment_proxy import Impairment, ImpairmentProxy
+from server.latency_scenarios import run_scenario
+
+
+def test_proxy_passes_data_through_late():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("localhost", 8098))
+    listener.listen(1)
+
+    def echo():
+        conn, _ = listener.accept()
+        with conn:
+            while data := conn.recv(4096):
+                conn.sendall(data)
+
+    threading.Thread(target=echo, daemon=True).start()
+    proxy = ImpairmentProxy(8099, 8098, Impairment(rtt_ms=100, jitter_ms=10, seed=1))
+    proxy.start()
+    try:
+        with socket.create_connection(("localhost", 8099)) as sock:
+            payload = bytes(range(256)) * 64
+            start = time.perf_counter()
+            sock.sendall(payload)
+            received = b""
+            while len(received) < len(payload):
+                received += sock.recv(65536)
+            elapsed = time.perf_counter() - start
+        assert received == payload
+        # there and back again is one rtt, less the jitter at worst
+        assert elapsed >= 0.08
+    finally:
+        proxy.stop()
+        listener.close()
+
+
+def test_scenario_sees_the_rtt():
+    result = run_scenario(
+        Impairment(rtt_ms=80), turns=3, server_port=8098, proxy_port=8099
+    )
+    assert len(result.action_to_pixels) == 3
+    # the action only goes one way, server to player
+    assert min(result.action_to_pixels) >= 0.04
+    summary = result.summary()
+    # answering goes to the server and the next action comes back
+    assert summary["input_to_pixels_p50"] >= 80
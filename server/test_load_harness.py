@@ -0,0 +1,13 @@
+from server.load_harness import LoadTestConfig, run_load_test
+
+
+def test_load_test_plays_every_turn():
+    config = LoadTestConfig(games=2, frontends_per_game=2, turns=6, base_port=8096)
+    report = run_load_test(config)
+    assert report.errors == []
+    assert [game["port"] for game in report.games] == [8096, 8097]
+    # every prompt got answered
+    assert report.inputs_sent == 12
+    assert report.latency["input_round_trip"].count == 12
+    assert report.games[0]["server_stats"]["commands"]["post_user_input"]["count"] == 6
+    assert "input_round_trip" in report.to_text()
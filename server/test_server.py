@@ -1,8 +1,11 @@
+import socket
 import threading
 import time
 from server.tcp_server import TCPServer
 from server.tcp_client import TCPClient, ClientType
 from server.task_jsonifier import TaskJsonifier
+from server.server_metrics import fetch_stats
+from server.server_utils import receive_message, send_message
 from pyxel_ui.models import tasks
 
 
@@ -14,6 +17,7 @@ def test_task():
     task_list = [{"task_type":"test_task"}, {"task_type":"test_task_2"}]
     for task in task_list:
         backend.post_task(task, frontend.id)
+    assert backend.wait_for_acks() == []
     actual = frontend.get_task()
     assert actual == task_list[0]
     server.stop()
@@ -97,6 +101,7 @@ def test_task_with_real_task():
     tj = TaskJsonifier()
     jsonified_task = tj.convert_task_to_json(task)
     backend.post_task(jsonified_task, frontend.id)
+    backend.wait_for_acks()
     actual = frontend.get_task()
     assert actual == jsonified_task
     server.stop()
@@ -113,6 +118,7 @@ def test_multi_client():
     tj = TaskJsonifier()
     jsonified_task = tj.convert_task_to_json(task)
     backend.post_task(jsonified_task, frontend.id)
+    backend.wait_for_acks()
     frontend2_task = frontend2.get_task()
     frontend_task = frontend.get_task()
 
@@ -120,3 +126,128 @@ def test_multi_client():
     assert frontend_task == jsonified_task
 
 
+def test_post_tasks():
+    # a batch goes out in order and is split by target
+    server = TCPServer(port=8081)
+    server.start()
+    backend = TCPClient(ClientType.BACKEND, port=8081)
+    frontend = TCPClient(ClientType.FRONTEND, port=8081)
+    frontend2 = TCPClient(ClientType.FRONTEND, port=8081)
+    task_list = [{"task_type":"test_task"}, {"task_type":"test_task_2"}]
+    backend.post_tasks(
+        [(task_list[0], "ALL_FRONTEND"), (task_list[1], frontend.id)]
+    )
+    backend.wait_for_acks()
+    assert frontend.get_all_tasks() == task_list
+    assert frontend2.get_all_tasks() == task_list[:1]
+    server.stop()
+
+
+def test_subscribe_pushes_tasks():
+    server = TCPServer(port=8083)
+    server.start()
+    backend = TCPClient(ClientType.BACKEND, port=8083)
+    backend.post_task({"task_type":"before_join"}, "ALL_FRONTEND")
+    backend.wait_for_acks()
+    frontend = TCPClient(ClientType.FRONTEND, port=8083)
+    frontend.subscribe()
+    backend.post_tasks(
+        [({"task_type":"test_task"}, "ALL_FRONTEND"), ({"task_type":"test_task_2"}, frontend.id)]
+    )
+    pushed = []
+    deadline = time.time() + 2
+    while len(pushed) < 3 and time.time() < deadline:
+        pushed += frontend.get_pushed_tasks()
+        time.sleep(0.01)
+    assert [task["task_type"] for task in pushed] == [
+        "before_join", "test_task", "test_task_2"
+    ]
+    # nothing is left over for polling
+    assert frontend.get_all_tasks() == []
+    server.stop()
+
+
+def test_subscribe_needs_the_clients_token():
+    server = TCPServer(port=8084)
+    server.start()
+    frontend = TCPClient(ClientType.FRONTEND, port=8084)
+    for token in (None, "0" * 32):
+        push_socket = socket.create_connection(("localhost", 8084))
+        send_message(
+            push_socket,
+            {
+                "client_type": ClientType.FRONTEND.value,
+                "subscribe": frontend.id,
+                "token": token,
+            },
+        )
+        assert "error" in receive_message(push_socket)
+        push_socket.close()
+    # still theirs to poll or subscribe to
+    frontend.subscribe()
+    assert frontend.is_subscribed
+    server.stop()
+
+
+def test_wait_for_frontends():
+    server = TCPServer(port=8085)
+    server.start()
+    assert not server.wait_for_frontends(1, timeout=0.1)
+
+    frontends = []
+
+    def join_later():
+        time.sleep(0.2)
+        frontends.append(TCPClient(ClientType.FRONTEND, port=8085))
+
+    threading.Thread(target=join_later, daemon=True).start()
+    assert server.wait_for_frontends(1, timeout=5)
+
+    # stopping wakes up anyone still waiting
+    waiting = threading.Thread(target=server.wait_for_frontends, args=(3,), daemon=True)
+    waiting.start()
+    server.stop()
+    waiting.join(timeout=2)
+    assert not waiting.is_alive()
+
+
+def test_posts_are_pipelined():
+    server = TCPServer(port=8086)
+    server.start()
+    backend = TCPClient(ClientType.BACKEND, port=8086)
+    frontend = TCPClient(ClientType.FRONTEND, port=8086)
+    for i in range(200):
+        backend.post_task({"task_type": "test_task", "n": i}, frontend.id)
+    # only so many posts wait on their acks at once
+    assert len(backend.unacked_posts) <= 64
+    assert backend.wait_for_acks() == []
+    assert not backend.unacked_posts
+    assert [task["n"] for task in frontend.get_all_tasks()] == list(range(200))
+    server.stop()
+
+
+def test_stats():
+    server = TCPServer(port=8087)
+    server.start()
+    backend = TCPClient(ClientType.BACKEND, port=8087)
+    frontend = TCPClient(ClientType.FRONTEND, port=8087)
+    backend.post_task({"task_type":"test_task"}, frontend.id)
+    backend.wait_for_acks()
+
+    stats = fetch_stats(8087)
+    # the reply's bytes are counted just after it's sent
+    deadline = time.time() + 2
+    while not stats["bytes_sent"] and time.time() < deadline:
+        time.sleep(0.01)
+        stats = fetch_stats(8087)
+    assert stats["commands"]["post_task"]["count"] == 1
+    assert stats["clients"][frontend.id]["queue_depth"] == 1
+    assert stats["bytes_received"] > 0 and stats["bytes_sent"] > 0
+    assert stats["lock_wait"]["count"] >= 1
+    assert stats["tasks_posted"] == 1
+    assert sum(stats["commands"]["post_task"]["counts"]) == 1
+
+    text = fetch_stats(8087, stats_format="prometheus")
+    assert 'drudgeford_command_seconds_count{command="post_task"} 1' in text
+    assert f'drudgeford_client_queue_depth{{client="{frontend.id}"}} 1' in text
+    server.stop()
@@ -0,0 +1,56 @@
+import socket
+import threading
+from server.server_utils import (
+    FramedConnection,
+    encode_message,
+    receive_message,
+    send_message,
+)
+
+
+def test_reads_pipelined_messages_from_one_recv():
+    ours, theirs = socket.socketpair()
+    connection = FramedConnection(ours)
+    messages = [{"command": "get_task", "n": i} for i in range(5)]
+    theirs.sendall(b"".join(encode_message(message) for message in messages))
+
+    assert connection.receive_message() == messages[0]
+    # the rest came in with the first read
+    assert connection.has_buffered_message()
+    assert [connection.receive_message() for _ in range(4)] == messages[1:]
+    assert not connection.has_buffered_message()
+
+
+def test_reads_messages_split_across_recvs():
+    ours, theirs = socket.socketpair()
+    connection = FramedConnection(ours, buffer_size=16)
+    message = {"tasks": [b"\x01\x00\x02", b"", b"x" * 5000], "text": "y" * 100}
+    data = encode_message(message) * 2
+
+    def send_in_pieces():
+        for i in range(0, len(data), 7):
+            theirs.sendall(data[i : i + 7])
+
+    threading.Thread(target=send_in_pieces, daemon=True).start()
+    assert connection.receive_message() == message
+    assert connection.receive_message() == message
+
+
+def test_send_message_round_trips_frames():
+    ours, theirs = socket.socketpair()
+    message = {"tasks": [b"abc", {"nested": b"\x00"}], "status": "success"}
+    FramedConnection(ours).send_message(message)
+    send_message(ours, message)
+    assert receive_message(theirs) == message
+    assert FramedConnection(theirs).receive_message() == message
+
+
+def test_closed_connection_raises():
+    ours, theirs = socket.socketpair()
+    theirs.sendall(encode_message({"a": 1})[:6])
+    theirs.close()
+    try:
+        FramedConnection(ours).receive_message()
+    except ConnectionError:
+        return
+    assert False, "expected a ConnectionError"
@@ -0,0 +1,89 @@
+import socket
+import threading
+import time
+import pytest
+from server.frontend_state import FrontendState
+from server.server_utils import FramedConnection, receive_message
+from server.spectator_stream import SpectatorStream
+from server.task_codec import TaskCodec
+from server.tcp_client import TCPClient, ClientType
+from server.tcp_server import TCPServer
+from pyxel_ui.models import tasks
+
+PORT = 8088
+codec = TaskCodec()
+
+
+def wait_for_pushed(client, count, timeout=2):
+    pushed = []
+    deadline = time.time() + timeout
+    while len(pushed) < count and time.time() < deadline:
+        pushed += client.get_pushed_tasks()
+        time.sleep(0.01)
+    return pushed
+
+
+def test_spectators_watch_the_game():
+    server = TCPServer(port=PORT)
+    server.start()
+    try:
+        frontend = TCPClient(ClientType.FRONTEND, port=PORT)
+        backend = TCPClient(ClientType.BACKEND, port=PORT)
+        backend.post_task({"task_type": "before_join"}, "ALL_FRONTEND")
+        assert backend.wait_for_acks() == []
+        spectators = [TCPClient(ClientType.SPECTATOR, port=PORT) for _ in range(5)]
+        assert spectators[0].id == "spectator_1"
+        # watching doesn't take up a seat
+        assert server.count_frontends() == 1
+
+        backend.post_tasks(
+            [
+                ({"task_type": "private"}, frontend.id),
+                ({"task_type": "after_join"}, "ALL_FRONTEND"),
+            ]
+        )
+        assert backend.wait_for_acks() == []
+        for spectator in spectators:
+            pushed = wait_for_pushed(spectator, 2)
+            assert [task["task_type"] for task in pushed] == [
+                "before_join",
+                "after_join",
+            ]
+        # the one post went in the log once for all of them
+        assert len(server.spectators.frames) == 1
+        with pytest.raises(PermissionError):
+            spectators[0].get_all_tasks()
+        assert server.get_stats()["spectators"]["count"] == 5
+
+        spectators.pop().close()
+        deadline = time.time() + 2
+        while len(server.spectators) > 4 and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(server.spectators) == 4
+    finally:
+        server.stop()
+
+
+def test_spectator_behind_the_log_starts_over():
+    state = FrontendState()
+    lock = threading.Lock()
+    stream = SpectatorStream(state, lock, max_log_frames=2)
+    ours, theirs = socket.socketpair()
+    stream.add(ours)
+    assert receive_message(theirs) == {"client_id": "spectator_1"}
+
+    # the writer isn't running yet, so they fall out of the log
+    for turn in range(5):
+        task = codec.encode_task(tasks.LoadRoundTurnInfoTask(turn, "wizard"))
+        with lock:
+            state.add(task)
+            stream.publish([task])
+    assert stream.first_frame == 3
+    stream.start()
+    try:
+        connection = FramedConnection(theirs)
+        received = connection.receive_message()["tasks"]
+        # a fresh snapshot instead of the frames they missed
+        assert [codec.decode_task(task).round_number for task in received] == [4]
+    finally:
+        stream.stop()
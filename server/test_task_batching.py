@@ -0,0 +1,77 @@
+from backend.models.pyxel_backend import PyxelManager
+from server.tcp_server import TCPServer
+from server.tcp_client import TCPClient, ClientType
+from server.task_codec import TaskCodec
+from pyxel_ui.constants import LOG_TAIL_LINES
+from pyxel_ui.models import tasks
+
+PORT = 8082
+
+
+def get_frontend_tasks(frontend):
+    codec = TaskCodec()
+    return [codec.decode_task(task) for task in frontend.get_all_tasks()]
+
+
+def test_batch_coalesces_superseded_tasks():
+    server = TCPServer(port=PORT)
+    server.start()
+    pyxel_manager = PyxelManager(PORT)
+    frontend = TCPClient(ClientType.FRONTEND, port=PORT)
+    try:
+        with pyxel_manager.batch():
+            pyxel_manager.jsonify_and_send_task(
+                tasks.LoadCharactersTask([1], [5], ["a"], [True])
+            )
+            pyxel_manager.log.append("hi")
+            pyxel_manager.log.append("there")
+            pyxel_manager.jsonify_and_send_task(
+                tasks.LoadCharactersTask([2], [5], ["a"], [True])
+            )
+            pyxel_manager.jsonify_and_send_task(
+                tasks.ActionTask(1, (0, 0), (0, 1), 700)
+            )
+            pyxel_manager.jsonify_and_send_task(
+                tasks.LoadCharactersTask([3], [5], ["a"], [True])
+            )
+            # nothing goes out until the batch ends
+            assert frontend.get_all_tasks() == []
+
+        pyxel_manager.server_client.wait_for_acks()
+        actual = get_frontend_tasks(frontend)
+        assert [type(task) for task in actual] == [
+            tasks.AppendLogTask,
+            tasks.LoadCharactersTask,
+            tasks.ActionTask,
+            tasks.LoadCharactersTask,
+        ]
+        assert actual[0].start_index == 0
+        assert actual[0].lines == ["hi", "there"]
+        assert actual[1].healths == [2]
+        assert actual[3].healths == [3]
+    finally:
+        server.stop()
+
+
+def test_long_logs_only_send_new_lines():
+    server = TCPServer(port=PORT)
+    server.start()
+    pyxel_manager = PyxelManager(PORT)
+    frontend = TCPClient(ClientType.FRONTEND, port=PORT)
+    try:
+        for i in range(3 * LOG_TAIL_LINES):
+            pyxel_manager.log.append(str(i))
+        pyxel_manager.log.remove("0")
+        pyxel_manager.server_client.wait_for_acks()
+
+        sent = get_frontend_tasks(frontend)
+        assert all(isinstance(task, tasks.AppendLogTask) for task in sent[:-1])
+        assert sum(len(task.lines) for task in sent[:-1]) == 3 * LOG_TAIL_LINES
+        # something other than an append sends only the end of the log
+        assert sent[-1] == tasks.LoadLogTask(
+            [str(i) for i in range(2 * LOG_TAIL_LINES, 3 * LOG_TAIL_LINES)],
+            # "0"'s gone, so everything's a line earlier
+            2 * LOG_TAIL_LINES - 1,
+        )
+    finally:
+        server.stop()
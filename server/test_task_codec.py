@@ -0,0 +1,106 @@
+import pytest
+from collections import deque
+from server.task_codec import TaskCodec, TASK_TYPES_V1
+from server.server_utils import decode_message, send_message
+from pyxel_ui.models import tasks
+from pyxel_ui.enums import RotationDirection
+
+
+test_entities = [
+    {"id": 1, "position": (0, 0), "name": "skeleton", "priority": 10},
+    {"id": 3, "position": (4, 2), "name": "necromancer", "priority": 10},
+]
+
+board_init_dict = {
+    "map_height": 2,
+    "map_width": 3,
+    "valid_map_coordinates": [(1, 2), (5, 2)],
+    "wall_color_map": [(4, 2)],
+    "floor_color_map": None,
+}
+
+
+@pytest.mark.parametrize(
+    ["data", "task_class"],
+    [
+        pytest.param(
+            {"log": ["hel\nlo", "sup 🐣"], "start_index": 12},
+            tasks.LoadLogTask,
+            id="log",
+        ),
+        pytest.param({"entities": test_entities}, tasks.AddEntitiesTask, id="entities"),
+        pytest.param(
+            {
+                "entity_id": 1,
+                "show_death_animation": True,
+                "action_steps": deque([(0, 1.0), (90, 0.5)]),
+                "rotation_direction": RotationDirection.COUNTER_CLOCK_WISE,
+                "rotation_duration_ms": 500,
+                "rotation_final_scale": 0.0,
+                "rotation_count": 1.0,
+            },
+            tasks.RemoveEntityTask,
+            id="remove_entity",
+        ),
+        pytest.param(board_init_dict, tasks.BoardInitTask, id="board_init"),
+        pytest.param(
+            {
+                "prompt": "pick a spot",
+                "reachable_positions": [(1, 2), (-1, 3)],
+                "reachable_paths": {(1, 2): [(0, 0), (1, 2)]},
+                "single_keystroke": False,
+            },
+            tasks.InputTask,
+            id="input",
+        ),
+        pytest.param(
+            {"campaign_state": {"player_ids": [1, 2], "all_ai_mode": False}},
+            tasks.SaveCampaign,
+            id="save_campaign",
+        ),
+        pytest.param({}, tasks.ResetViewManager, id="no_fields"),
+    ],
+)
+def test_codec_round_trip(data, task_class):
+    codec = TaskCodec()
+    decoded_task = codec.decode_task(codec.encode_task(task_class(**data)))
+    assert isinstance(decoded_task, task_class)
+    assert decoded_task.__dict__ == data
+
+
+def test_every_task_is_registered():
+    task_classes = {
+        cls
+        for cls in vars(tasks).values()
+        if isinstance(cls, type)
+        and cls.__module__ == tasks.__name__
+        and cls is not tasks.Task
+    }
+    assert task_classes == set(TASK_TYPES_V1)
+
+
+def test_bad_frames_are_rejected():
+    codec = TaskCodec()
+    encoded = codec.encode_task(tasks.LoadLogTask(["hi"]))
+    with pytest.raises(ValueError):
+        codec.decode_task(b"\x09" + encoded[1:])
+    with pytest.raises(ValueError):
+        codec.decode_task(encoded + b"\x00")
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = b""
+
+    def sendall(self, data):
+        self.sent += data
+
+
+def test_bytes_go_out_as_raw_frames():
+    encoded = TaskCodec().encode_task(tasks.LoadLogTask(["hi"]))
+    sock = FakeSocket()
+    send_message(sock, {"tasks": [encoded, encoded], "status": "success"})
+    # the frames go out as is, not base64 or escaped inside the json
+    assert sock.sent.count(encoded) == 2
+    message = decode_message(sock.sent[4:])
+    assert message == {"tasks": [encoded, encoded], "status": "success"}
@@ -100,7 +100,12 @@ for i, action_card in enumerate(action_cards):
             {"action_card_log": action_card_log},
             tasks.LoadActionCardsTask,
             id="actioncards",
-        )
+        ),
+        pytest.param(
+            {"start_index": 3, "lines": ["hel\nlo", "sup"]},
+            tasks.AppendLogTask,
+            id="append_log",
+        ),
     ],
 )
 def test_jsonifier(data, task_class):
@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server.latency_scenarios import DEFAULT_RTTS_MS, run_scenarios, to_text
+
+"""
+Plays a game through an ImpairmentProxy at each RTT and prints how long
+backend actions take to reach the screen. Try a change to the server or the
+frontend's polling with this before shipping it to players far away
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rtt", type=float, nargs="+", default=list(DEFAULT_RTTS_MS), help="ms"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="ms")
+    parser.add_argument("--bandwidth-kbps", type=float, default=None)
+    parser.add_argument("--reorder-chance", type=float, default=0.0)
+    parser.add_argument("--reorder-delay", type=float, default=0.0, help="ms")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument(
+        "--poll", action="store_true", help="frontend polls instead of subscribing"
+    )
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    results = run_scenarios(
+        args.rtt,
+        turns=args.turns,
+        subscribe=not args.poll,
+        server_port=args.port,
+        proxy_port=args.port + 1,
+        jitter_ms=args.jitter,
+        bandwidth_kbps=args.bandwidth_kbps,
+        reorder_chance=args.reorder_chance,
+        reorder_delay_ms=args.reorder_delay,
+        seed=args.seed,
+    )
+    print(to_text(results))
+
+
+if __name__ == "__main__":
+    main()
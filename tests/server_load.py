@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server.load_harness import LoadTestConfig, run_load_test
+
+"""
+Runs synthetic games against TCPServer and prints throughput, latency per
+command and cpu per game. Run it before and after a server change to
+compare the two
+"""
+
+
+def main():
+    defaults = LoadTestConfig()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=defaults.games)
+    parser.add_argument(
+        "--frontends", type=int, default=defaults.frontends_per_game
+    )
+    parser.add_argument("--turns", type=int, default=defaults.turns)
+    parser.add_argument(
+        "--poll", action="store_true", help="bots poll instead of subscribing"
+    )
+    parser.add_argument("--poll-interval", type=float, default=defaults.poll_interval)
+    parser.add_argument("--port", type=int, default=defaults.base_port)
+    parser.add_argument(
+        "--tcp-backend",
+        action="store_true",
+        help="backend connects over tcp instead of running next to its server",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    report = run_load_test(
+        LoadTestConfig(
+            games=args.games,
+            frontends_per_game=args.frontends,
+            turns=args.turns,
+            subscribe=not args.poll,
+            poll_interval=args.poll_interval,
+            base_port=args.port,
+            in_process_backend=not args.tcp_backend,
+            seed=args.seed,
+        )
+    )
+    print(report.to_text())
+
+
+if __name__ == "__main__":
+    main()
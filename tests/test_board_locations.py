@@ -0,0 +1,109 @@
+from itertools import count
+
+from backend.models.board import Board
+from backend.models.simulation import HeadlessCampaign
+from backend.models import character, obstacle
+from backend.models.agent import Ai
+from backend.utils import attack_shapes as shapes
+
+
+def make_board():
+    campaign = HeadlessCampaign(2)
+    campaign.set_up_player_chars()
+    id_generator = count(start=100)
+    monsters = [
+        character.Skeleton(
+            "Skeleton",
+            campaign.pyxel_manager,
+            "",
+            Ai(),
+            char_id=next(id_generator),
+            is_monster=True,
+            log=campaign.pyxel_manager.log,
+        )
+    ]
+    return Board(
+        10,
+        monsters,
+        campaign.player_chars,
+        campaign.pyxel_manager,
+        id_generator,
+        [obstacle.Fire],
+    )
+
+
+def scan_for(board, target):
+    for row_num, row in enumerate(board.locations):
+        for col_num, el in enumerate(row):
+            if el is target:
+                return (row_num, col_num)
+
+
+def assert_index_matches_board(board):
+    indexed = 0
+    for row_num, row in enumerate(board.locations):
+        for col_num, el in enumerate(row):
+            if el is not None:
+                assert board.entity_locations[el] == (row_num, col_num)
+                indexed += 1
+    assert indexed == len(board.entity_locations)
+
+
+def test_index_matches_board_after_setup():
+    board = make_board()
+    assert_index_matches_board(board)
+    for char in board.characters:
+        assert board.find_location_of_target(char) == scan_for(board, char)
+
+
+def test_index_follows_moves_kills_and_summons():
+    board = make_board()
+    mover = board.characters[0]
+    old_loc = board.find_location_of_target(mover)
+    new_loc = board.pick_unoccupied_location()
+    board.update_character_location(mover, old_loc, new_loc)
+    assert board.find_location_of_target(mover) == new_loc
+    assert board.locations[old_loc[0]][old_loc[1]] is None
+
+    board.set_obstacles_in_area(new_loc, shapes.circle(1), obstacle.Rock)
+    board.add_new_ai_char(True, character.Skeleton)
+    board.kill_target(board.characters[-1])
+    assert_index_matches_board(board)
+
+
+def test_reachable_paths_are_shortest_and_prefer_cardinal_moves():
+    board = make_board()
+    start = board.find_location_of_target(board.characters[0])
+    reachable_positions, reachable_paths = board.find_all_reachable_paths(start, 4)
+    assert set(reachable_paths) == reachable_positions
+    for end_pos, path in reachable_paths.items():
+        assert path[-1] == end_pos
+        assert len(path) == len(board.get_shortest_valid_path(start, end_pos))
+    # straight lines never zigzag through diagonals
+    for d_row, d_col in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
+        straight = [(start[0] + d_row * i, start[1] + d_col * i) for i in (1, 2)]
+        if all(pos in reachable_positions for pos in straight):
+            assert reachable_paths[straight[-1]] == straight
+
+
+def test_cached_path_lengths_match_shortest_paths():
+    board = make_board()
+    start = board.find_location_of_target(board.characters[0])
+    for row in range(-1, board.size + 1):
+        for col in range(-1, board.size + 1):
+            for is_attack in (False, True):
+                expected = len(
+                    board.get_shortest_valid_path(start, (row, col), is_attack=is_attack)
+                )
+                assert board.get_path_length(start, (row, col), is_attack) == expected
+
+
+def test_distance_fields_reset_when_locations_change():
+    board = make_board()
+    mover = board.characters[0]
+    start = board.find_location_of_target(mover)
+    board.get_path_length(start, start)
+    assert board.distance_fields
+    board.update_character_location(mover, start, board.pick_unoccupied_location())
+    board.get_path_length(start, start)
+    assert list(board.distance_fields) == [(start, False)]
@@ -0,0 +1,27 @@
+from backend.models.simulation import run_headless_campaign
+from backend.models.campaign_manager import CampaignResult
+
+
+def test_headless_campaign_returns_results():
+    result = run_headless_campaign(2, seed=1)
+    assert isinstance(result, CampaignResult)
+    assert len(result.player_classes) == 2
+    assert result.level_results
+    assert all(level.rounds > 0 for level in result.level_results)
+
+
+def test_headless_campaign_is_reproducible():
+    assert run_headless_campaign(3, seed=42) == run_headless_campaign(3, seed=42)
+
+
+def test_balance_report_aggregates_results():
+    from backend.controllers.batch_simulator import BalanceReport
+
+    report = BalanceReport()
+    results = [run_headless_campaign(1, seed=seed) for seed in range(3)]
+    for result in results:
+        report.add(result)
+    assert report.num_games == 3
+    assert report.level_stats[1].attempts == 3
+    assert sum(stats.games for stats in report.class_stats.values()) == 3
+    assert "Level 1" in report.to_text()